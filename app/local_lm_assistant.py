@@ -6,29 +6,245 @@ using LLaMA model via Ollama or transformers.
 """
 
 import json
+import atexit
 import argparse
 import sqlite3
 from pathlib import Path
 from models.logging import Logger
-from models.config import Config
-from models.document_processor import DocumentProcessor
-from models.assistant import Assistant, check_ollama_connection
+from models.config import DEFAULT_COLLECTION, Config
+from models.lexical_index import RETRIEVAL_MODES
+from models.filters import SearchFilter, check_tag
+from models.tracing import tracer
+
+# Subsystems are imported inside the commands that use them: chromadb,
+# sentence-transformers and langchain take seconds to import, and commands
+# like --list-docs or --config should not pay for them
+
+
+def get_processor(config: Config, tags=()):
+    """Build the document processor for the ingestion commands"""
+    from models.document_processor import DocumentProcessor
+
+    return DocumentProcessor(config, tags)
+
+
+def wal_files(sqlite_path: Path):
+    return [sqlite_path.with_name(sqlite_path.name + suffix) for suffix in ("-wal", "-shm")]
+
+
+def list_documents(config: Config, pattern: str, page: int, page_size: int):
+    """Print one page of processed documents"""
+    from models.metadata_store import MetadataStore
+
+    total, docs = 0, []
+    if config.sqlite_path.exists():
+        store = MetadataStore(config.sqlite_path)
+        try:
+            total, docs = store.list_documents(
+                page_size, (max(page, 1) - 1) * page_size, None if pattern == "*" else pattern
+            )
+        except sqlite3.OperationalError:
+            pass
+        store.close()
+
+    if not total:
+        print("No documents processed yet." if pattern == "*" else "No matching documents.")
+    elif not docs:
+        print(f"Page {page} is past the end ({total} documents).")
+    else:
+        first = (max(page, 1) - 1) * page_size + 1
+        print(f"Processed documents {first}-{first + len(docs) - 1} of {total}:")
+        for doc in docs:
+            print(f"  {doc['filename']} ({doc['chunk_count']} chunks) - {doc['processed_date']}")
+        if first + len(docs) - 1 < total:
+            print(f"Next page: --page {max(page, 1) + 1}")
+
+
+def list_collections(config: Config):
+    """Print every collection with its document count"""
+    from models.metadata_store import MetadataStore
+
+    print("Collections:")
+    for name in config.collection_names():
+        scoped = config.for_collection(name)
+        count = 0
+        if scoped.sqlite_path.exists():
+            store = MetadataStore(scoped.sqlite_path)
+            try:
+                count = store.count_documents()
+            except sqlite3.OperationalError:
+                pass
+            store.close()
+        print(f"  {name} ({count} documents)")
+
+
+def reset_collection(config: Config):
+    """Delete a collection's indexes, metadata and cached answers"""
+    import shutil
+
+    if config.db_path.exists():
+        shutil.rmtree(config.db_path)
+    # WAL mode keeps a log and shared-memory file next to the database
+    for path in (config.sqlite_path, *wal_files(config.sqlite_path)):
+        if path.exists():
+            path.unlink()
+    if config.faiss_path.exists():
+        shutil.rmtree(config.faiss_path)
+    if config.answer_cache_path.exists():
+        config.answer_cache_path.unlink()
+    if config.collection != DEFAULT_COLLECTION and config.collection_dir.exists():
+        shutil.rmtree(config.collection_dir)
+
+
+def print_profile():
+    print("\nProfile:")
+    print(tracer.report())
+
+
+def print_answer(assistant, question: str, stream: bool, mode: str = None, filters=None):
+    """Print an answer, token by token when streaming"""
+    from models.assistant import QueryStats
+
+    stats = QueryStats()
+    if not stream:
+        print(f"Answer: {assistant.answer_question(question, mode, filters, stats)}")
+    else:
+        print("Answer: ", end="", flush=True)
+        for text in assistant.answer_question_stream(question, mode, filters, stats):
+            print(text, end="", flush=True)
+        print()
+
+    if stats.cache_hit is not None:
+        if stats.cache_hit.semantic:
+            print("[cached answer to a similar question]")
+        else:
+            print("[cached answer]")
+        return
+    if stats.rerank is not None:
+        print(f"[{stats.rerank.report()}]")
+    if stats.context is not None:
+        print(f"[{stats.context.report()}]")
+    if stats.generation is not None:
+        print(f"[{stats.generation.report()}]")
+
+
+def run_batch(config: Config, assistant, batch_path: Path, output: str = None, filters=None):
+    """Answer a JSONL file of questions, appending answers to a JSONL file"""
+    import asyncio
+    from models.assistant import AsyncAssistant, BatchRunner
+
+    output_path = Path(output) if output else batch_path.with_suffix(".answers.jsonl")
+    print(f"Writing answers to {output_path}")
+
+    async def run():
+        async with AsyncAssistant(config, assistant) as async_assistant:
+            return await BatchRunner(async_assistant, filters).run(batch_path, output_path)
+
+    stats = asyncio.run(run())
+    print(stats.report())
 
 
 def main():
     parser = argparse.ArgumentParser(description="Local LM Document Assistant")
     parser.add_argument("--add-doc", help="Add a single document to the database")
     parser.add_argument("--add-dir", help="Add all documents from a directory")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Loader processes for --add-dir (default: ingest_workers or CPU count)",
+    )
+    parser.add_argument(
+        "--sync", help="Incrementally re-index a directory, updating only changed chunks"
+    )
+    parser.add_argument(
+        "--watch", help="Watch a directory and keep it indexed as files change"
+    )
+    parser.add_argument(
+        "--collection",
+        action="append",
+        metavar="NAME",
+        help=f"Collection to add to, query or list (default: {DEFAULT_COLLECTION}); "
+        "repeat it or separate names with commas to query several at once",
+    )
+    parser.add_argument(
+        "--list-collections", action="store_true", help="List collections"
+    )
+    parser.add_argument(
+        "--tag",
+        action="append",
+        metavar="NAME",
+        help="Tag files as they are added, synced or watched; when asking, only "
+        "search files with every given tag (repeatable, or comma-separated)",
+    )
     parser.add_argument("--query", "-q", help="Ask a question")
     parser.add_argument(
         "--interactive", "-i", action="store_true", help="Start interactive mode"
     )
     parser.add_argument(
-        "--list-docs", action="store_true", help="List processed documents"
+        "--batch", help="Answer every question in a JSONL file, resuming a previous run"
+    )
+    parser.add_argument(
+        "--output", help="JSONL answers file for --batch (default: <batch>.answers.jsonl)"
+    )
+    parser.add_argument(
+        "--retrieval",
+        choices=RETRIEVAL_MODES,
+        help="How to find relevant chunks: BM25 and vectors fused, vectors only "
+        "or keywords only (default: retrieval_mode)",
+    )
+    parser.add_argument(
+        "--file",
+        action="append",
+        metavar="NAME",
+        help="Only search files with this name or glob, e.g. 'report.pdf' or "
+        "'*2024*' (repeatable)",
+    )
+    parser.add_argument("--path", help="Only search files under this path prefix")
+    parser.add_argument(
+        "--file-type",
+        action="append",
+        metavar="EXT",
+        help="Only search files of this type, e.g. pdf (repeatable, or comma-separated)",
+    )
+    parser.add_argument(
+        "--since",
+        help="Only search files first added since a date (2024-05-01) or age (7d, 12h)",
     )
+    parser.add_argument("--until", help="Only search files first added until a date or age")
+    parser.add_argument(
+        "--no-stream",
+        action="store_true",
+        help="Wait for the full answer instead of printing tokens as they arrive",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print a per-stage timing breakdown when the command finishes",
+    )
+    parser.add_argument(
+        "--list-docs",
+        nargs="?",
+        const="*",
+        metavar="PATTERN",
+        help="List processed documents, optionally those whose name matches a "
+        "glob such as '*.pdf'",
+    )
+    parser.add_argument(
+        "--page", type=int, default=1, help="Page of --list-docs to show (default: 1)"
+    )
+    parser.add_argument(
+        "--page-size", type=int, default=50, help="Documents per --list-docs page"
+    )
+    parser.add_argument(
+        "--serve", action="store_true", help="Run the local HTTP API server"
+    )
+    parser.add_argument("--host", help="Host for --serve (default: server_host)")
+    parser.add_argument("--port", type=int, help="Port for --serve (default: server_port)")
     parser.add_argument("--config", help="Show or update configuration")
     parser.add_argument(
-        "--reset", action="store_true", help="Reset database and start fresh"
+        "--reset",
+        action="store_true",
+        help="Reset database and start fresh; with --collection, only those collections",
     )
 
     args = parser.parse_args()
@@ -36,15 +252,39 @@ def main():
     # Initialize configuration
     config = Config()
     Logger(config)
+    if args.profile:
+        atexit.register(print_profile)
+
+    collections = [
+        name.strip() for value in args.collection or [] for name in value.split(",")
+    ]
+    try:
+        scoped = [config.for_collection(name) for name in dict.fromkeys(collections)]
+        tags = [
+            check_tag(tag.strip())
+            for value in args.tag or []
+            for tag in value.split(",")
+            if tag.strip()
+        ]
+    except ValueError as e:
+        print(e)
+        return
+    writes = args.add_doc or args.add_dir or args.sync or args.watch or args.serve
+    if writes and len(scoped) > 1:
+        print("Documents are added to one collection at a time; pass a single --collection.")
+        return
+    if scoped:
+        config = scoped[0]
 
     # Handle reset
     if args.reset:
-        import shutil
-
-        if config.db_path.exists():
-            shutil.rmtree(config.db_path)
-        if config.sqlite_path.exists():
-            config.sqlite_path.unlink()
+        if scoped:
+            for collection in scoped:
+                reset_collection(collection)
+            print(f"Reset collection {', '.join(c.collection for c in scoped)}.")
+            return
+        for name in config.collection_names():
+            reset_collection(config.for_collection(name))
         print("Database reset successfully.")
         return
 
@@ -54,15 +294,34 @@ def main():
         print(json.dumps(config.config, indent=2))
         return
 
-    # Initialize document processor
-    processor = DocumentProcessor(config)
+    if args.list_collections:
+        list_collections(config)
+        return
+
+    # Handle document listing
+    if args.list_docs:
+        for collection in scoped or [config]:
+            if len(scoped) > 1:
+                print(f"[{collection.collection}]")
+            list_documents(collection, args.list_docs, args.page, args.page_size)
+        return
+
+    # Handle API server; it builds the processor and assistant itself
+    if args.serve:
+        from models.server import APIServer
+
+        APIServer(config).serve(args.host, args.port)
+        return
 
     # Handle document addition
+    if writes:
+        config = config.for_collection(config.collection, create=True)
+
     if args.add_doc:
         if not Path(args.add_doc).exists():
             print(f"File not found: {args.add_doc}")
             return
-        chunks = processor.process_document(args.add_doc)
+        chunks = get_processor(config, tags).process_document(args.add_doc)
         print(f"Added {chunks} chunks to the database.")
         return
 
@@ -70,44 +329,69 @@ def main():
         if not Path(args.add_dir).exists():
             print(f"Directory not found: {args.add_dir}")
             return
-        chunks = processor.process_directory(args.add_dir)
+        processor = get_processor(config, tags)
+        chunks = processor.process_directory(args.add_dir, workers=args.workers)
         print(f"Added {chunks} total chunks to the database.")
         return
 
-    # Handle document listing
-    if args.list_docs:
-        conn = sqlite3.connect(config.sqlite_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT filename, filepath, processed_date, chunk_count FROM documents"
-        )
-        docs = cursor.fetchall()
-        conn.close()
+    if args.sync:
+        if not Path(args.sync).is_dir():
+            print(f"Directory not found: {args.sync}")
+            return
+        get_processor(config, tags).sync_directory(args.sync)
+        return
 
-        if not docs:
-            print("No documents processed yet.")
-        else:
-            print("Processed documents:")
-            for doc in docs:
-                print(f"  {doc[0]} ({doc[3]} chunks) - {doc[2]}")
+    if args.watch:
+        if not Path(args.watch).is_dir():
+            print(f"Directory not found: {args.watch}")
+            return
+        from models.watcher import DirectoryWatcher
+
+        DirectoryWatcher(get_processor(config, tags), args.watch).run()
+        return
+
+    if not (args.query or args.interactive or args.batch):
+        parser.print_help()
+        return
+    if args.batch and not Path(args.batch).is_file():
+        print(f"File not found: {args.batch}")
+        return
+
+    try:
+        filters = SearchFilter.create(
+            args.file, args.path, args.file_type, args.since, args.until, tags
+        )
+    except ValueError as e:
+        print(e)
         return
 
+    from models.assistant import Assistant, check_ollama_connection
+
     # Check Ollama connection before querying
-    if args.query or args.interactive:
-        if not check_ollama_connection(config):
-            return
+    if not check_ollama_connection(config):
+        return
 
     # Initialize assistant
     try:
-        assistant = Assistant(config)
+        assistant = Assistant(config, [collection.collection for collection in scoped])
     except SystemExit:
         return
+    except LookupError as e:
+        print(e)
+        return
+
+    if args.batch:
+        run_batch(config, assistant, Path(args.batch), args.output, filters)
+        return
+
+    stream = config.config["stream"] and not args.no_stream
+    if filters is not None:
+        print(f"Searching only files: {filters.describe()}")
 
     # Handle single query
     if args.query:
-        answer = assistant.answer_question(args.query)
         print(f"\nQuestion: {args.query}")
-        print(f"Answer: {answer}")
+        print_answer(assistant, args.query, stream, args.retrieval, filters)
         return
 
     # Handle interactive mode
@@ -125,25 +409,28 @@ def main():
                 elif question.lower() == "help":
                     print("Commands:")
                     print("  help - Show this help")
+                    print("  stats - Show search and answer cache statistics")
                     print("  quit/exit - Exit interactive mode")
                     print("  Any other input - Ask a question")
                     continue
+                elif question.lower() == "stats":
+                    for cache in (assistant.search_cache, assistant.answer_cache):
+                        if cache is not None:
+                            print(cache.report())
+                    continue
                 elif not question:
                     continue
 
-                print("Thinking...")
-                answer = assistant.answer_question(question)
-                print(f"\nAnswer: {answer}")
+                if not stream:
+                    print("Thinking...")
+                print()
+                print_answer(assistant, question, stream, args.retrieval, filters)
 
             except KeyboardInterrupt:
                 print("\nGoodbye!")
                 break
             except Exception as e:
                 print(f"Error: {e}")
-        return
-
-    # Show help if no arguments
-    parser.print_help()
 
 
 if __name__ == "__main__":
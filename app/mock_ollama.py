@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Ollama stand-in for testing the assistant and API server offline.
+Implements /api/tags and /api/generate (streaming and non-streaming)
+with canned answers and a configurable per-token delay.
+
+Point the assistant at it by setting "ollama_url" in config.json, e.g.
+"http://127.0.0.1:11435".
+"""
+
+import json
+import time
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = (
+    "This is a canned answer from the mock Ollama server. "
+    "It repeats part of the question: "
+)
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    model_name = "llama2"
+    token_delay = 0.0
+    prompt_delay = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self.send_json(200, {"models": [{"name": self.model_name}]})
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self.send_json(404, {"error": "not found"})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if request.get("model") != self.model_name:
+            self.send_json(404, {"error": f"model '{request.get('model')}' not found"})
+            return
+
+        prompt = request.get("prompt", "")
+        question = prompt.rsplit("Question:", 1)[-1].split("Answer:", 1)[0].strip()
+        words = (ANSWER + question).split()
+        max_tokens = request.get("options", {}).get("num_predict") or len(words)
+        words = words[:max_tokens]
+
+        # Rough token counts, enough for timing reports
+        prompt_tokens = max(1, len(prompt) // 4)
+        time.sleep(self.prompt_delay)
+        start = time.perf_counter()
+
+        if not request.get("stream", True):
+            time.sleep(self.token_delay * len(words))
+            self.send_json(200, self.final_chunk(" ".join(words), words, prompt_tokens, start))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, word in enumerate(words):
+            time.sleep(self.token_delay)
+            token = word if i == 0 else " " + word
+            chunk = {"model": self.model_name, "response": token, "done": False}
+            self.write_chunk((json.dumps(chunk) + "\n").encode("utf-8"))
+        final = self.final_chunk("", words, prompt_tokens, start)
+        self.write_chunk((json.dumps(final) + "\n").encode("utf-8"))
+        self.write_chunk(b"")
+
+    def final_chunk(self, response: str, words: list, prompt_tokens: int, start: float) -> dict:
+        eval_duration = max(int((time.perf_counter() - start) * 1e9), 1)
+        return {
+            "model": self.model_name,
+            "response": response,
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(self.prompt_delay * 1e9),
+            "eval_count": len(words),
+            "eval_duration": eval_duration,
+            "total_duration": eval_duration + int(self.prompt_delay * 1e9),
+        }
+
+
+def create_server(
+    host: str = "127.0.0.1",
+    port: int = 11435,
+    model: str = "llama2",
+    token_delay: float = 0.0,
+    prompt_delay: float = 0.0,
+) -> ThreadingHTTPServer:
+    """Build a mock server; call serve_forever() on it, e.g. in a thread"""
+    handler = type(
+        "ConfiguredMockOllamaHandler",
+        (MockOllamaHandler,),
+        {"model_name": model, "token_delay": token_delay, "prompt_delay": prompt_delay},
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Ollama server for testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--model", default="llama2", help="Model name to report")
+    parser.add_argument(
+        "--token-delay", type=float, default=0.02, help="Seconds between streamed tokens"
+    )
+    parser.add_argument(
+        "--prompt-delay", type=float, default=0.1, help="Simulated prompt evaluation time"
+    )
+    args = parser.parse_args()
+
+    server = create_server(
+        args.host, args.port, args.model, args.token_delay, args.prompt_delay
+    )
+    print(f"Mock Ollama listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import re
+import json
+import hashlib
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+from models.config import Config
+
+import numpy as np
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip(" ?!.")
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    semantic: bool  # matched a similar question rather than the same one
+
+
+class AnswerCache:
+    """Persistent cache of generated answers
+
+    Entries are keyed on the normalized question plus a context key made of
+    the retrieved chunk ids and the generation settings, so an answer is only
+    reused for the same retrieved context. A semantic tier also matches other
+    questions over that context whose embeddings are within the configured
+    cosine similarity. Each entry remembers the file hashes of the documents
+    it was built from and is dropped once any of them is re-ingested with
+    different content. Entries expire after a TTL and the least recently used
+    ones are evicted beyond max_entries.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        metadata_paths: List[Path],
+        ttl: float,
+        max_entries: int,
+        similarity: float,
+    ):
+        self.path = path
+        # One metadata.db per collection the answers are drawn from
+        self.metadata_paths = metadata_paths
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self.init_db()
+
+    @classmethod
+    def for_config(
+        cls, config: Config, metadata_paths: Optional[List[Path]] = None
+    ) -> "AnswerCache":
+        return cls(
+            config.answer_cache_path,
+            metadata_paths or [config.sqlite_path],
+            config.config["answer_cache_ttl"],
+            config.config["answer_cache_max_entries"],
+            config.config["answer_cache_similarity"],
+        )
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def init_db(self):
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                context_key TEXT NOT NULL,
+                question TEXT NOT NULL,
+                embedding BLOB,
+                answer TEXT NOT NULL,
+                sources TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_answers_context ON answers(context_key)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_answers_last_used ON answers(last_used)"
+        )
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def context_key(chunk_ids: List[str], settings: Dict) -> str:
+        """Identify the retrieved context and the settings it was answered with"""
+        data = json.dumps([sorted(chunk_ids), settings], sort_keys=True)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def key(question: str, context_key: str) -> str:
+        data = f"{context_key}\n{normalize_question(question)}"
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def document_hashes(self, filepaths: List[str]) -> Dict[str, str]:
+        """Current file hashes of ingested documents"""
+        hashes: Dict[str, str] = {}
+        if not filepaths:
+            return hashes
+        placeholders = ",".join("?" * len(filepaths))
+        for metadata_path in self.metadata_paths:
+            if not metadata_path.exists():
+                continue
+            conn = sqlite3.connect(metadata_path, timeout=30)
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT filepath, file_hash FROM documents WHERE filepath IN ({placeholders})",
+                filepaths,
+            )
+            for filepath, file_hash in cursor.fetchall():
+                hashes.setdefault(filepath, file_hash)
+            conn.close()
+        return hashes
+
+    def get(
+        self, question: str, context_key: str, embedding: np.ndarray
+    ) -> Optional[CachedAnswer]:
+        """Look up an answer for the question over the given context"""
+        now = time.time()
+        with self._lock:
+            conn = self.connect()
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+
+            cursor.execute(
+                "SELECT key, answer, sources FROM answers WHERE key = ?",
+                (self.key(question, context_key),),
+            )
+            row = cursor.fetchone()
+            semantic = False
+            if row is None and self.similarity < 1:
+                row = self._nearest(cursor, context_key, embedding)
+                semantic = row is not None
+
+            if row is not None and not self._is_current(json.loads(row[2])):
+                cursor.execute("DELETE FROM answers WHERE context_key = ?", (context_key,))
+                self.invalidations += 1
+                row = None
+
+            if row is None:
+                self.misses += 1
+            else:
+                cursor.execute(
+                    "UPDATE answers SET last_used = ? WHERE key = ?", (now, row[0])
+                )
+                self.hits += 1
+                self.semantic_hits += semantic
+            conn.commit()
+            conn.close()
+        return None if row is None else CachedAnswer(row[1], semantic)
+
+    def _nearest(self, cursor: sqlite3.Cursor, context_key: str, embedding: np.ndarray):
+        """Most similar cached question over the same context, if close enough"""
+        cursor.execute(
+            "SELECT key, answer, sources, embedding FROM answers WHERE context_key = ?",
+            (context_key,),
+        )
+        rows = [row for row in cursor.fetchall() if row[3] is not None]
+        if not rows:
+            return None
+
+        query = np.asarray(embedding, dtype=np.float32)
+        cached = np.stack([np.frombuffer(row[3], dtype=np.float32) for row in rows])
+        if cached.shape[1] != query.shape[0]:
+            return None
+        norms = np.linalg.norm(cached, axis=1) * np.linalg.norm(query)
+        similarities = cached @ query / np.maximum(norms, 1e-12)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity:
+            return None
+        return rows[best][:3]
+
+    def _is_current(self, sources: Dict[str, str]) -> bool:
+        return self.document_hashes(list(sources)) == sources
+
+    def put(
+        self,
+        question: str,
+        context_key: str,
+        embedding: Optional[np.ndarray],
+        answer: str,
+        filepaths: List[str],
+    ):
+        """Store an answer along with the hashes of the documents behind it"""
+        sources = self.document_hashes(sorted(set(filepaths)))
+        blob = None if embedding is None else np.asarray(embedding, np.float32).tobytes()
+        now = time.time()
+        with self._lock:
+            conn = self.connect()
+            cursor = conn.cursor()
+            cursor.execute(
+                """INSERT OR REPLACE INTO answers
+                   (key, context_key, question, embedding, answer, sources, created, last_used)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    self.key(question, context_key),
+                    context_key,
+                    question,
+                    blob,
+                    answer,
+                    json.dumps(sources),
+                    now,
+                    now,
+                ),
+            )
+            cursor.execute(
+                """DELETE FROM answers WHERE key IN (
+                       SELECT key FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                   )""",
+                (self.max_entries,),
+            )
+            conn.commit()
+            conn.close()
+
+    def clear(self):
+        with self._lock:
+            conn = self.connect()
+            conn.execute("DELETE FROM answers")
+            conn.commit()
+            conn.close()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (
+            f"Answer cache: {stats['hits']} hits ({stats['semantic_hits']} semantic), "
+            f"{stats['misses']} misses, {stats['invalidations']} invalidated, "
+            f"hit rate {stats['hit_rate']:.0%}"
+        )
@@ -1,4 +1,16 @@
-from .assistant import Assistant
+from .assistant import Assistant, QueryStats
+from .async_assistant import AsyncAssistant
+from .batch import BatchRunner, BatchStats
 from .connection import check_ollama_connection
+from .ollama_client import OllamaClient, OllamaError
 
-__all__ = ["Assistant", "check_ollama_connection"]
+__all__ = [
+    "Assistant",
+    "AsyncAssistant",
+    "BatchRunner",
+    "BatchStats",
+    "OllamaClient",
+    "OllamaError",
+    "QueryStats",
+    "check_ollama_connection",
+]
@@ -1,23 +1,23 @@
 import os
 import sys
-from typing import List, Dict
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 from models.config import Config
-
-try:
-    import chromadb
-    from chromadb.config import Settings
-except ImportError:
-    print("ChromaDB not found. Installing...")
-    os.system("pip install chromadb")
-    import chromadb
-    from chromadb.config import Settings
-
-try:
-    from sentence_transformers import SentenceTransformer
-except ImportError:
-    print("SentenceTransformers not found. Installing...")
-    os.system("pip install sentence-transformers")
-    from sentence_transformers import SentenceTransformer
+from models.embeddings import EmbeddingEngine
+from models.answer_cache import AnswerCache, CachedAnswer
+from models.search_cache import SearchCache
+from models.context_builder import ContextBuilder, ContextStats, estimate_tokens
+from models.metadata_store import MetadataStore
+from models.reranker import Reranker, RerankStats
+from models.filters import SearchFilter
+from models.lexical_index import RETRIEVAL_MODES, LexicalIndex, reciprocal_rank_fusion
+from models.assistant.ollama_client import OllamaClient, OllamaError
+from models.vector_store import VectorStore, create_vector_store
+from models.tracing import tracer
 
 try:
     import requests
@@ -26,107 +26,565 @@ except ImportError:
     os.system("pip install requests")
     import requests
 
-# Configuration
+import numpy as np
+
+PROMPT_TEMPLATE = """Based ONLY on the following documents, answer the question. If the answer cannot be found in the provided documents, say "I cannot find this information in the provided documents."
+
+Documents:
+{context}
+
+Question: {question}
+
+Answer:"""
+NO_RESULTS_ANSWER = (
+    "I couldn't find any relevant information in the documents to answer your question."
+)
+# Generation failures are reported as text; these must never be cached
+ERROR_PREFIXES = (
+    "Error connecting to Ollama:",
+    "Error from Ollama:",
+    "Error processing response:",
+)
+
+
+def is_error_response(text: str) -> bool:
+    return text.startswith(ERROR_PREFIXES)
+
+
+def merge_by_distance(rankings: List[List[Dict]], limit: int) -> List[Dict]:
+    """Merge vector results from several collections, nearest first
+
+    Every collection is embedded with the same model, so cosine distances
+    compare directly. A chunk found in more than one keeps its first copy.
+    """
+    results = [result for ranking in rankings for result in ranking]
+    merged: Dict[str, Dict] = {}
+    for result in sorted(results, key=lambda result: result["distance"]):
+        merged.setdefault(result["id"], result)
+        if len(merged) == limit:
+            break
+    return list(merged.values())
+
+
+@dataclass
+class CollectionIndex:
+    """The searchable side of one collection, opened read-only"""
+
+    name: str
+    vector_store: VectorStore
+    lexical_index: LexicalIndex
+    metadata: MetadataStore
+
+    @classmethod
+    def open(cls, config: Config) -> "CollectionIndex":
+        # Read-only: never creates a collection, FAISS indexes are memory-mapped
+        metadata = MetadataStore(config.sqlite_path)
+        return cls(
+            config.collection,
+            create_vector_store(config, read_only=True),
+            LexicalIndex(metadata),
+            metadata,
+        )
+
+
+@dataclass
+class GenerationStats:
+    """Latency figures for one streamed generation"""
+
+    time_to_first_token: float = 0.0
+    total_time: float = 0.0
+    tokens: int = 0
+    tokens_per_second: float = 0.0
+    prompt_tokens: int = 0  # as counted by Ollama
+
+    def report(self) -> str:
+        return (
+            f"prompt {self.prompt_tokens} tokens, first token {self.time_to_first_token:.2f}s, "
+            f"{self.tokens} tokens at {self.tokens_per_second:.1f} tokens/s, "
+            f"total {self.total_time:.2f}s"
+        )
+
+
+@dataclass
+class QueryStats:
+    """What answering one question found and cost
+
+    Passed in by the caller and filled in by the answer methods, so
+    questions answered concurrently each keep their own figures.
+    """
+
+    cache_hit: Optional[CachedAnswer] = None
+    rerank: Optional[RerankStats] = None
+    context: Optional[ContextStats] = None
+    generation: Optional[GenerationStats] = None  # streamed answers only
 
 
 class Assistant:
-    def __init__(self, config: Config):
-        self.config = config
-        self.embedding_model = SentenceTransformer(config.config["embedding_model"])
+    def __init__(self, config: Config, collections: Optional[Sequence[str]] = None):
+        """Answer from one or more collections (default: the config's own)
 
-        # Initialize ChromaDB
-        self.chroma_client = chromadb.PersistentClient(
-            path=str(config.db_path), settings=Settings(anonymized_telemetry=False)
+        With several collections every search fans out to all of them in
+        parallel and the results are merged.
+        """
+        self.config = config
+        names = list(dict.fromkeys(collections or [config.collection]))
+        unknown = [name for name in names if name not in config.collection_names()]
+        if unknown:
+            raise LookupError(f"Unknown collection: {', '.join(unknown)}")
+        self.collections = [
+            CollectionIndex.open(config.for_collection(name)) for name in names
+        ]
+        # Shared with DocumentProcessor, so the model loads once per process
+        self.embedder = EmbeddingEngine.shared(config)
+        self.ollama = OllamaClient.shared(config)
+        self.context_builder = ContextBuilder(config)
+        # Loaded on the first question, like the embedding model
+        self.reranker = Reranker.shared(config) if config.config["rerank"] else None
+        # Repeated questions skip re-encoding; the answer cache reuses it too
+        self.encode_query = lru_cache(maxsize=256)(self.embedder.encode_query)
+        self.search_cache = (
+            SearchCache(int(config.config["search_cache_max_mb"] * 1024 * 1024))
+            if config.config["search_cache"]
+            else None
+        )
+        # Kept with the first collection, checked against all of their documents
+        self.answer_cache = (
+            AnswerCache.for_config(
+                config.for_collection(names[0]),
+                [index.metadata.sqlite_path for index in self.collections],
+            )
+            if config.config["answer_cache"]
+            else None
         )
 
-        try:
-            self.collection = self.chroma_client.get_collection("documents")
-        except:
+        # Keyword searches and the other collections' vector searches run
+        # here while the first collection's vector search runs in the caller
+        self.search_executor = ThreadPoolExecutor(
+            max_workers=config.config["query_workers"], thread_name_prefix="search"
+        )
+        if not any(index.vector_store.count() for index in self.collections):
             print(
                 "No documents found. Please add documents first using --add-doc or --add-dir"
             )
             sys.exit(1)
 
-    def search_documents(self, query: str, max_results: int = None) -> List[Dict]:
-        """Search for relevant document chunks"""
+    @property
+    def collection_names(self) -> List[str]:
+        return [index.name for index in self.collections]
+
+    def generation(self) -> int:
+        """Changes whenever any searched collection does"""
+        return sum(index.metadata.generation() for index in self.collections)
+
+    def search_documents(
+        self,
+        query: str,
+        max_results: int = None,
+        mode: str = None,
+        filters: Optional[SearchFilter] = None,
+    ) -> List[Dict]:
+        """Search for relevant document chunks
+
+        `mode` (default: retrieval_mode) is "vector" for embedding
+        similarity, "keyword" for BM25 over the full-text index, or "hybrid"
+        for both, run in parallel and merged by reciprocal-rank fusion.
+        `filters` restrict both searches to matching chunks.
+        """
+        max_results, mode = self.search_settings(max_results, mode)
+        filter_key = filters.key() if filters is not None else ""
+        with tracer.span("query.search", mode=mode) as span:
+            if mode == "keyword":
+                # A single FTS lookup; not worth embedding the query to cache it
+                return self.keyword_search(query, max_results, filters)
+
+            # Embed with the same model used at ingest, then search the vector store
+            with tracer.span("query.embed"):
+                query_embedding = self.encode_query(query)
+            if self.search_cache is not None:
+                # Read before searching, so results racing an ingest are never reused
+                generation = self.generation()
+                cached = self.search_cache.get(
+                    query_embedding, max_results, generation, mode, filter_key
+                )
+                span.attributes["cached"] = cached is not None
+                if cached is not None:
+                    return cached
+
+            results = self.search_embeddings(
+                [query], query_embedding[None, :], max_results, mode, filters
+            )[0]
+            if self.search_cache is not None:
+                self.search_cache.put(
+                    query_embedding, max_results, generation, results, mode, filter_key
+                )
+            return results
+
+    def keyword_search(
+        self, query: str, n_results: int, filters: Optional[SearchFilter] = None
+    ) -> List[Dict]:
+        return self.search_embeddings([query], None, n_results, "keyword", filters)[0]
+
+    def search_collection_keywords(
+        self,
+        index: CollectionIndex,
+        query: str,
+        n_results: int,
+        filters: Optional[SearchFilter] = None,
+    ) -> List[Dict]:
+        with tracer.span("query.keyword_search", collection=index.name):
+            return self.tag_results(
+                index, index.lexical_index.search(query, n_results, filters)
+            )
+
+    def search_collection_vectors(
+        self,
+        index: CollectionIndex,
+        embeddings: np.ndarray,
+        n_results: int,
+        filters: Optional[SearchFilter] = None,
+    ) -> List[List[Dict]]:
+        with tracer.span("query.vector_search", collection=index.name, queries=len(embeddings)):
+            return [
+                self.tag_results(index, results)
+                for results in index.vector_store.query(embeddings, n_results, filters)
+            ]
+
+    def resolve_filters(
+        self, filters: Optional[SearchFilter]
+    ) -> List[Optional[SearchFilter]]:
+        """The filter for each collection, with file names and paths looked up in it"""
+        if filters is None:
+            return [None] * len(self.collections)
+        with tracer.span("query.filter"):
+            return [filters.resolve(index.metadata) for index in self.collections]
+
+    def tag_results(self, index: CollectionIndex, results: List[Dict]) -> List[Dict]:
+        """Note which collection each result came from"""
+        for result in results:
+            result["collection"] = index.name
+        return results
+
+    def submit(self, fn, *args):
+        # Copy the context so spans in the job nest under the caller's
+        return self.search_executor.submit(contextvars.copy_context().run, fn, *args)
+
+    def search_settings(self, max_results: Optional[int], mode: Optional[str]) -> Tuple[int, str]:
+        """Fill in configured defaults for a search"""
         if max_results is None:
             max_results = self.config.config["max_results"]
+        mode = mode or self.config.config["retrieval_mode"]
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}")
+        return max_results, mode
+
+    def candidate_count(self) -> int:
+        """Chunks to retrieve per question; more than are kept when re-ranking"""
+        max_results = self.config.config["max_results"]
+        if self.reranker is None:
+            return max_results
+        return max(max_results, self.config.config["rerank_candidates"])
+
+    def rerank_many(
+        self, questions: List[str], doc_lists: List[List[Dict]]
+    ) -> Tuple[List[List[Dict]], Optional[RerankStats]]:
+        """Cut each question's candidates down to the max_results best by cross-encoder
+
+        Returns the lists unchanged, and no stats, when re-ranking is off.
+        """
+        if self.reranker is None:
+            return doc_lists, None
+        return self.reranker.rerank_many(
+            questions, doc_lists, self.config.config["max_results"]
+        )
+
+    def search_embeddings(
+        self,
+        queries: List[str],
+        embeddings: Optional[np.ndarray],
+        max_results: int = None,
+        mode: str = None,
+        filters: Optional[SearchFilter] = None,
+    ) -> List[List[Dict]]:
+        """Search for already embedded queries, one vector store call per collection
 
-        # Search in ChromaDB
-        results = self.collection.query(query_texts=[query], n_results=max_results)
-
-        # Format results
-        formatted_results = []
-        if results["documents"][0]:
-            for i, doc in enumerate(results["documents"][0]):
-                formatted_results.append(
-                    {
-                        "content": doc,
-                        "metadata": results["metadatas"][0][i],
-                        "distance": results["distances"][0][i]
-                        if "distances" in results
-                        else 0,
-                    }
+        Collections are searched in parallel. Vector results are merged by
+        distance; keyword and hybrid results by reciprocal-rank fusion, as
+        BM25 scores depend on each collection's own term statistics.
+        `embeddings` may be None in keyword mode.
+        """
+        max_results, mode = self.search_settings(max_results, mode)
+        scoped = self.resolve_filters(filters)
+        # Fusion needs deeper lists than the final cut from each retriever
+        candidates = (
+            max(max_results, self.config.config["retrieval_candidates"])
+            if mode == "hybrid"
+            else max_results
+        )
+
+        keyword_jobs = []
+        if mode != "vector":
+            keyword_jobs = [
+                [
+                    self.submit(
+                        self.search_collection_keywords, index, query, candidates, index_filters
+                    )
+                    for query in queries
+                ]
+                for index, index_filters in zip(self.collections, scoped)
+            ]
+        vector_results = []
+        if mode != "keyword":
+            (first, first_filters), *rest = zip(self.collections, scoped)
+            vector_jobs = [
+                self.submit(
+                    self.search_collection_vectors, index, embeddings, candidates, index_filters
                 )
+                for index, index_filters in rest
+            ]
+            vector_results = [
+                self.search_collection_vectors(first, embeddings, candidates, first_filters)
+            ]
+            vector_results += [job.result() for job in vector_jobs]
+        keyword_results = [[job.result() for job in jobs] for jobs in keyword_jobs]
 
-        return formatted_results
+        merged = []
+        for i in range(len(queries)):
+            vector = [results[i] for results in vector_results]
+            keyword = [results[i] for results in keyword_results]
+            if len(vector) + len(keyword) == 1:
+                merged.append((vector + keyword)[0])
+            elif mode == "vector":
+                merged.append(merge_by_distance(vector, max_results))
+            else:
+                # Vector lists first, so fused chunks keep their distance
+                merged.append(reciprocal_rank_fusion(vector + keyword, max_results))
+        return merged
 
     def query_ollama(self, prompt: str) -> str:
         """Query Ollama LLaMA model"""
-        url = f"{self.config.config['ollama_url']}/api/generate"
-
-        payload = {
-            "model": self.config.config["model_name"],
-            "prompt": prompt,
-            "stream": False,
-            "options": {
-                "temperature": self.config.config["temperature"],
-                "num_predict": self.config.config["max_tokens"],
-            },
-        }
-
         try:
-            response = requests.post(url, json=payload, timeout=60)
-            response.raise_for_status()
-            return response.json()["response"]
+            with tracer.span("query.generate"):
+                result = self.ollama.generate(prompt)
+                tracer.record_ollama(result)
+            return result["response"]
         except requests.exceptions.RequestException as e:
             return f"Error connecting to Ollama: {e}"
+        except OllamaError as e:
+            return f"Error from Ollama: {e}"
         except Exception as e:
             return f"Error processing response: {e}"
 
-    def answer_question(self, question: str) -> str:
-        """Answer question based on documents"""
-        # Search for relevant documents
-        relevant_docs = self.search_documents(question)
+    def stream_ollama(
+        self, prompt: str, stats: Optional[GenerationStats] = None
+    ) -> Iterator[str]:
+        """Stream tokens from Ollama's NDJSON /api/generate response as they arrive
 
-        if not relevant_docs:
-            return "I couldn't find any relevant information in the documents to answer your question."
+        Timing is filled into `stats`, if given, as the stream is consumed.
+        """
+        if stats is None:
+            stats = GenerationStats()
+        start = time.perf_counter()
+        try:
+            for chunk in self.ollama.generate_stream(prompt):
+                token = chunk.get("response", "")
+                if token:
+                    if not stats.tokens:
+                        stats.time_to_first_token = time.perf_counter() - start
+                    stats.tokens += 1
+                    yield token
 
-        # Prepare context from relevant documents
-        context = "\n\n".join(
-            [
-                f"Document: {doc['metadata'].get('filename', 'Unknown')}\n{doc['content']}"
-                for doc in relevant_docs
-            ]
-        )
+                if chunk.get("done"):
+                    stats.prompt_tokens = chunk.get("prompt_eval_count", 0)
+                    tracer.record_ollama(chunk)
+                # Ollama's own counters are exact; chunk counts are a fallback
+                if chunk.get("done") and chunk.get("eval_count") and chunk.get("eval_duration"):
+                    stats.tokens = chunk["eval_count"]
+                    stats.tokens_per_second = chunk["eval_count"] / (
+                        chunk["eval_duration"] / 1e9
+                    )
+        except requests.exceptions.RequestException as e:
+            yield f"Error connecting to Ollama: {e}"
+        except OllamaError as e:
+            yield f"Error from Ollama: {e}"
+        except Exception as e:
+            yield f"Error processing response: {e}"
+        finally:
+            stats.total_time = time.perf_counter() - start
+            generation_time = stats.total_time - stats.time_to_first_token
+            if not stats.tokens_per_second and stats.tokens and generation_time > 0:
+                stats.tokens_per_second = stats.tokens / generation_time
+            tracer.record("query.generate", stats.total_time, tokens=stats.tokens)
 
-        # Create prompt
-        prompt = f"""Based ONLY on the following documents, answer the question. If the answer cannot be found in the provided documents, say "I cannot find this information in the provided documents."
+    def build_prompt(
+        self,
+        question: str,
+        mode: str = None,
+        filters: Optional[SearchFilter] = None,
+        stats: Optional[QueryStats] = None,
+    ) -> Tuple[Optional[str], List[Dict]]:
+        """Retrieve relevant chunks and build the prompt; prompt is None without hits
 
-Documents:
-{context}
+        Returns the chunks that made it into the prompt, which re-ranking and
+        packing to the token budget may have cut down from those retrieved.
+        Re-ranking and packing figures go into `stats`, if given.
+        """
+        # Search for relevant documents, widely when a cross-encoder picks the best
+        relevant_docs = self.search_documents(
+            question, self.candidate_count(), mode=mode, filters=filters
+        )
+        (relevant_docs,), rerank = self.rerank_many([question], [relevant_docs])
+        prompt, used_docs, context = self.pack_prompt(question, relevant_docs)
+        if stats is not None:
+            stats.rerank, stats.context = rerank, context
+        return prompt, used_docs
 
-Question: {question}
+    def pack_prompt(
+        self, question: str, relevant_docs: List[Dict]
+    ) -> Tuple[Optional[str], List[Dict], Optional[ContextStats]]:
+        """Build the prompt from retrieved chunks; prompt is None without any"""
+        if not relevant_docs:
+            return None, relevant_docs, None
 
-Answer:"""
+        # Merge, deduplicate and fit the chunks around the rest of the prompt
+        reserved_tokens = estimate_tokens(PROMPT_TEMPLATE.format(context="", question=question))
+        with tracer.span("query.prompt", chunks=len(relevant_docs)):
+            context, used_docs, stats = self.context_builder.build(
+                relevant_docs, reserved_tokens
+            )
+        if not used_docs:
+            return None, used_docs, stats
 
-        # Query LLaMA
-        response = self.query_ollama(prompt)
+        prompt = PROMPT_TEMPLATE.format(context=context, question=question)
+        stats.prompt_tokens = estimate_tokens(prompt)
+        return prompt, used_docs, stats
 
-        # Add source information
+    def format_sources(self, relevant_docs: List[Dict]) -> str:
         sources = list(
-            set([doc["metadata"].get("filename", "Unknown") for doc in relevant_docs])
+            set(
+                [
+                    doc["metadata"].get("filename", "Unknown")
+                    # Name the collection when answers draw on several
+                    + (f" [{doc.get('collection')}]" if len(self.collections) > 1 else "")
+                    for doc in relevant_docs
+                ]
+            )
+        )
+        return f"\n\nSources: {', '.join(sources)}"
+
+    def answer_context_key(self, relevant_docs: List[Dict]) -> str:
+        """Answer cache key for the retrieved chunks and generation settings"""
+        settings = {
+            "model_name": self.config.config["model_name"],
+            "temperature": self.config.config["temperature"],
+            "max_tokens": self.config.config["max_tokens"],
+            "embedding_model": self.config.config["embedding_model"],
+            "context_window": self.config.config["context_window"],
+            "context_max_tokens": self.config.config["context_max_tokens"],
+        }
+        return AnswerCache.context_key([doc["id"] for doc in relevant_docs], settings)
+
+    def get_cached_answer(
+        self,
+        question: str,
+        relevant_docs: List[Dict],
+        embedding: Optional[np.ndarray] = None,
+    ) -> Optional[CachedAnswer]:
+        """Previously generated answer for this question and context, if any"""
+        if self.answer_cache is None:
+            return None
+        if embedding is None:
+            embedding = self.encode_query(question)
+        with tracer.span("query.answer_cache") as span:
+            cached = self.answer_cache.get(
+                question, self.answer_context_key(relevant_docs), embedding
+            )
+            span.attributes["hit"] = cached is not None
+        return cached
+
+    def cache_answer(
+        self,
+        question: str,
+        relevant_docs: List[Dict],
+        response: str,
+        embedding: Optional[np.ndarray] = None,
+    ):
+        if self.answer_cache is None or not response or is_error_response(response):
+            return
+        if embedding is None:
+            embedding = self.encode_query(question)
+        self.answer_cache.put(
+            question,
+            self.answer_context_key(relevant_docs),
+            embedding,
+            response,
+            [doc["metadata"].get("filepath", "") for doc in relevant_docs],
         )
-        response += f"\n\nSources: {', '.join(sources)}"
 
-        return response
+    def answer_question(
+        self,
+        question: str,
+        mode: str = None,
+        filters: Optional[SearchFilter] = None,
+        stats: Optional[QueryStats] = None,
+    ) -> str:
+        """Answer question based on documents, optionally only those matching `filters`
+
+        What the answer cost is filled into `stats`, if given.
+        """
+        with tracer.span("query"):
+            prompt, relevant_docs = self.build_prompt(question, mode, filters, stats)
+            if prompt is None:
+                return NO_RESULTS_ANSWER
+
+            cached = self.get_cached_answer(question, relevant_docs)
+            if stats is not None:
+                stats.cache_hit = cached
+            if cached is not None:
+                return cached.answer + self.format_sources(relevant_docs)
+
+            # Query LLaMA
+            response = self.query_ollama(prompt)
+            self.cache_answer(question, relevant_docs, response)
+
+            # Add source information
+            response += self.format_sources(relevant_docs)
+
+            return response
+
+    def answer_question_stream(
+        self,
+        question: str,
+        mode: str = None,
+        filters: Optional[SearchFilter] = None,
+        stats: Optional[QueryStats] = None,
+    ) -> Iterator[str]:
+        """Answer question based on documents, yielding text as it is generated
+
+        Timing for the generation is in `stats.generation` once the iterator
+        is exhausted; it stays None for answers served from the cache.
+        """
+        with tracer.span("query", stream=True):
+            prompt, relevant_docs = self.build_prompt(question, mode, filters, stats)
+            if prompt is None:
+                yield NO_RESULTS_ANSWER
+                return
+
+            cached = self.get_cached_answer(question, relevant_docs)
+            if stats is not None:
+                stats.cache_hit = cached
+            if cached is not None:
+                yield cached.answer
+                yield self.format_sources(relevant_docs)
+                return
+
+            generation = GenerationStats()
+            if stats is not None:
+                stats.generation = generation
+            tokens = []
+            for token in self.stream_ollama(prompt, generation):
+                tokens.append(token)
+                yield token
+            # An error is reported as the last token; the rest would be partial
+            if tokens and not is_error_response(tokens[-1]):
+                self.cache_answer(question, relevant_docs, "".join(tokens))
+            yield self.format_sources(relevant_docs)
@@ -0,0 +1,217 @@
+import os
+import json
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Dict, List, Optional
+from models.config import Config
+from models.filters import SearchFilter
+from models.assistant.assistant import (
+    NO_RESULTS_ANSWER,
+    Assistant,
+    QueryStats,
+    is_error_response,
+)
+from models.assistant.ollama_client import OllamaError
+from models.tracing import tracer
+
+try:
+    import httpx
+except ImportError:
+    print("HTTPX not found. Installing...")
+    os.system("pip install httpx")
+    import httpx
+
+# Ollama statuses worth retrying
+RETRY_STATUSES = {500, 502, 503, 504}
+
+
+class AsyncAssistant:
+    """asyncio front end to Assistant for serving many questions at once
+
+    Query embedding and vector search run on a thread pool, generation goes
+    through an async HTTP client, so one question's search overlaps another's
+    generation. A semaphore bounds how many generations Ollama sees at once.
+    """
+
+    def __init__(self, config: Config, assistant: Optional[Assistant] = None):
+        self.config = config
+        self.assistant = assistant or Assistant(config)
+        self.max_concurrency = config.config["ollama_max_concurrency"]
+        self.executor = ThreadPoolExecutor(
+            max_workers=config.config["query_workers"], thread_name_prefix="query"
+        )
+        # Created inside the running loop (Python < 3.10 binds them at creation)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def __aenter__(self) -> "AsyncAssistant":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            pool_size = self.config.config["ollama_pool_size"]
+            self._client = httpx.AsyncClient(
+                base_url=self.config.config["ollama_url"].rstrip("/"),
+                timeout=httpx.Timeout(
+                    self.config.config["ollama_read_timeout"],
+                    connect=self.config.config["ollama_connect_timeout"],
+                ),
+                limits=httpx.Limits(
+                    max_connections=pool_size, max_keepalive_connections=pool_size
+                ),
+                transport=httpx.AsyncHTTPTransport(
+                    retries=self.config.config["ollama_retries"]
+                ),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.executor.shutdown(wait=False)
+
+    async def _run(self, fn, *args):
+        """Run blocking work (embedding, Chroma) on the query thread pool"""
+        loop = asyncio.get_running_loop()
+        # Carry the current trace span over to the worker thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, partial(context.run, fn, *args))
+
+    async def search_documents(
+        self,
+        query: str,
+        max_results: int = None,
+        mode: str = None,
+        filters: Optional[SearchFilter] = None,
+    ) -> List[Dict]:
+        """Search for relevant document chunks"""
+        return await self._run(
+            self.assistant.search_documents, query, max_results, mode, filters
+        )
+
+    async def query_ollama(self, prompt: str) -> str:
+        """Query Ollama, retrying transient server errors with backoff"""
+        payload = self.assistant.ollama.build_payload(prompt, stream=False)
+        retries = self.config.config["ollama_retries"]
+        backoff = self.config.config["ollama_retry_backoff"]
+
+        try:
+            async with self.semaphore:
+                with tracer.span("query.generate"):
+                    for attempt in range(retries + 1):
+                        response = await self.client.post("/api/generate", json=payload)
+                        if response.status_code not in RETRY_STATUSES or attempt == retries:
+                            break
+                        await asyncio.sleep(backoff * (2**attempt))
+            response.raise_for_status()
+            result = response.json()
+            if "error" in result:
+                raise OllamaError(result["error"])
+            tracer.record_ollama(result)
+            return result["response"]
+        except httpx.HTTPError as e:
+            return f"Error connecting to Ollama: {e}"
+        except OllamaError as e:
+            return f"Error from Ollama: {e}"
+        except Exception as e:
+            return f"Error processing response: {e}"
+
+    async def stream_ollama(self, prompt: str) -> AsyncIterator[str]:
+        """Yield tokens from Ollama's NDJSON stream as they arrive"""
+        payload = self.assistant.ollama.build_payload(prompt, stream=True)
+        try:
+            async with self.semaphore:
+                async with self.client.stream("POST", "/api/generate", json=payload) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        if "error" in chunk:
+                            raise OllamaError(chunk["error"])
+                        if chunk.get("response"):
+                            yield chunk["response"]
+                        if chunk.get("done"):
+                            tracer.record_ollama(chunk)
+        except httpx.HTTPError as e:
+            yield f"Error connecting to Ollama: {e}"
+        except OllamaError as e:
+            yield f"Error from Ollama: {e}"
+        except Exception as e:
+            yield f"Error processing response: {e}"
+
+    async def answer_question(
+        self,
+        question: str,
+        mode: str = None,
+        filters: Optional[SearchFilter] = None,
+        stats: Optional[QueryStats] = None,
+    ) -> str:
+        """Answer question based on documents; what it cost goes into `stats`, if given"""
+        with tracer.span("query"):
+            prompt, relevant_docs = await self._run(
+                self.assistant.build_prompt, question, mode, filters, stats
+            )
+            if prompt is None:
+                return NO_RESULTS_ANSWER
+
+            cached = await self._run(self.assistant.get_cached_answer, question, relevant_docs)
+            if stats is not None:
+                stats.cache_hit = cached
+            if cached is not None:
+                return cached.answer + self.assistant.format_sources(relevant_docs)
+
+            response = await self.query_ollama(prompt)
+            await self._run(self.assistant.cache_answer, question, relevant_docs, response)
+            return response + self.assistant.format_sources(relevant_docs)
+
+    async def answer_question_stream(
+        self,
+        question: str,
+        mode: str = None,
+        filters: Optional[SearchFilter] = None,
+        stats: Optional[QueryStats] = None,
+    ) -> AsyncIterator[str]:
+        """Answer question based on documents, yielding text as it is generated"""
+        with tracer.span("query", stream=True):
+            prompt, relevant_docs = await self._run(
+                self.assistant.build_prompt, question, mode, filters, stats
+            )
+            if prompt is None:
+                yield NO_RESULTS_ANSWER
+                return
+
+            cached = await self._run(self.assistant.get_cached_answer, question, relevant_docs)
+            if stats is not None:
+                stats.cache_hit = cached
+            if cached is not None:
+                yield cached.answer
+                yield self.assistant.format_sources(relevant_docs)
+                return
+
+            tokens = []
+            async for token in self.stream_ollama(prompt):
+                tokens.append(token)
+                yield token
+            if tokens and not is_error_response(tokens[-1]):
+                await self._run(
+                    self.assistant.cache_answer, question, relevant_docs, "".join(tokens)
+                )
+            yield self.assistant.format_sources(relevant_docs)
+
+    async def answer_many(self, questions: List[str]) -> List[str]:
+        """Answer several questions concurrently, preserving their order"""
+        return await asyncio.gather(*(self.answer_question(q) for q in questions))
@@ -0,0 +1,262 @@
+import json
+import time
+import asyncio
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set, TextIO, Tuple
+
+import numpy as np
+
+from models.assistant.assistant import NO_RESULTS_ANSWER, is_error_response
+from models.assistant.async_assistant import AsyncAssistant
+from models.lexical_index import RETRIEVAL_MODES
+from models.filters import SearchFilter
+from models.tracing import tracer
+
+
+@dataclass
+class BatchStats:
+    """Counters and per-stage timings for a --batch run"""
+
+    questions: int = 0
+    resumed: int = 0
+    answered: int = 0
+    cached: int = 0
+    failed: int = 0
+    embed_time: float = 0.0
+    search_time: float = 0.0
+    rerank_time: float = 0.0
+    tokens_saved: int = 0  # estimated prompt tokens re-ranking kept out
+    prompt_time: float = 0.0
+    generation_time: float = 0.0
+    started: float = field(default_factory=time.perf_counter)
+    elapsed: float = 0.0
+
+    def report(self) -> str:
+        elapsed = max(self.elapsed, 1e-9)
+        report = (
+            f"Answered {self.answered} of {self.questions} questions in "
+            f"{self.elapsed:.1f}s - {self.answered / elapsed * 60:.1f} questions/min\n"
+            f"Already answered: {self.resumed}, from answer cache: {self.cached}, "
+            f"failed: {self.failed}\n"
+            f"Stages: embed {self.embed_time:.2f}s, search {self.search_time:.2f}s, "
+            f"re-rank {self.rerank_time:.2f}s, prompt {self.prompt_time:.2f}s, "
+            f"generation {self.generation_time:.2f}s (time with requests in flight)"
+        )
+        if self.rerank_time:
+            report += f"\nRe-ranking kept ~{self.tokens_saved} tokens out of the prompts"
+        return report
+
+
+@dataclass
+class PreparedQuestion:
+    """A question with its retrieval done, waiting for generation"""
+
+    item: Dict
+    embedding: np.ndarray
+    prompt: Optional[str]
+    docs: List[Dict]
+    prompt_tokens: int = 0
+    cached_answer: Optional[str] = None
+
+
+def read_questions(path: Path) -> List[Dict]:
+    """Questions from a JSONL file of {"id", "question", "retrieval_mode", "filter"} objects
+
+    A line may also be a bare JSON string. Ids default to the line number.
+    A "filter" object (as in API requests) is parsed into a SearchFilter.
+    """
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"question": item}
+            if not item.get("question"):
+                raise ValueError(f"{path}:{line_number}: missing 'question'")
+            if item.get("retrieval_mode") not in (None, *RETRIEVAL_MODES):
+                raise ValueError(
+                    f"{path}:{line_number}: unknown retrieval_mode {item['retrieval_mode']!r}"
+                )
+            try:
+                item["filter"] = SearchFilter.from_dict(item.get("filter"))
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: {e}") from None
+            item.setdefault("id", line_number)
+            questions.append(item)
+    return questions
+
+
+def load_finished(output_path: Path) -> Set[str]:
+    """Ids already answered in an earlier run of the same output file
+
+    A last line cut off by a crash is truncated away. Questions recorded
+    with an error are not counted, so they are asked again.
+    """
+    finished: Set[str] = set()
+    if not output_path.exists():
+        return finished
+    valid_bytes = 0
+    with open(output_path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            valid_bytes += len(line)
+            if "error" not in record:
+                finished.add(str(record["id"]))
+    with open(output_path, "r+b") as f:
+        f.truncate(valid_bytes)
+    return finished
+
+
+class BatchRunner:
+    """Answer a file of questions as a pipeline, writing answers as they finish
+
+    Questions are taken `batch_query_size` at a time. Each batch is embedded
+    in one call and searched with one multi-query vector store call on the
+    query thread pool, while the generations of earlier batches go on in
+    the event loop, bounded by ollama_max_concurrency. Every answer is
+    appended to the output as one JSON line when it completes, so a rerun
+    after a crash skips what is already there.
+    """
+
+    def __init__(
+        self, async_assistant: AsyncAssistant, filters: Optional[SearchFilter] = None
+    ):
+        """`filters` apply to questions that don't carry their own"""
+        self.async_assistant = async_assistant
+        self.filters = filters
+        self.assistant = async_assistant.assistant
+        self.batch_size = async_assistant.config.config["batch_query_size"]
+        # Generation time is counted while at least one request is out
+        self._generating = 0
+        self._generating_since = 0.0
+
+    async def run(self, input_path: Path, output_path: Path) -> BatchStats:
+        stats = BatchStats()
+        questions = read_questions(input_path)
+        finished = load_finished(output_path)
+        pending = [item for item in questions if str(item["id"]) not in finished]
+        stats.questions = len(questions)
+        stats.resumed = len(questions) - len(pending)
+
+        loop = asyncio.get_running_loop()
+        # Retrieval runs at most two batches ahead of generation
+        max_in_flight = 2 * self.batch_size
+        tasks: Set[asyncio.Future] = set()
+        with open(output_path, "a", encoding="utf-8") as out:
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start : start + self.batch_size]
+                prepared = await loop.run_in_executor(
+                    self.async_assistant.executor, self.prepare, batch, stats
+                )
+                for question in prepared:
+                    tasks.add(asyncio.ensure_future(self.answer(question, out, stats)))
+                while len(tasks) >= max_in_flight:
+                    _, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            if tasks:
+                await asyncio.gather(*tasks)
+
+        stats.elapsed = time.perf_counter() - stats.started
+        return stats
+
+    def prepare(self, batch: List[Dict], stats: BatchStats) -> List[PreparedQuestion]:
+        """Embed, search, re-rank and build prompts for a batch of questions"""
+        texts = [item["question"] for item in batch]
+        start = time.perf_counter()
+        with tracer.span("query.embed", queries=len(texts)):
+            embeddings = self.assistant.embedder.encode(texts)
+        stats.embed_time += time.perf_counter() - start
+
+        # One search call per retrieval mode and filter present in the batch
+        start = time.perf_counter()
+        groups: Dict[Tuple[Optional[str], Optional[SearchFilter]], List[int]] = {}
+        for i, item in enumerate(batch):
+            filters = item.get("filter") or self.filters
+            groups.setdefault((item.get("retrieval_mode"), filters), []).append(i)
+        results: List[List[Dict]] = [[] for _ in batch]
+        for (mode, filters), indexes in groups.items():
+            found = self.assistant.search_embeddings(
+                [texts[i] for i in indexes],
+                embeddings[indexes],
+                self.assistant.candidate_count(),
+                mode,
+                filters,
+            )
+            for i, docs in zip(indexes, found):
+                results[i] = docs
+        stats.search_time += time.perf_counter() - start
+
+        # Every question's candidates are scored in one cross-encoder call
+        results, rerank = self.assistant.rerank_many(texts, results)
+        if rerank is not None:
+            stats.rerank_time += rerank.seconds
+            stats.tokens_saved += rerank.tokens_saved
+
+        start = time.perf_counter()
+        prepared = []
+        for item, embedding, docs in zip(batch, embeddings, results):
+            prompt, used_docs, context = self.assistant.pack_prompt(item["question"], docs)
+            question = PreparedQuestion(
+                item, embedding, prompt, used_docs, context.prompt_tokens if context else 0
+            )
+            if prompt is not None:
+                cached = self.assistant.get_cached_answer(item["question"], used_docs, embedding)
+                if cached is not None:
+                    question.cached_answer = cached.answer
+            prepared.append(question)
+        stats.prompt_time += time.perf_counter() - start
+        return prepared
+
+    async def answer(self, question: PreparedQuestion, out: TextIO, stats: BatchStats):
+        item = question.item
+        record = {"id": item["id"], "question": item["question"]}
+        start = time.perf_counter()
+        if question.prompt is None:
+            answer = NO_RESULTS_ANSWER
+        elif question.cached_answer is not None:
+            answer = question.cached_answer
+            stats.cached += 1
+        else:
+            if not self._generating:
+                self._generating_since = time.perf_counter()
+            self._generating += 1
+            try:
+                answer = await self.async_assistant.query_ollama(question.prompt)
+            finally:
+                self._generating -= 1
+                if not self._generating:
+                    stats.generation_time += time.perf_counter() - self._generating_since
+            if not is_error_response(answer):
+                await self.async_assistant._run(
+                    self.assistant.cache_answer,
+                    item["question"],
+                    question.docs,
+                    answer,
+                    question.embedding,
+                )
+
+        if is_error_response(answer):
+            record["error"] = answer
+            stats.failed += 1
+        else:
+            record.update(
+                answer=answer,
+                sources=sorted(
+                    {doc["metadata"].get("filename", "Unknown") for doc in question.docs}
+                ),
+                cached=question.cached_answer is not None,
+                prompt_tokens=question.prompt_tokens,
+                seconds=round(time.perf_counter() - start, 3),
+            )
+            stats.answered += 1
+        # Only the event loop writes, so lines never interleave
+        out.write(json.dumps(record) + "\n")
+        out.flush()
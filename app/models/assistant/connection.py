@@ -1,5 +1,6 @@
 import os
 from models.config import Config
+from models.assistant.ollama_client import OllamaClient
 
 try:
     import requests
@@ -12,14 +13,8 @@ except ImportError:
 def check_ollama_connection(config: Config) -> bool:
     """Check if Ollama is running and model is available"""
     try:
-        # Check if Ollama is running
-        response = requests.get(f"{config.config['ollama_url']}/api/tags", timeout=5)
-        if response.status_code != 200:
-            return False
-
-        # Check if model is available
-        models = response.json().get("models", [])
-        model_names = [model["name"] for model in models]
+        # Check if Ollama is running and list installed models
+        model_names = OllamaClient.shared(config).list_models()
 
         if config.config["model_name"] not in model_names:
             print(f"Model '{config.config['model_name']}' not found.")
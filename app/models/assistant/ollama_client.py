@@ -0,0 +1,126 @@
+import os
+import json
+import threading
+from typing import Dict, Iterator, List
+from models.config import Config
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+except ImportError:
+    print("Requests not found. Installing...")
+    os.system("pip install requests")
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+
+class OllamaError(Exception):
+    """Ollama answered, but with an error instead of a result"""
+
+
+class OllamaClient:
+    """Ollama API client on a pooled keep-alive session
+
+    Connections are reused across questions, transient failures (5xx,
+    connection resets) are retried with exponential backoff, and
+    keep_alive is forwarded so Ollama keeps the model loaded between calls.
+    """
+
+    _shared: Dict[str, "OllamaClient"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.base_url = config.config["ollama_url"].rstrip("/")
+        self.timeout = (
+            config.config["ollama_connect_timeout"],
+            config.config["ollama_read_timeout"],
+        )
+        self.keep_alive = config.config["ollama_keep_alive"]
+
+        retries = config.config["ollama_retries"]
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=config.config["ollama_retry_backoff"],
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset({"GET", "POST"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=config.config["ollama_pool_size"],
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @classmethod
+    def shared(cls, config: Config) -> "OllamaClient":
+        """Return the process-wide client for the configured Ollama URL"""
+        key = config.config["ollama_url"]
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(config)
+            return cls._shared[key]
+
+    def build_payload(self, prompt: str, stream: bool) -> Dict:
+        return {
+            "model": self.config.config["model_name"],
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+            "options": {
+                "temperature": self.config.config["temperature"],
+                "num_predict": self.config.config["max_tokens"],
+                "num_ctx": self.config.config["context_window"],
+            },
+        }
+
+    def list_models(self) -> List[str]:
+        """Names of the models installed in Ollama"""
+        response = self.session.get(f"{self.base_url}/api/tags", timeout=self.timeout)
+        response.raise_for_status()
+        return [model["name"] for model in response.json().get("models", [])]
+
+    def generate(self, prompt: str) -> Dict:
+        """Run a blocking generation and return Ollama's final response object"""
+        response = self.session.post(
+            f"{self.base_url}/api/generate",
+            json=self.build_payload(prompt, stream=False),
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        result = response.json()
+        if "error" in result:
+            raise OllamaError(result["error"])
+        return result
+
+    def generate_stream(self, prompt: str) -> Iterator[Dict]:
+        """Yield the NDJSON objects of a streamed generation as they arrive
+
+        The body is read to the end rather than abandoned at "done", so the
+        connection goes back to the pool.
+        """
+        with self.session.post(
+            f"{self.base_url}/api/generate",
+            json=self.build_payload(prompt, stream=True),
+            timeout=self.timeout,
+            stream=True,
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise OllamaError(chunk["error"])
+                yield chunk
+
+    def close(self):
+        self.session.close()
@@ -1,30 +1,140 @@
+import re
+import copy
 import json
 from pathlib import Path
+from typing import List, Optional
+
+# Documents added without --collection; its indexes live directly in app_dir
+DEFAULT_COLLECTION = "documents"
+_COLLECTION_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]{0,62}")
+
+
+def check_collection_name(name: str) -> str:
+    """Validate a collection name, which doubles as a directory name"""
+    if not _COLLECTION_NAME.fullmatch(name) or name.endswith("."):
+        raise ValueError(
+            f"Invalid collection name {name!r}: use up to 63 letters, digits, "
+            "'_', '-' or '.', starting with a letter or digit"
+        )
+    return name
 
 
 class Config:
-    def __init__(self):
-        self.app_dir = Path.home() / ".local_lm_assistant"
-        self.db_path = self.app_dir / "vector_db"
-        self.sqlite_path = self.app_dir / "metadata.db"
+    def __init__(self, app_dir: Optional[Path] = None):
+        # app_dir lets benchmarks and tools work on a scratch database
+        self.app_dir = Path(app_dir) if app_dir else Path.home() / ".local_lm_assistant"
         self.config_path = self.app_dir / "config.json"
         self.logs_path = self.app_dir / "logs"
+        self.embedding_cache_path = self.app_dir / "embedding_cache"
+        self.collections_path = self.app_dir / "collections"
+        self.set_collection_paths(DEFAULT_COLLECTION, self.app_dir)
 
         # Default settings
         self.default_config = {
             "model_name": "llama2",  # Ollama model name
             "embedding_model": "all-MiniLM-L6-v2",
+            "embedding_batch_size": 64,
+            "normalize_embeddings": True,
+            "embedding_device": None,  # None = let SentenceTransformers pick
+            "embedding_cache": True,
+            "embedding_cache_max_mb": 512,
             "chunk_size": 1000,
             "chunk_overlap": 200,
             "max_results": 5,
+            "retrieval_mode": "hybrid",  # hybrid, vector or keyword
+            "retrieval_candidates": 20,  # per retriever, before hybrid fusion
+            "context_window": 4096,  # model context in tokens, sent as num_ctx
+            "context_max_tokens": 0,  # cap on document tokens; 0 = what the window allows
+            "context_dedup_similarity": 0.9,  # share of a passage already in context
+            "rerank": False,  # re-score retrieved chunks with a cross-encoder
+            "rerank_model": "cross-encoder/ms-marco-MiniLM-L-6-v2",
+            "rerank_candidates": 20,  # chunks retrieved and scored; max_results are kept
+            "rerank_batch_size": 32,
+            "rerank_cache_size": 10000,  # (question, chunk) scores kept in memory
+            "vector_store": "chroma",  # or "faiss"
+            "faiss_index_type": "hnsw",  # flat, ivf or hnsw
+            "faiss_nlist": 0,  # IVF lists; 0 = 4 * sqrt(chunks)
+            "faiss_nprobe": 16,
+            "faiss_hnsw_m": 32,
+            "faiss_ef_search": 64,
+            "faiss_quantization": "none",  # none, fp16, int8 or pq
+            "faiss_pq_m": 0,  # PQ codes per vector; 0 = one per 8 dimensions
+            "faiss_rerank_factor": 4,  # quantized candidates re-ranked per result
             "ollama_url": "http://localhost:11434",
+            "ollama_connect_timeout": 5,
+            "ollama_read_timeout": 60,
+            "ollama_retries": 2,
+            "ollama_retry_backoff": 0.5,
+            "ollama_pool_size": 10,
+            "ollama_keep_alive": "30m",  # keep the model loaded between questions
+            "ollama_max_concurrency": 2,  # generations in flight at once
+            "query_workers": 4,  # threads for query embedding and vector search
+            "batch_query_size": 32,  # questions embedded and searched together by --batch
             "temperature": 0.1,
             "max_tokens": 500,
+            "stream": True,  # print answers token by token
+            "search_cache": True,
+            "search_cache_max_mb": 64,
+            "answer_cache": True,
+            "answer_cache_ttl": 7 * 24 * 3600,  # seconds
+            "answer_cache_max_entries": 1000,
+            "answer_cache_similarity": 0.95,  # cosine for near-duplicates; 1 = exact only
+            "ingest_workers": 0,  # 0 = one loader process per CPU
+            "ingest_queue_size": 32,
+            "ingest_batch_size": 256,
+            "ingest_stream_threshold_mb": 64,  # larger files are streamed, not pooled
+            "loader_plugins": [],  # modules that register extra document loaders
+            "server_host": "127.0.0.1",
+            "server_port": 8765,
+            "server_max_concurrency": 4,  # requests handled at once
+            "server_max_queue": 32,  # requests allowed to wait for a slot
+            "server_queue_timeout": 30,
+            "watch_debounce": 2.0,  # seconds of quiet before a batch is synced
+            "watch_poll_interval": 5.0,
+            "watch_polling": False,  # force polling even if watchdog is installed
+            "trace_log": False,  # log every timed stage to logs/trace_*.jsonl
+            "metrics_file": None,  # Prometheus textfile with stage timings, written on exit
         }
 
         self.ensure_directories()
         self.load_config()
 
+    def set_collection_paths(self, name: str, collection_dir: Path):
+        """Point the index paths (vectors, metadata, answers) at a collection"""
+        self.collection = name
+        self.collection_dir = collection_dir
+        self.db_path = collection_dir / "vector_db"
+        self.sqlite_path = collection_dir / "metadata.db"
+        self.answer_cache_path = collection_dir / "answer_cache.db"
+        self.faiss_path = collection_dir / "faiss_index"
+
+    def for_collection(self, name: str, create: bool = False) -> "Config":
+        """This configuration with its index paths scoped to a named collection
+
+        Settings, logs and the embedding cache stay shared. Each collection
+        other than the default one lives in collections/<name>.
+        """
+        check_collection_name(name)
+        scoped = copy.copy(self)
+        if name == DEFAULT_COLLECTION:
+            scoped.set_collection_paths(name, self.app_dir)
+        else:
+            scoped.set_collection_paths(name, self.collections_path / name)
+            if create:
+                scoped.collection_dir.mkdir(parents=True, exist_ok=True)
+        return scoped
+
+    def collection_names(self) -> List[str]:
+        """The default collection followed by every created one, by name"""
+        names = []
+        if self.collections_path.is_dir():
+            names = sorted(
+                path.name
+                for path in self.collections_path.iterdir()
+                if path.is_dir() and _COLLECTION_NAME.fullmatch(path.name)
+            )
+        return [DEFAULT_COLLECTION] + [name for name in names if name != DEFAULT_COLLECTION]
+
     def ensure_directories(self):
         """Create necessary directories"""
         self.app_dir.mkdir(exist_ok=True)
@@ -34,7 +144,8 @@ class Config:
         """Load configuration from file or create default"""
         if self.config_path.exists():
             with open(self.config_path, "r") as f:
-                self.config = json.load(f)
+                # Fill in settings added after the config file was written
+                self.config = {**self.default_config, **json.load(f)}
         else:
             self.config = self.default_config.copy()
             self.save_config()
@@ -0,0 +1,186 @@
+import re
+import math
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Tuple
+from models.config import Config
+
+# Characters per token for English text with LLaMA-style tokenizers; on the
+# low side, so estimates err towards more tokens and packed prompts fit
+CHARS_PER_TOKEN = 3.5
+# Shortest text shared by neighbouring chunks that counts as their overlap
+MIN_OVERLAP_CHARS = 20
+# Passages are compared as sets of word n-grams of this length
+SHINGLE_SIZE = 3
+# A passage cut shorter than this to fit the budget is dropped instead
+MIN_PASSAGE_TOKENS = 32
+PASSAGE_SEPARATOR = "\n\n"
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def merge_overlap(first: str, second: str) -> str:
+    """Join consecutive chunks of a file, keeping the text they share once"""
+    probe = second[:MIN_OVERLAP_CHARS]
+    if len(probe) == MIN_OVERLAP_CHARS:
+        # The earliest start whose tail of `first` begins `second` is the overlap
+        start = first.find(probe, max(0, len(first) - len(second)))
+        while start != -1:
+            if second.startswith(first[start:]):
+                return first[:start] + second
+            start = first.find(probe, start + 1)
+    return first + "\n" + second
+
+
+def shingles(text: str) -> FrozenSet[Tuple[str, ...]]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return frozenset([tuple(words)])
+    return frozenset(
+        tuple(words[i : i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)
+    )
+
+
+@dataclass
+class Passage:
+    """Consecutive retrieved chunks of one file, merged into one text"""
+
+    filename: str
+    text: str
+    rank: int  # best retrieval rank among its chunks
+    chunks: List[Dict] = field(default_factory=list)
+
+    def render(self) -> str:
+        return f"Document: {self.filename}\n{self.text}"
+
+
+@dataclass
+class ContextStats:
+    """What happened to the retrieved chunks on the way into the prompt"""
+
+    chunks: int = 0
+    passages: int = 0
+    merged: int = 0
+    duplicates: int = 0
+    over_budget: int = 0
+    truncated: int = 0
+    budget: int = 0
+    context_tokens: int = 0
+    prompt_tokens: int = 0
+
+    def report(self) -> str:
+        return (
+            f"context: {self.chunks} chunks -> {self.passages} passages "
+            f"({self.merged} merged, {self.duplicates} duplicates, "
+            f"{self.over_budget} over budget, {self.truncated} truncated), "
+            f"~{self.prompt_tokens} prompt tokens, "
+            f"{self.context_tokens}/{self.budget} for documents"
+        )
+
+
+class ContextBuilder:
+    """Pack retrieved chunks into a prompt context within a token budget
+
+    Chunks of the same file with consecutive chunk_index are merged, with
+    the overlap the splitter repeated between them kept once. Passages whose
+    text is mostly covered by a better-ranked passage are dropped. What is
+    left is added best rank first until the budget runs out; the passage
+    that crosses it is cut short.
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+
+    def token_budget(self, reserved_tokens: int) -> int:
+        """Tokens left for documents once the answer and the rest of the prompt fit"""
+        budget = (
+            self.config.config["context_window"]
+            - self.config.config["max_tokens"]
+            - reserved_tokens
+        )
+        if self.config.config["context_max_tokens"]:
+            budget = min(budget, self.config.config["context_max_tokens"])
+        return max(budget, 0)
+
+    def merge(self, docs: List[Dict]) -> Tuple[List[Passage], int]:
+        """Merge consecutive chunks per file; returns passages by rank and merge count"""
+        by_file: Dict[str, List[Tuple[int, Dict]]] = {}
+        for rank, doc in enumerate(docs):
+            filepath = doc["metadata"].get("filepath") or doc["id"]
+            by_file.setdefault(filepath, []).append((rank, doc))
+
+        passages = []
+        merged = 0
+        for ranked in by_file.values():
+            ranked.sort(key=lambda item: item[1]["metadata"].get("chunk_index", -1))
+            current = None
+            previous_index = None
+            for rank, doc in ranked:
+                chunk_index = doc["metadata"].get("chunk_index")
+                if (
+                    current is not None
+                    and chunk_index is not None
+                    and previous_index is not None
+                    and chunk_index <= previous_index + 1
+                ):
+                    if chunk_index == previous_index + 1:
+                        current.text = merge_overlap(current.text, doc["content"])
+                    current.rank = min(current.rank, rank)
+                    current.chunks.append(doc)
+                    merged += 1
+                else:
+                    current = Passage(
+                        doc["metadata"].get("filename", "Unknown"),
+                        doc["content"],
+                        rank,
+                        [doc],
+                    )
+                    passages.append(current)
+                previous_index = chunk_index
+        passages.sort(key=lambda passage: passage.rank)
+        return passages, merged
+
+    def deduplicate(self, passages: List[Passage]) -> Tuple[List[Passage], int]:
+        """Drop passages mostly contained in a better-ranked one"""
+        threshold = self.config.config["context_dedup_similarity"]
+        kept: List[Tuple[Passage, FrozenSet]] = []
+        for passage in passages:
+            grams = shingles(passage.text)
+            if not any(
+                len(grams & kept_grams) >= threshold * len(grams)
+                for _, kept_grams in kept
+            ):
+                kept.append((passage, grams))
+        return [passage for passage, _ in kept], len(passages) - len(kept)
+
+    def build(self, docs: List[Dict], reserved_tokens: int) -> Tuple[str, List[Dict], ContextStats]:
+        """Context text, the chunks it includes and packing statistics"""
+        stats = ContextStats(chunks=len(docs), budget=self.token_budget(reserved_tokens))
+        passages, stats.merged = self.merge(docs)
+        passages, stats.duplicates = self.deduplicate(passages)
+
+        separator_tokens = estimate_tokens(PASSAGE_SEPARATOR)
+        parts: List[str] = []
+        used: List[Dict] = []
+        for i, passage in enumerate(passages):
+            remaining = stats.budget - stats.context_tokens - (separator_tokens if parts else 0)
+            text = passage.render()
+            tokens = estimate_tokens(text)
+            if tokens > remaining:
+                if remaining < MIN_PASSAGE_TOKENS:
+                    stats.over_budget = len(passages) - i
+                    break
+                # Cut at a word boundary within the remaining budget
+                text = text[: int(remaining * CHARS_PER_TOKEN) - 4].rsplit(None, 1)[0] + " ..."
+                tokens = estimate_tokens(text)
+                stats.truncated += 1
+                stats.over_budget = len(passages) - i - 1
+            parts.append(text)
+            used.extend(passage.chunks)
+            stats.context_tokens += tokens + (separator_tokens if len(parts) > 1 else 0)
+            if stats.truncated:
+                break
+
+        stats.passages = len(parts)
+        return PASSAGE_SEPARATOR.join(parts), used, stats
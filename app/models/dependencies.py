@@ -0,0 +1,20 @@
+import os
+import importlib
+from types import ModuleType
+from typing import Optional
+
+
+def require(module: str, package: Optional[str] = None) -> ModuleType:
+    """Import a heavy dependency on first use, installing it if missing
+
+    Keeps chromadb, sentence-transformers and friends out of module import
+    time, so commands that don't need them start instantly.
+    """
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        package = package or module.split(".")[0]
+        print(f"{package} not found. Installing...")
+        os.system(f"pip install {package}")
+        importlib.invalidate_caches()
+        return importlib.import_module(module)
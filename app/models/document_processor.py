@@ -1,180 +1,672 @@
 import os
+import time
 import sqlite3
 import hashlib
+import itertools
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
 from models.config import Config
+from models.embeddings import EmbeddingEngine
+from models.embedding_cache import EmbeddingCache
+from models.dependencies import require
+from models.vector_store import create_vector_store
+from models.lexical_index import LexicalIndex
+from models.filters import check_tag, file_type, stored_tags, tag_fields
+from models.metadata_store import Chunk, MetadataStore, chunk_hash, file_signature
+from models.loaders import (
+    Loader,
+    UnsupportedFileError,
+    find_loader,
+    get_loader,
+    is_supported,
+    load_plugins,
+)
+from models.tracing import tracer
 
-# Core dependencies
-try:
-    import chromadb
-    from chromadb.config import Settings
-except ImportError:
-    print("ChromaDB not found. Installing...")
-    os.system("pip install chromadb")
-    import chromadb
-    from chromadb.config import Settings
+import numpy as np
 
-try:
-    from sentence_transformers import SentenceTransformer
-except ImportError:
-    print("SentenceTransformers not found. Installing...")
-    os.system("pip install sentence-transformers")
-    from sentence_transformers import SentenceTransformer
 
-# Todo fix imports
+# Optional: much faster than the BLAKE2 fallback for change detection
 try:
-    from langchain.text_splitter import RecursiveCharacterTextSplitter
-    from langchain_community.document_loaders import TextLoader, PyPDFLoader
+    import xxhash
 except ImportError:
-    print("LangChain not found. Installing...")
-    os.system("pip install langchain pypdf")
-    from langchain.text_splitter import RecursiveCharacterTextSplitter
-    from langchain_community.document_loaders import TextLoader, PyPDFLoader
+    xxhash = None
+
+
+HASH_BUFFER_SIZE = 1024 * 1024
+# Continuous text is split this many characters at a time
+TEXT_WINDOW_CHARS = 1024 * 1024
+
+
+def _split_text(splitter, text: str, offset: int, chunk_overlap: int) -> List[Chunk]:
+    """Split text into chunks, locating each one to record its offsets"""
+    chunks = []
+    search_from = 0
+    for piece in splitter.split_text(text):
+        start = text.find(piece, search_from)
+        if start < 0:
+            start = search_from
+        chunks.append(Chunk(piece, offset + start, offset + start + len(piece)))
+        # The next chunk overlaps this one by at most chunk_overlap characters
+        search_from = max(start + 1, start + len(piece) - chunk_overlap)
+    return chunks
+
+
+def _iter_text_chunks(
+    blocks: Iterator[str], splitter, chunk_size: int, chunk_overlap: int
+) -> Iterator[Chunk]:
+    """Split continuous text a window at a time, so it is never fully in memory
+
+    Chunks ending near the end of a window are split again with the next
+    window, since the text after them may change where they end. Text
+    that fits one window is split exactly as a whole.
+    """
+    window = max(TEXT_WINDOW_CHARS, 8 * chunk_size)
+    buffer, offset = "", 0
+    while True:
+        block = next(blocks, None)
+        if block is not None:
+            buffer += block
+            if len(buffer) < window:
+                continue
+        chunks = _split_text(splitter, buffer, offset, chunk_overlap)
+        if block is None:
+            yield from chunks
+            return
+        settled = offset + len(buffer) - chunk_size
+        ready = [chunk for chunk in chunks if chunk.end <= settled]
+        yield from ready
+        # Only whitespace may follow the last chunk; it is never part of one
+        resume = chunks[len(ready)].start if len(ready) < len(chunks) else settled
+        buffer, offset = buffer[resume - offset :], resume
+
 
+def _iter_page_chunks(pages: Iterator[str], splitter, chunk_overlap: int) -> Iterator[Chunk]:
+    """Split page by page; offsets count the text of earlier pages"""
+    offset = 0
+    for page in pages:
+        yield from _split_text(splitter, page, offset, chunk_overlap)
+        offset += len(page)
+
+
+def iter_chunks(
+    filepath: str, chunk_size: int, chunk_overlap: int, loader: Optional[Loader] = None
+) -> Iterator[Chunk]:
+    """Load a document and yield its chunks as they are split
+
+    Raises UnsupportedFileError right away when no loader can read the file.
+    """
+    loader = loader or find_loader(filepath)
+    # Todo fix imports
+    splitters = require("langchain.text_splitter", "langchain")
+    text_splitter = splitters.RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
+    blocks = iter(loader.load(filepath))
+    if loader.paged:
+        return _iter_page_chunks(blocks, text_splitter, chunk_overlap)
+    return _iter_text_chunks(blocks, text_splitter, chunk_size, chunk_overlap)
+
+
+def load_and_split(
+    filepath: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    loader_name: Optional[str] = None,
+    plugins: Tuple[str, ...] = (),
+) -> List[Chunk]:
+    """Load a document and split it into chunks
+
+    Module-level so it can run inside ingestion worker processes, which
+    load the plugins themselves in case they were spawned rather than forked.
+    """
+    load_plugins(plugins)
+    loader = get_loader(loader_name) if loader_name else None
+    return list(iter_chunks(filepath, chunk_size, chunk_overlap, loader))
+
+
+@dataclass
+class SyncStats:
+    """Counters for an incremental sync"""
+
+    files_updated: int = 0
+    files_unchanged: int = 0
+    files_removed: int = 0
+    files_failed: int = 0
+    files_unsupported: int = 0
+    skipped_by_stat: int = 0
+    files_hashed: int = 0
+    bytes_hashed: int = 0
+    chunks_added: int = 0
+    chunks_removed: int = 0
+    chunks_kept: int = 0
+
+    def report(self) -> str:
+        return (
+            f"Synced {self.files_updated} changed files "
+            f"({self.files_unchanged} unchanged, {self.files_removed} removed, "
+            f"{self.files_unsupported} unsupported, "
+            f"{self.files_failed} failed): +{self.chunks_added} "
+            f"-{self.chunks_removed} chunks, {self.chunks_kept} reused\n"
+            f"Skipped by stat: {self.skipped_by_stat}, hashed: {self.files_hashed} "
+            f"({self.bytes_hashed / 1e6:.1f} MB)"
+        )
 
-# Configuration
+
+class FileCheck(NamedTuple):
+    """What DocumentProcessor.check_file decided about a file
+
+    action is one of:
+      unchanged    recorded stat signature matches; the file was not read
+      unsupported  no loader for its content
+      same_hash    touched but not modified; its stat signature was refreshed
+      duplicate    a new path whose content is already indexed
+      index        new or changed content to index
+    file_hash is set once the file was hashed, loader once it is supported.
+    """
+
+    action: str
+    file_stat: os.stat_result
+    existing: Optional[sqlite3.Row]
+    file_hash: Optional[str] = None
+    loader: Optional[Loader] = None
 
 
 class DocumentProcessor:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, tags: Iterable[str] = ()):
+        """`tags` are recorded on every file indexed, for filtering searches"""
         self.config = config
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=config.config["chunk_size"],
-            chunk_overlap=config.config["chunk_overlap"],
+        self.tags = tuple(sorted({check_tag(tag) for tag in tags}))
+        load_plugins(config.config["loader_plugins"])
+
+        # Shared embedding model, loaded on first encode
+        self.embedder = EmbeddingEngine.shared(config)
+        self.embedding_cache = (
+            EmbeddingCache.for_model(config) if config.config["embedding_cache"] else None
         )
 
-        # Initialize embedding model
-        self.embedding_model = SentenceTransformer(config.config["embedding_model"])
+        # Chunk vectors, text and metadata (ChromaDB or FAISS)
+        self.vector_store = create_vector_store(config)
 
-        # Initialize ChromaDB
-        self.chroma_client = chromadb.PersistentClient(
-            path=str(config.db_path), settings=Settings(anonymized_telemetry=False)
-        )
+        # Document and chunk metadata plus the keyword index, all in metadata.db
+        self.metadata = MetadataStore(config.sqlite_path)
+        self.metadata.init_db()
+        self.lexical_index = LexicalIndex(self.metadata)
+        self.lexical_index.init_db()
+        # Documents rows wait here until flush() has saved their vectors
+        self._pending_documents: Dict[str, Tuple] = {}
+        self._pending_lock = threading.Lock()
+        self.warn_if_index_missing()
 
-        # Initialize SQLite for metadata
-        self.init_sqlite()
-
-    def init_sqlite(self):
-        """Initialize SQLite database for document metadata"""
-        conn = sqlite3.connect(self.config.sqlite_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS documents (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                filename TEXT NOT NULL,
-                filepath TEXT NOT NULL,
-                file_hash TEXT UNIQUE NOT NULL,
-                processed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                chunk_count INTEGER
+    def warn_if_index_missing(self):
+        """Documents recorded against an empty store (e.g. after switching
+        vector_store) would otherwise be skipped as already processed"""
+        chunk_count = self.vector_store.count()
+        if chunk_count:
+            if not self.lexical_index.count():
+                print(
+                    "Note: documents added before keyword search existed are only "
+                    "found by vector search. Run --reset and add them again to "
+                    "index them for keyword search."
+                )
+            return
+        recorded = self.metadata.count_documents()
+        if recorded:
+            print(
+                f"Warning: {recorded} documents are recorded but the "
+                f"'{self.config.config['vector_store']}' vector store is empty. "
+                "Run --reset and add them again."
             )
-        """)
-        conn.commit()
-        conn.close()
 
     def get_file_hash(self, filepath: str) -> str:
         """Generate hash for file to detect changes"""
-        hasher = hashlib.md5()
-        with open(filepath, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hasher.update(chunk)
+        hasher = xxhash.xxh3_128() if xxhash else hashlib.blake2b(digest_size=16)
+        buffer = bytearray(HASH_BUFFER_SIZE)
+        view = memoryview(buffer)
+        with tracer.span("ingest.hash"), open(filepath, "rb", buffering=0) as f:
+            while True:
+                size = f.readinto(buffer)
+                if not size:
+                    break
+                hasher.update(view[:size])
         return hasher.hexdigest()
 
-    def is_document_processed(self, filepath: str) -> bool:
-        """Check if document is already processed"""
+    def find_loader(self, filepath: str) -> Optional[Loader]:
+        """The loader for a file, or None (with a note) if it is not supported"""
+        try:
+            return find_loader(filepath)
+        except UnsupportedFileError as e:
+            print(f"Skipping {filepath}: {e}")
+            return None
+
+    def is_unchanged(self, document: Optional[sqlite3.Row], file_stat: os.stat_result) -> bool:
+        """True when a documents (or skipped) row's recorded stat matches the file"""
+        if document is None:
+            return False
+        recorded = (document["file_size"], document["mtime_ns"], document["inode"])
+        return recorded == file_signature(file_stat)
+
+    def check_file(self, filepath: str, seen_hashes: Optional[Set[str]] = None) -> FileCheck:
+        """Decide whether a file needs indexing, reading as little of it as possible
+
+        The stat signature is checked first, then the loader sniffs the first
+        few KB, and only then is the whole file hashed. Hashes in
+        `seen_hashes` count as indexed, and the hash of a file to index is
+        added to it. Raises OSError if the file can't be read.
+        """
+        file_stat = os.stat(filepath)
+        existing = self.get_document(filepath)
+        if self.is_unchanged(existing, file_stat):
+            return FileCheck("unchanged", file_stat, existing)
+        if existing is None:
+            # A copy skipped before stays skipped while its content is indexed
+            skipped = self.metadata.get_skipped(filepath)
+            if self.is_unchanged(skipped, file_stat) and self.is_hash_processed(
+                skipped["file_hash"]
+            ):
+                return FileCheck("unchanged", file_stat, existing)
+
+        loader = self.find_loader(filepath)
+        if loader is None:
+            return FileCheck("unsupported", file_stat, existing)
+
         file_hash = self.get_file_hash(filepath)
-        conn = sqlite3.connect(self.config.sqlite_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM documents WHERE file_hash = ?", (file_hash,))
-        result = cursor.fetchone()
-        conn.close()
-        return result is not None
+        if existing is not None and existing["file_hash"] == file_hash:
+            self.update_file_stat(filepath, file_stat)
+            return FileCheck("same_hash", file_stat, existing, file_hash, loader)
+        # Only new paths are skipped as copies; an indexed file edited to
+        # match another one still has its old chunks replaced
+        if existing is None and (
+            (seen_hashes is not None and file_hash in seen_hashes)
+            or self.is_hash_processed(file_hash)
+        ):
+            self.metadata.record_skipped(filepath, file_hash, file_stat)
+            return FileCheck("duplicate", file_stat, existing, file_hash, loader)
+
+        if seen_hashes is not None:
+            seen_hashes.add(file_hash)
+        return FileCheck("index", file_stat, existing, file_hash, loader)
+
+    def is_hash_processed(self, file_hash: str) -> bool:
+        """Check if a document with this content hash is already processed"""
+        with self._pending_lock:
+            if any(row[1] == file_hash for row in self._pending_documents.values()):
+                return True
+        return self.metadata.is_hash_processed(file_hash)
+
+    def record_documents(self, rows: List[Tuple]):
+        """Queue (filepath, file_hash, chunk_count, file_stat) rows for flush()
+
+        A file is only recorded as indexed once its vectors are saved, so a
+        crash before flush() leaves it to be indexed again rather than
+        skipped with its chunks missing from search.
+        """
+        with self._pending_lock:
+            for row in rows:
+                self._pending_documents[row[0]] = row
+
+    def delete_document(self, filepath: str):
+        """Drop a document's row, and any row still waiting for flush()"""
+        with self._pending_lock:
+            self._pending_documents.pop(filepath, None)
+        with self.metadata.transaction() as cursor:
+            self.metadata.delete_document(cursor, filepath)
+
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        """Embed chunk texts, reusing cached vectors for unchanged chunks"""
+        with tracer.span("ingest.embed", chunks=len(texts)):
+            if self.embedding_cache is None:
+                return self.embedder.encode(texts)
+            return self.embedding_cache.encode(texts, self.embedder.encode)
+
+    @contextmanager
+    def tagging(self, tags: Iterable[str]):
+        """Record `tags` on the files indexed inside the block"""
+        previous = self.tags
+        self.tags = tuple(sorted({check_tag(tag) for tag in tags}))
+        try:
+            yield
+        finally:
+            self.tags = previous
+
+    def document_fields(self, filepath: str, stored: Optional[Dict[str, Dict]] = None) -> Dict:
+        """Metadata shared by all chunks of a file, for filtering searches
+
+        A file indexed before keeps its first ingest time and, unless tags
+        were given this time, its tags.
+        """
+        previous = next(iter(stored.values()), {}) if stored else {}
+        return {
+            "file_type": file_type(filepath),
+            "ingested_at": previous.get("ingested_at", int(time.time())),
+            **tag_fields(self.tags or stored_tags(previous)),
+        }
+
+    def build_chunk_records(
+        self,
+        filepath: str,
+        chunk_texts: List[str],
+        first_index: int = 0,
+        occurrences: Optional[Dict[str, int]] = None,
+        fields: Optional[Dict] = None,
+    ) -> Tuple[List[str], List[Dict]]:
+        """Build Chroma ids and metadatas for the chunks of one document
+
+        Ids combine the file path with the chunk content hash, so an edited
+        file keeps the ids of its unchanged chunks. A document built in
+        batches passes the index of the batch's first chunk and the same
+        `occurrences` dict and `fields` (see document_fields) for every batch.
+        """
+        if fields is None:
+            fields = self.document_fields(filepath)
+        file_path = Path(filepath)
+        path_key = hashlib.sha1(str(file_path).encode("utf-8")).hexdigest()[:16]
+        occurrences = {} if occurrences is None else occurrences
+        chunk_ids = []
+        for text in chunk_texts:
+            text_hash = chunk_hash(text)
+            seen = occurrences.get(text_hash, 0)
+            occurrences[text_hash] = seen + 1
+            # Repeated text within one file (boilerplate) still needs unique ids
+            chunk_ids.append(
+                f"{path_key}_{text_hash}" if seen == 0 else f"{path_key}_{text_hash}_{seen}"
+            )
+
+        chunk_metadatas = [
+            {
+                "filename": file_path.name,
+                "filepath": str(file_path),
+                "chunk_index": first_index + i,
+                "source": str(file_path),
+                **fields,
+            }
+            for i in range(len(chunk_texts))
+        ]
+        return chunk_ids, chunk_metadatas
+
+    def add_vectors(
+        self, ids: List[str], texts: List[str], embeddings: np.ndarray, metadatas: List[Dict]
+    ):
+        """Add chunks to the vector store in bounded slices
+
+        Their keyword index entries are written by the caller, in the same
+        metadata.db transaction as their chunk rows.
+        """
+        step = self.config.config["ingest_batch_size"]
+        for start in range(0, len(ids), step):
+            end = start + step
+            with tracer.span("ingest.vector_write", chunks=len(ids[start:end])):
+                self.vector_store.add(
+                    ids[start:end], embeddings[start:end], texts[start:end], metadatas[start:end]
+                )
+
+    def delete_chunks(self, ids: List[str]):
+        """Remove chunks from the vector store, keyword index and chunk table"""
+        self.vector_store.delete(ids)
+        with self.metadata.transaction() as cursor:
+            self.lexical_index.delete(cursor, ids)
+            self.metadata.delete_chunks(cursor, ids)
+
+    def get_document(self, filepath: str) -> Optional[sqlite3.Row]:
+        """Return the documents row for a path, if any"""
+        return self.metadata.get_document(filepath)
+
+    def update_file_stat(self, filepath: str, file_stat: os.stat_result):
+        """Refresh the stat index for a file whose content did not change"""
+        self.metadata.update_file_stat(filepath, file_stat)
+
+    def get_file_index(self, directory: str) -> Dict[str, Tuple[int, int, int]]:
+        """Map indexed paths under a directory to their recorded stat signature"""
+        return self.metadata.file_index(directory)
 
     def process_document(self, filepath: str) -> int:
         """Process a single document and add to vector database"""
-        if self.is_document_processed(filepath):
+        with tracer.span("ingest.document"):
+            return self._process_document(filepath)
+
+    def _process_document(self, filepath: str) -> int:
+        filepath = str(Path(filepath).resolve())
+        check = self.check_file(filepath)
+        if check.action in ("unchanged", "same_hash"):
             print(f"Document {filepath} already processed, skipping...")
             return 0
+        if check.action == "duplicate":
+            print(f"Document {filepath} duplicates an indexed file, skipping...")
+            return 0
+        if check.action == "unsupported":
+            return 0
+
+        # A known path with new content is updated chunk by chunk
+        if check.existing is not None:
+            stats = self.index_file(
+                filepath,
+                check.file_stat,
+                check.file_hash,
+                check.existing,
+                SyncStats(),
+                check.loader,
+            )
+            self.flush()
+            return stats.chunks_added
 
         print(f"Processing document: {filepath}")
+        stats = self.index_file(
+            filepath, check.file_stat, check.file_hash, None, SyncStats(), check.loader
+        )
+        if stats.files_failed:
+            return 0
+        if not stats.files_updated:
+            print(f"No text content found in {filepath}")
+            return 0
+        self.flush()
 
-        # Load document based on file type
-        file_path = Path(filepath)
-        if file_path.suffix.lower() == ".pdf":
-            loader = PyPDFLoader(filepath)
-        else:
-            loader = TextLoader(filepath, encoding="utf-8")
+        chunk_count = stats.chunks_added + stats.chunks_kept
+        print(f"Successfully processed {chunk_count} chunks from {filepath}")
+        return chunk_count
+
+    def sync_document(self, filepath: str, stats: Optional[SyncStats] = None) -> SyncStats:
+        """Bring one file's chunks in line with its current content
+
+        Only chunks whose content is new are embedded and added; chunks that
+        disappeared are deleted and chunks that moved get their index updated.
+        """
+        stats = stats or SyncStats()
+        filepath = str(Path(filepath).resolve())
+        check = self.check_file(filepath)
+        if check.action == "unchanged":
+            stats.files_unchanged += 1
+            stats.skipped_by_stat += 1
+            return stats
+        if check.action == "unsupported":
+            stats.files_unsupported += 1
+            return stats
+
+        stats.files_hashed += 1
+        stats.bytes_hashed += check.file_stat.st_size
+        if check.action == "duplicate":
+            print(f"Document {filepath} duplicates an indexed file, skipping...")
+        if check.action != "index":
+            stats.files_unchanged += 1
+            return stats
+
+        return self.index_file(
+            filepath, check.file_stat, check.file_hash, check.existing, stats, check.loader
+        )
+
+    def index_file(
+        self,
+        filepath: str,
+        file_stat: os.stat_result,
+        file_hash: str,
+        existing: Optional[sqlite3.Row],
+        stats: SyncStats,
+        loader: Optional[Loader] = None,
+    ) -> SyncStats:
+        """Stream a file's chunks into the index, embedding only new content
+
+        Chunks are split, embedded and written `ingest_batch_size` at a time,
+        so memory stays bounded however large the file is. Chunks already
+        stored for the path are kept, those that moved get their index
+        updated and those that disappeared are deleted at the end.
+        """
+        stored = self.vector_store.get_metadatas(filepath)
+        fields = self.document_fields(filepath, stored)
+        new_ids = set()
+        # Chunks this attempt added, rolled back if the file fails partway
+        written: List[str] = []
+        occurrences: Dict[str, int] = {}
+        chunk_count = added = 0
+        batch_size = self.config.config["ingest_batch_size"]
 
         try:
-            documents = loader.load()
+            chunks = iter_chunks(
+                filepath,
+                self.config.config["chunk_size"],
+                self.config.config["chunk_overlap"],
+                loader,
+            )
+            while True:
+                with tracer.span("ingest.load"):
+                    batch = list(itertools.islice(chunks, batch_size))
+                if not batch:
+                    break
+                chunk_texts = [chunk.text for chunk in batch]
+                chunk_ids, chunk_metadatas = self.build_chunk_records(
+                    filepath, chunk_texts, chunk_count, occurrences, fields
+                )
+                new_ids.update(chunk_ids)
+                chunk_count += len(batch)
+
+                # Kept chunks that moved, were retagged or predate filter fields
+                changed = [
+                    i
+                    for i, chunk_id in enumerate(chunk_ids)
+                    if chunk_id in stored and stored[chunk_id] != chunk_metadatas[i]
+                ]
+                changed_ids = [chunk_ids[i] for i in changed]
+                changed_metadatas = [chunk_metadatas[i] for i in changed]
+                if changed:
+                    self.vector_store.update_metadatas(changed_ids, changed_metadatas)
+
+                new = [i for i, chunk_id in enumerate(chunk_ids) if chunk_id not in stored]
+                added_ids = [chunk_ids[i] for i in new]
+                added_texts = [chunk_texts[i] for i in new]
+                added_metadatas = [chunk_metadatas[i] for i in new]
+                if new:
+                    self.add_vectors(
+                        added_ids, added_texts, self.embed_texts(added_texts), added_metadatas
+                    )
+                    written.extend(added_ids)
+                    added += len(new)
+
+                # The batch's keyword entries and chunk rows commit together
+                with self.metadata.transaction() as cursor:
+                    self.lexical_index.update_metadatas(cursor, changed_ids, changed_metadatas)
+                    with tracer.span("ingest.keyword_write", chunks=len(added_ids)):
+                        self.lexical_index.add(cursor, added_ids, added_texts, added_metadatas)
+                    self.metadata.record_chunks(cursor, chunk_ids, batch, chunk_metadatas)
         except Exception as e:
             print(f"Error loading {filepath}: {e}")
-            return 0
+            # The file is not recorded, so it is indexed again next time; its
+            # partial chunks must not stay behind, or a later flush would
+            # save them and the retry would take them as already stored
+            if written:
+                self.delete_chunks(written)
+            stats.files_failed += 1
+            return stats
 
-        # Split documents into chunks
-        texts = self.text_splitter.split_documents(documents)
+        if not chunk_count and existing is None:
+            stats.files_unchanged += 1
+            return stats
 
-        if not texts:
-            print(f"No text content found in {filepath}")
-            return 0
+        stale = [chunk_id for chunk_id in stored if chunk_id not in new_ids]
+        if stale:
+            self.delete_chunks(stale)
 
-        # Prepare data for ChromaDB
-        collection_name = "documents"
-        try:
-            collection = self.chroma_client.get_collection(collection_name)
-        except:
-            collection = self.chroma_client.create_collection(
-                name=collection_name,
-                metadata={"description": "Document chunks for RAG"},
+        # Update the documents row in place
+        if chunk_count:
+            self.record_documents([(filepath, file_hash, chunk_count, file_stat)])
+        else:
+            self.delete_document(filepath)
+
+        stats.files_updated += 1
+        stats.chunks_added += added
+        stats.chunks_removed += len(stale)
+        stats.chunks_kept += chunk_count - added
+        if existing is not None:
+            print(
+                f"Synced {filepath}: +{added} -{len(stale)} chunks, "
+                f"{chunk_count - added} unchanged"
             )
+        return stats
 
-        # Generate embeddings and add to collection
-        chunk_texts = [doc.page_content for doc in texts]
-        chunk_metadatas = []
-        chunk_ids = []
+    def flush(self):
+        """Persist pending vector store writes, record their documents, then
+        invalidate search caches
 
-        for i, doc in enumerate(texts):
-            chunk_id = f"{file_path.stem}_{i}"
-            chunk_ids.append(chunk_id)
-            chunk_metadatas.append(
-                {
-                    "filename": file_path.name,
-                    "filepath": str(file_path),
-                    "chunk_index": i,
-                    "source": str(file_path),
-                }
-            )
+        The generation is bumped even without new documents, because a reader
+        may have cached results while chunk writes were pending.
+        """
+        with tracer.span("ingest.flush"):
+            self.vector_store.flush()
+            with self._pending_lock:
+                rows = list(self._pending_documents.values())
+                self._pending_documents.clear()
+            with self.metadata.transaction() as cursor:
+                if rows:
+                    self.metadata.record_documents(cursor, rows)
+                self.metadata.bump_generation(cursor)
 
-        # Add to ChromaDB
-        collection.add(documents=chunk_texts, metadatas=chunk_metadatas, ids=chunk_ids)
+    def remove_document(self, filepath: str) -> int:
+        """Delete a document's chunks and metadata row"""
+        filepath = str(filepath)
+        stored_ids = list(self.vector_store.get_metadatas(filepath))
+        self.delete_chunks(stored_ids)
+        self.delete_document(filepath)
+        return len(stored_ids)
 
-        # Record in SQLite
-        file_hash = self.get_file_hash(filepath)
-        conn = sqlite3.connect(self.config.sqlite_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO documents (filename, filepath, file_hash, chunk_count)
-            VALUES (?, ?, ?, ?)
-        """,
-            (file_path.name, str(file_path), file_hash, len(texts)),
-        )
-        conn.commit()
-        conn.close()
+    def sync_directory(self, directory: str) -> SyncStats:
+        """Incrementally sync a directory, removing documents that no longer exist"""
+        stats = SyncStats()
+        directory_path = Path(directory).resolve()
+
+        # Removed first, so a copy of a deleted or renamed file is not
+        # skipped as a duplicate of it
+        for filepath in self.metadata.document_paths(str(directory_path)):
+            if not Path(filepath).exists():
+                stats.chunks_removed += self.remove_document(filepath)
+                stats.files_removed += 1
+                print(f"Removed {filepath}")
+        gone = [
+            filepath
+            for filepath in self.metadata.skipped_paths(str(directory_path))
+            if not Path(filepath).exists()
+        ]
+        if gone:
+            with self.metadata.transaction() as cursor:
+                self.metadata.forget_skipped(cursor, gone)
 
-        print(f"Successfully processed {len(texts)} chunks from {filepath}")
-        return len(texts)
+        for file_path in self.iter_supported_files(str(directory_path)):
+            self.sync_document(str(file_path), stats)
 
-    def process_directory(self, directory: str) -> int:
-        """Process all documents in a directory"""
-        total_chunks = 0
-        directory_path = Path(directory)
+        self.flush()
+        print(stats.report())
+        return stats
 
-        # Supported file types
-        supported_extensions = {".txt", ".md", ".pdf", ".doc", ".docx"}
+    def iter_supported_files(self, directory: str) -> Iterator[Path]:
+        """Yield supported files under a directory"""
+        for file_path in Path(directory).resolve().rglob("*"):
+            if is_supported(file_path) and file_path.is_file():
+                yield file_path
 
-        for file_path in directory_path.rglob("*"):
-            if file_path.is_file() and file_path.suffix.lower() in supported_extensions:
-                chunks = self.process_document(str(file_path))
-                total_chunks += chunks
+    def process_directory(self, directory: str, workers: Optional[int] = None) -> int:
+        """Process all documents in a directory through the ingestion pipeline"""
+        from models.ingestion import IngestionPipeline
 
-        return total_chunks
+        pipeline = IngestionPipeline(self, workers=workers)
+        stats = pipeline.run(self.iter_supported_files(directory))
+        print(stats.report())
+        return stats.chunks
@@ -0,0 +1,219 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from models.config import Config
+from models.matrix_file import open_matrix
+from models.metadata_store import SQL_BATCH
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """On-disk embedding cache keyed by chunk text hash, one per model
+
+    Vectors live in a memory-mapped float32 matrix, one row per entry. A
+    SQLite index maps keys to rows and tracks last use, so once the size
+    limit is reached the least recently used rows are evicted and reused.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.matrix_path = cache_dir / "vectors.f32"
+        self.index_path = cache_dir / "index.db"
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._matrix: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        self.init_index()
+
+    @classmethod
+    def for_model(cls, config: Config) -> "EmbeddingCache":
+        """Open the cache for the configured embedding model"""
+        model = config.config["embedding_model"]
+        if config.config["normalize_embeddings"]:
+            model += "-normalized"
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", model)
+        max_bytes = int(config.config["embedding_cache_max_mb"] * 1024 * 1024)
+        return cls(config.embedding_cache_path / slug, max_bytes)
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.index_path, timeout=30)
+
+    def init_index(self):
+        """Create the key index and bookkeeping tables"""
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                row INTEGER UNIQUE NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used)"
+        )
+        cursor.execute("CREATE TABLE IF NOT EXISTS free_rows (row INTEGER PRIMARY KEY)")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        """)
+        conn.commit()
+        conn.close()
+
+    def _get_meta(self, cursor: sqlite3.Cursor, name: str, default: int = 0) -> int:
+        cursor.execute("SELECT value FROM meta WHERE name = ?", (name,))
+        row = cursor.fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, cursor: sqlite3.Cursor, name: str, value: int):
+        cursor.execute(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value)
+        )
+
+    def _open_matrix(self, dimension: int, rows: int) -> np.memmap:
+        """Map the vector file, growing it to hold at least `rows` rows"""
+        if self._matrix is None or self._matrix.shape[0] < rows:
+            self._matrix = None
+            self._matrix = open_matrix(
+                self.matrix_path, dimension, rows, max_rows=self.max_rows(dimension)
+            )
+        return self._matrix
+
+    def max_rows(self, dimension: int) -> int:
+        return max(1, self.max_bytes // (dimension * 4))
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Look up cached vectors, refreshing their last-used time"""
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            conn = self.connect()
+            cursor = conn.cursor()
+            dimension = self._get_meta(cursor, "dimension")
+            if not dimension:
+                conn.close()
+                return found
+
+            key_rows = []
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), SQL_BATCH):
+                part = unique_keys[start : start + SQL_BATCH]
+                placeholders = ",".join("?" * len(part))
+                cursor.execute(
+                    f"SELECT key, row FROM entries WHERE key IN ({placeholders})", part
+                )
+                key_rows.extend(cursor.fetchall())
+
+            if key_rows:
+                matrix = self._open_matrix(dimension, max(row for _, row in key_rows) + 1)
+                vectors = np.array(matrix[[row for _, row in key_rows]])
+                for (key, _), vector in zip(key_rows, vectors):
+                    found[key] = vector
+
+                now = time.time()
+                cursor.executemany(
+                    "UPDATE entries SET last_used = ? WHERE key = ?",
+                    [(now, key) for key, _ in key_rows],
+                )
+                conn.commit()
+            conn.close()
+        return found
+
+    def put_many(self, keys: List[str], vectors: np.ndarray):
+        """Store vectors, evicting least recently used entries when full"""
+        if not keys:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dimension = vectors.shape[1]
+        # A batch larger than the whole cache keeps only what fits
+        keys, vectors = keys[: self.max_rows(dimension)], vectors[: self.max_rows(dimension)]
+
+        with self._lock:
+            conn = self.connect()
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            stored_dimension = self._get_meta(cursor, "dimension")
+            if stored_dimension and stored_dimension != dimension:
+                conn.rollback()
+                conn.close()
+                return
+            self._set_meta(cursor, "dimension", dimension)
+
+            rows = self._allocate_rows(cursor, len(keys), dimension)
+            matrix = self._open_matrix(dimension, max(rows) + 1)
+            matrix[rows] = vectors
+            matrix.flush()
+
+            now = time.time()
+            cursor.executemany(
+                "INSERT OR REPLACE INTO entries (key, row, last_used) VALUES (?, ?, ?)",
+                [(key, row, now) for key, row in zip(keys, rows)],
+            )
+            conn.commit()
+            conn.close()
+
+    def _allocate_rows(self, cursor: sqlite3.Cursor, count: int, dimension: int) -> List[int]:
+        """Hand out free rows, then new rows, then rows of evicted entries"""
+        cursor.execute("SELECT row FROM free_rows LIMIT ?", (count,))
+        rows = [row for (row,) in cursor.fetchall()]
+        cursor.executemany("DELETE FROM free_rows WHERE row = ?", [(row,) for row in rows])
+
+        allocated = self._get_meta(cursor, "rows_allocated")
+        fresh = min(count - len(rows), self.max_rows(dimension) - allocated)
+        if fresh > 0:
+            rows.extend(range(allocated, allocated + fresh))
+            self._set_meta(cursor, "rows_allocated", allocated + fresh)
+
+        needed = count - len(rows)
+        if needed > 0:
+            # Evict a tenth of the cache at a time to amortize the work
+            evict = max(needed, self.max_rows(dimension) // 10)
+            cursor.execute(
+                "SELECT key, row FROM entries ORDER BY last_used LIMIT ?", (evict,)
+            )
+            evicted = cursor.fetchall()
+            cursor.executemany(
+                "DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted]
+            )
+            evicted_rows = [row for _, row in evicted]
+            rows.extend(evicted_rows[:needed])
+            cursor.executemany(
+                "INSERT INTO free_rows (row) VALUES (?)",
+                [(row,) for row in evicted_rows[needed:]],
+            )
+        return rows
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Return embeddings for texts, encoding only the ones not cached"""
+        if not texts:
+            return encode_fn(texts)
+
+        keys = [self.key(text) for text in texts]
+        found = self.get_many(keys)
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        misses = sum(1 for key in keys if key in missing)
+        self.hits += len(keys) - misses
+        self.misses += misses
+
+        if missing:
+            vectors = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+            self.put_many(list(missing), vectors)
+            found.update(zip(missing, vectors))
+
+        return np.stack([found[key] for key in keys])
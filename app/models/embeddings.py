@@ -0,0 +1,80 @@
+import os
+import threading
+from typing import Dict, List, Optional
+from models.config import Config
+from models.dependencies import require
+
+try:
+    import numpy as np
+except ImportError:
+    print("NumPy not found. Installing...")
+    os.system("pip install numpy")
+    import numpy as np
+
+
+class EmbeddingEngine:
+    """Lazily loaded SentenceTransformer shared by ingestion and querying"""
+
+    _shared: Dict[tuple, "EmbeddingEngine"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        model_name: str,
+        batch_size: int = 64,
+        normalize: bool = True,
+        device: Optional[str] = None,
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.normalize = normalize
+        self.device = device
+        self._model = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, config: Config) -> "EmbeddingEngine":
+        """Return the process-wide engine for the configured model"""
+        key = (
+            config.config["embedding_model"],
+            config.config["embedding_batch_size"],
+            config.config["normalize_embeddings"],
+            config.config["embedding_device"],
+        )
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(*key)
+            return cls._shared[key]
+
+    @property
+    def model(self):
+        """Load the model on first use; importing torch is most of the cost"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    st = require("sentence_transformers", "sentence-transformers")
+                    self._model = st.SentenceTransformer(
+                        self.model_name, device=self.device
+                    )
+        return self._model
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts into a float32 matrix, one row per text"""
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        embeddings = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=self.normalize,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """Encode a single query into a float32 vector"""
+        return self.encode([query])[0]
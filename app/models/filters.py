@@ -0,0 +1,229 @@
+import os
+import re
+import json
+import time
+from dataclasses import asdict, dataclass, replace
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+# Tags are stored as one boolean metadata key each, e.g. {"tag:hr": True},
+# since not every vector store can filter on list values
+TAG_PREFIX = "tag:"
+_TAG_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]{0,62}")
+_RELATIVE_TIME = re.compile(r"(\d+(?:\.\d+)?)([mhdw])")
+_TIME_UNITS = {"m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+def check_tag(name: str) -> str:
+    """Validate a tag name, which becomes part of a metadata key"""
+    if not _TAG_NAME.fullmatch(name):
+        raise ValueError(
+            f"Invalid tag {name!r}: use up to 63 letters, digits, '_', '-' or '.', "
+            "starting with a letter or digit"
+        )
+    return name
+
+
+def file_type(filepath: str) -> str:
+    """A file's type as recorded at ingest: its lowercase suffix without the dot"""
+    return Path(filepath).suffix.lower().lstrip(".")
+
+
+def tag_fields(tags: Iterable[str]) -> Dict[str, bool]:
+    return {TAG_PREFIX + check_tag(tag): True for tag in tags}
+
+
+def stored_tags(metadata: Dict) -> Tuple[str, ...]:
+    return tuple(sorted(key[len(TAG_PREFIX) :] for key in metadata if key.startswith(TAG_PREFIX)))
+
+
+def parse_time(value: Union[str, int, float]) -> float:
+    """A Unix time from a number, an ISO date or time, or an age like "7d"
+
+    Ages count back from now in minutes (m), hours (h), days (d) or weeks (w).
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    relative = _RELATIVE_TIME.fullmatch(text)
+    if relative:
+        return time.time() - float(relative.group(1)) * _TIME_UNITS[relative.group(2)]
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        raise ValueError(
+            f"Invalid time {value!r}: use a date like 2024-05-01, an ISO time "
+            "or an age like 12h, 7d or 2w"
+        ) from None
+
+
+def _names(value: Union[None, str, List[str]]) -> Tuple[str, ...]:
+    """Comma-separated names or a list of them, blanks dropped"""
+    if value is None:
+        return ()
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, (list, tuple)):
+        raise ValueError("expected a name or a list of names")
+    return tuple(name for name in (str(item).strip() for item in value) if name)
+
+
+@dataclass(frozen=True)
+class SearchFilter:
+    """Restricts a search to chunks whose metadata match every given field
+
+    `filenames` are file names or globs such as "*.pdf", `path_prefix` an
+    absolute path prefix, `file_types` suffixes without the dot and
+    `since`/`until` bound the Unix time a document was first ingested.
+    Every one of `tags` must have been given when the file was ingested.
+
+    File names and path prefixes are matched against the documents table
+    by `resolve()`, which turns them into an explicit list of `filepaths`.
+    Vector stores then push the filter down into their own search, so the
+    top-k results are taken from matching chunks only.
+    """
+
+    filenames: Tuple[str, ...] = ()
+    path_prefix: Optional[str] = None
+    file_types: Tuple[str, ...] = ()
+    since: Optional[float] = None
+    until: Optional[float] = None
+    tags: Tuple[str, ...] = ()
+    # Set by resolve(): the indexed paths matching filenames and path_prefix
+    filepaths: Optional[Tuple[str, ...]] = None
+
+    @classmethod
+    def create(
+        cls,
+        filenames: Union[None, str, List[str]] = None,
+        path_prefix: Optional[str] = None,
+        file_types: Union[None, str, List[str]] = None,
+        since: Union[None, str, int, float] = None,
+        until: Union[None, str, int, float] = None,
+        tags: Union[None, str, List[str]] = None,
+    ) -> Optional["SearchFilter"]:
+        """Normalize user input; None when nothing restricts the search"""
+        if path_prefix:
+            absolute = os.path.abspath(os.path.expanduser(path_prefix))
+            # A trailing separator limits the prefix to that directory's contents
+            if path_prefix.endswith(("/", os.sep)):
+                absolute = os.path.join(absolute, "")
+            path_prefix = absolute
+        search_filter = cls(
+            filenames=_names(filenames),
+            path_prefix=path_prefix or None,
+            file_types=tuple(
+                sorted({name.lower().lstrip(".") for name in _names(file_types)})
+            ),
+            since=None if since in (None, "") else parse_time(since),
+            until=None if until in (None, "") else parse_time(until),
+            tags=tuple(sorted({check_tag(tag) for tag in _names(tags)})),
+        )
+        return None if search_filter.is_empty() else search_filter
+
+    @classmethod
+    def from_dict(cls, body: Optional[Dict]) -> Optional["SearchFilter"]:
+        """Read an API request's "filter" object"""
+        if body is None:
+            return None
+        if not isinstance(body, dict):
+            raise ValueError("filter must be an object")
+        unknown = set(body) - {"filename", "path_prefix", "file_type", "since", "until", "tags"}
+        if unknown:
+            raise ValueError(f"unknown filter fields: {', '.join(sorted(unknown))}")
+        return cls.create(
+            body.get("filename"),
+            body.get("path_prefix"),
+            body.get("file_type"),
+            body.get("since"),
+            body.get("until"),
+            body.get("tags"),
+        )
+
+    def is_empty(self) -> bool:
+        return self == SearchFilter()
+
+    def key(self) -> str:
+        """Stable text identifying the filter, for cache keys"""
+        return json.dumps(asdict(self), sort_keys=True)
+
+    @property
+    def needs_paths(self) -> bool:
+        return bool(self.filenames or self.path_prefix)
+
+    def resolve(self, metadata) -> "SearchFilter":
+        """Look up the paths matching `filenames` and `path_prefix` in a MetadataStore"""
+        if not self.needs_paths:
+            return self
+        paths = metadata.matching_paths(self.filenames, self.path_prefix)
+        return replace(self, filepaths=tuple(paths))
+
+    @property
+    def matches_nothing(self) -> bool:
+        """True once resolved to no documents at all"""
+        return self.filepaths is not None and not self.filepaths
+
+    def chroma_where(self) -> Optional[Dict]:
+        """The filter as a ChromaDB `where` clause"""
+        conditions: List[Dict] = []
+        if self.filepaths is not None:
+            conditions.append({"filepath": {"$in": list(self.filepaths)}})
+        if self.file_types:
+            conditions.append({"file_type": {"$in": list(self.file_types)}})
+        if self.since is not None:
+            conditions.append({"ingested_at": {"$gte": int(self.since)}})
+        if self.until is not None:
+            conditions.append({"ingested_at": {"$lte": int(self.until)}})
+        conditions.extend({TAG_PREFIX + tag: True} for tag in self.tags)
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def sql_where(self, table: str = "") -> Tuple[str, List]:
+        """The filter as an SQL condition on a table with filepath and JSON metadata columns
+
+        Lists are bound as one JSON array parameter, so any number of paths
+        fits in a statement.
+        """
+        prefix = f"{table}." if table else ""
+        metadata = f"{prefix}metadata"
+        conditions, params = [], []
+        if self.filepaths is not None:
+            conditions.append(f"{prefix}filepath IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps(list(self.filepaths)))
+        if self.file_types:
+            conditions.append(
+                f"json_extract({metadata}, '$.file_type') IN (SELECT value FROM json_each(?))"
+            )
+            params.append(json.dumps(list(self.file_types)))
+        if self.since is not None:
+            conditions.append(f"json_extract({metadata}, '$.ingested_at') >= ?")
+            params.append(int(self.since))
+        if self.until is not None:
+            conditions.append(f"json_extract({metadata}, '$.ingested_at') <= ?")
+            params.append(int(self.until))
+        for tag in self.tags:
+            conditions.append(f"json_extract({metadata}, ?) = 1")
+            params.append(f'$."{TAG_PREFIX}{tag}"')
+        return " AND ".join(conditions) or "1", params
+
+    def describe(self) -> str:
+        parts = []
+        if self.filenames:
+            parts.append(f"file {', '.join(self.filenames)}")
+        if self.path_prefix:
+            parts.append(f"under {self.path_prefix}")
+        if self.file_types:
+            parts.append(f"type {', '.join(self.file_types)}")
+        if self.since is not None:
+            parts.append(f"since {datetime.fromtimestamp(self.since):%Y-%m-%d %H:%M}")
+        if self.until is not None:
+            parts.append(f"until {datetime.fromtimestamp(self.until):%Y-%m-%d %H:%M}")
+        if self.tags:
+            parts.append(f"tagged {', '.join(self.tags)}")
+        return "; ".join(parts)
@@ -0,0 +1,323 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from models.document_processor import DocumentProcessor, SyncStats, load_and_split
+from models.metadata_store import Chunk
+from models.loaders import Loader
+from models.tracing import tracer
+
+# Marks the end of the stream on a stage queue
+_DONE = object()
+
+
+def timed_load_and_split(filepath: str, *args):
+    """load_and_split for the loader pool, with its time measured in the worker"""
+    start = time.perf_counter()
+    chunks = load_and_split(filepath, *args)
+    return chunks, time.perf_counter() - start
+
+
+class LoadedDocument(NamedTuple):
+    """A split document travelling from the loader pool to the writer"""
+
+    filepath: str
+    file_hash: str
+    file_stat: os.stat_result
+    replaces: bool
+    chunks: List[Chunk]
+
+
+@dataclass
+class IngestStats:
+    """Counters collected while a directory is ingested"""
+
+    files_seen: int = 0
+    files_indexed: int = 0
+    skipped_by_stat: int = 0
+    skipped_by_hash: int = 0
+    skipped_duplicate: int = 0
+    files_hashed: int = 0
+    bytes_hashed: int = 0
+    files_empty: int = 0
+    files_failed: int = 0
+    files_unsupported: int = 0
+    chunks: int = 0
+    embeddings_cached: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    elapsed: float = 0.0
+
+    def report(self) -> str:
+        """Summarize counts and throughput for the end of a run"""
+        elapsed = max(self.elapsed, 1e-9)
+        return (
+            f"Ingested {self.files_indexed} files ({self.chunks} chunks) "
+            f"in {self.elapsed:.1f}s - "
+            f"{self.files_indexed / elapsed:.1f} files/s, "
+            f"{self.chunks / elapsed:.1f} chunks/s\n"
+            f"Seen: {self.files_seen}, empty: {self.files_empty}, "
+            f"unsupported: {self.files_unsupported}, failed: {self.files_failed}, "
+            f"embeddings from cache: {self.embeddings_cached}\n"
+            f"Unchanged by stat (not read): {self.skipped_by_stat}, "
+            f"unchanged by hash: {self.skipped_by_hash}, "
+            f"duplicates: {self.skipped_duplicate}, "
+            f"hashed: {self.files_hashed} ({self.bytes_hashed / 1e6:.1f} MB)"
+        )
+
+
+class IngestionPipeline:
+    """Staged ingestion: parallel load/split, batched embedding, single writer
+
+    Loading and splitting run in a process pool. One thread embeds chunks in
+    batches and one thread writes them to the vector store and SQLite. Bounded
+    queues between the stages keep a fast loader from running ahead of the
+    writer. Files over `ingest_stream_threshold_mb` would be held whole in
+    the queues, so they are streamed through the processor one at a time
+    once the pool is done instead.
+    """
+
+    def __init__(self, processor: DocumentProcessor, workers: Optional[int] = None):
+        self.processor = processor
+        self.config = processor.config
+        self.workers = workers or self.config.config["ingest_workers"] or os.cpu_count()
+        self.queue_size = self.config.config["ingest_queue_size"]
+        self.batch_size = self.config.config["ingest_batch_size"]
+        self.stream_threshold = self.config.config["ingest_stream_threshold_mb"] * 1024 * 1024
+        self.lock = threading.Lock()
+
+    def run(self, paths: Iterable[Path]) -> IngestStats:
+        """Ingest every path and return the collected statistics"""
+        stats = IngestStats()
+        cache = self.processor.embedding_cache
+        cache_hits = cache.hits if cache else 0
+        split_queue = queue.Queue(maxsize=self.queue_size)
+        write_queue = queue.Queue(maxsize=self.queue_size)
+
+        embedder = threading.Thread(
+            target=self._embed_stage, args=(split_queue, write_queue, stats), daemon=True
+        )
+        writer = threading.Thread(
+            target=self._write_stage, args=(write_queue, stats), daemon=True
+        )
+        embedder.start()
+        writer.start()
+
+        large: List[Tuple[LoadedDocument, Loader]] = []
+        try:
+            self._load_stage(paths, split_queue, stats, large)
+        finally:
+            split_queue.put(_DONE)
+            embedder.join()
+            writer.join()
+        try:
+            for document, loader in large:
+                self._stream_document(document, loader, stats)
+        finally:
+            self.processor.flush()
+
+        if cache:
+            stats.embeddings_cached = cache.hits - cache_hits
+        stats.elapsed = time.perf_counter() - stats.started
+        return stats
+
+    def _count(self, stats: IngestStats, name: str, amount: int = 1):
+        with self.lock:
+            setattr(stats, name, getattr(stats, name) + amount)
+
+    def _load_stage(
+        self,
+        paths: Iterable[Path],
+        split_queue: queue.Queue,
+        stats: IngestStats,
+        large: List[Tuple[LoadedDocument, Loader]],
+    ):
+        """Skip unchanged and unsupported files, hash the rest and fan loading
+        out to the pool
+
+        Files too large for the pool are collected in `large`, without chunks.
+        """
+        chunk_size = self.config.config["chunk_size"]
+        chunk_overlap = self.config.config["chunk_overlap"]
+        plugins = tuple(self.config.config["loader_plugins"])
+        seen_hashes = set()
+        pending: Dict = {}
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for path in paths:
+                self._count(stats, "files_seen")
+                filepath = str(path)
+                try:
+                    check = self.processor.check_file(filepath, seen_hashes)
+                except OSError as e:
+                    print(f"Error reading {filepath}: {e}")
+                    self._count(stats, "files_failed")
+                    continue
+                if check.action == "unchanged":
+                    self._count(stats, "skipped_by_stat")
+                    continue
+                if check.action == "unsupported":
+                    self._count(stats, "files_unsupported")
+                    continue
+
+                file_stat, file_hash, loader = check.file_stat, check.file_hash, check.loader
+                self._count(stats, "files_hashed")
+                self._count(stats, "bytes_hashed", file_stat.st_size)
+                if check.action == "same_hash":
+                    self._count(stats, "skipped_by_hash")
+                    continue
+                if check.action == "duplicate":
+                    self._count(stats, "skipped_duplicate")
+                    continue
+                replaces = check.existing is not None
+                if file_stat.st_size >= self.stream_threshold:
+                    document = LoadedDocument(filepath, file_hash, file_stat, replaces, [])
+                    large.append((document, loader))
+                    continue
+
+                future = pool.submit(
+                    timed_load_and_split, filepath, chunk_size, chunk_overlap, loader.name, plugins
+                )
+                pending[future] = (filepath, file_hash, file_stat, replaces)
+
+                # Backpressure: stop submitting once enough work is in flight
+                while len(pending) >= self.queue_size:
+                    self._collect(pending, split_queue, stats)
+
+            while pending:
+                self._collect(pending, split_queue, stats)
+
+    def _collect(self, pending: Dict, split_queue: queue.Queue, stats: IngestStats):
+        """Move finished loader results onto the embedding queue"""
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            filepath, file_hash, file_stat, replaces = pending.pop(future)
+            try:
+                chunks, seconds = future.result()
+            except Exception as e:
+                print(f"Error loading {filepath}: {e}")
+                self._count(stats, "files_failed")
+                continue
+            # Spans opened in the worker process would be lost with it
+            tracer.record("ingest.load", seconds, chunks=len(chunks))
+
+            if not chunks:
+                print(f"No text content found in {filepath}")
+                self._count(stats, "files_empty")
+                continue
+
+            split_queue.put(
+                LoadedDocument(filepath, file_hash, file_stat, replaces, chunks)
+            )
+
+    def _embed_stage(self, split_queue: queue.Queue, write_queue: queue.Queue, stats: IngestStats):
+        """Group documents into batches of chunks and embed each batch at once"""
+        batch: List[LoadedDocument] = []
+        batch_chunks = 0
+
+        while True:
+            item = split_queue.get()
+            if item is _DONE:
+                break
+            batch.append(item)
+            batch_chunks += len(item.chunks)
+            if batch_chunks >= self.batch_size:
+                self._embed_batch(batch, write_queue, stats)
+                batch, batch_chunks = [], 0
+
+        if batch:
+            self._embed_batch(batch, write_queue, stats)
+        write_queue.put(_DONE)
+
+    def _embed_batch(self, batch: List, write_queue: queue.Queue, stats: IngestStats):
+        texts = [chunk.text for document in batch for chunk in document.chunks]
+        try:
+            embeddings = self.processor.embed_texts(texts)
+        except Exception as e:
+            print(f"Error embedding batch of {len(batch)} documents: {e}")
+            self._count(stats, "files_failed", len(batch))
+            return
+        write_queue.put((batch, embeddings))
+
+    def _write_stage(self, write_queue: queue.Queue, stats: IngestStats):
+        """Bulk-add embedded batches to the vector store and record them in SQLite"""
+        while True:
+            item = write_queue.get()
+            if item is _DONE:
+                break
+            batch, embeddings = item
+            try:
+                self._write_batch(batch, embeddings)
+            except Exception as e:
+                print(f"Error writing batch of {len(batch)} documents: {e}")
+                self._count(stats, "files_failed", len(batch))
+                continue
+            self._count(stats, "files_indexed", len(batch))
+            self._count(stats, "chunks", sum(len(document.chunks) for document in batch))
+
+    def _write_batch(self, batch: List, embeddings):
+        ids, chunks, metadatas, rows, replaced = [], [], [], [], []
+        for document in batch:
+            stored = (
+                self.processor.vector_store.get_metadatas(document.filepath)
+                if document.replaces
+                else {}
+            )
+            chunk_ids, chunk_metadatas = self.processor.build_chunk_records(
+                document.filepath,
+                [chunk.text for chunk in document.chunks],
+                fields=self.processor.document_fields(document.filepath, stored),
+            )
+            replaced.extend(stored)
+            ids.extend(chunk_ids)
+            chunks.extend(document.chunks)
+            metadatas.extend(chunk_metadatas)
+            rows.append(
+                (
+                    document.filepath,
+                    document.file_hash,
+                    len(document.chunks),
+                    document.file_stat,
+                )
+            )
+
+        texts = [chunk.text for chunk in chunks]
+        # Edited files' old chunks go before their new ones are added
+        if replaced:
+            self.processor.vector_store.delete(replaced)
+        self.processor.add_vectors(ids, texts, embeddings, metadatas)
+        # One transaction for the whole batch's keyword entries and chunk rows;
+        # the documents rows are written by flush(), once the vectors are saved
+        metadata = self.processor.metadata
+        lexical_index = self.processor.lexical_index
+        with metadata.transaction() as cursor:
+            lexical_index.delete(cursor, replaced)
+            metadata.delete_chunks(cursor, replaced)
+            with tracer.span("ingest.keyword_write", chunks=len(ids)):
+                lexical_index.add(cursor, ids, texts, metadatas)
+            metadata.record_chunks(cursor, ids, chunks, metadatas)
+        self.processor.record_documents(rows)
+
+    def _stream_document(self, document: LoadedDocument, loader: Loader, stats: IngestStats):
+        """Index a large file in bounded batches through the processor"""
+        existing = self.processor.get_document(document.filepath) if document.replaces else None
+        sync = self.processor.index_file(
+            document.filepath,
+            document.file_stat,
+            document.file_hash,
+            existing,
+            SyncStats(),
+            loader,
+        )
+        if sync.files_failed:
+            self._count(stats, "files_failed")
+        elif not sync.files_updated:
+            print(f"No text content found in {document.filepath}")
+            self._count(stats, "files_empty")
+        else:
+            self._count(stats, "files_indexed")
+            self._count(stats, "chunks", sync.chunks_added + sync.chunks_kept)
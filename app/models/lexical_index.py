@@ -0,0 +1,169 @@
+import re
+import json
+import sqlite3
+from typing import Dict, List, Optional
+
+from models.filters import SearchFilter
+from models.metadata_store import SQL_BATCH, MetadataStore
+
+RETRIEVAL_MODES = ("hybrid", "vector", "keyword")
+# Reciprocal-rank fusion constant; damps the weight of the very top ranks
+RRF_K = 60
+
+
+def match_expression(query: str, identifiers_only: bool = False) -> str:
+    """FTS5 query matching any of the query's terms
+
+    Each whitespace-separated term is quoted as a phrase, so identifiers
+    like ERR-1042 or v2.3.1 match their parts in order and FTS5 operators
+    in the question are taken literally. BM25 ranks chunks matching more
+    and rarer terms first. With `identifiers_only`, only terms containing
+    a digit are kept.
+    """
+    terms = [term for term in query.split() if re.search(r"\w", term)]
+    if identifiers_only:
+        terms = [term for term in terms if re.search(r"\d", term)]
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict]], limit: int, k: int = RRF_K) -> List[Dict]:
+    """Merge ranked result lists by summing 1 / (k + rank) per chunk
+
+    Only ranks are used, so BM25 scores and vector distances need no
+    calibration against each other. The first list's copy of a chunk wins,
+    keeping e.g. its vector distance.
+    """
+    scores: Dict[str, float] = {}
+    results: Dict[str, Dict] = {}
+    for ranking in rankings:
+        for rank, result in enumerate(ranking, start=1):
+            scores[result["id"]] = scores.get(result["id"], 0.0) + 1.0 / (k + rank)
+            results.setdefault(result["id"], result)
+
+    fused = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [dict(results[chunk_id], score=scores[chunk_id]) for chunk_id in fused]
+
+
+class LexicalIndex:
+    """Full-text (BM25) index of chunk text in SQLite FTS5
+
+    Lives in metadata.db next to the documents table and shares the
+    metadata store's connection, so writes join the caller's transaction
+    and a batch's keyword entries commit with its chunk rows. Chunk ids,
+    paths and metadata are kept in a plain table whose rowids match the
+    FTS rows, so deletes by chunk id are indexed lookups.
+    """
+
+    def __init__(self, metadata: MetadataStore):
+        self.metadata = metadata
+
+    def init_db(self):
+        with self.metadata.transaction() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS lexical_chunks (
+                    rowid INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chunk_id TEXT UNIQUE NOT NULL,
+                    filepath TEXT NOT NULL,
+                    metadata TEXT NOT NULL
+                )
+            """)
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_lexical_chunks_filepath "
+                "ON lexical_chunks(filepath)"
+            )
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS lexical_fts USING fts5(content)"
+            )
+
+    def add(
+        self, cursor: sqlite3.Cursor, ids: List[str], texts: List[str], metadatas: List[Dict]
+    ):
+        """Index chunk texts, replacing any already stored under the same ids"""
+        if not ids:
+            return
+        self.delete(cursor, ids)
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            cursor.execute(
+                "INSERT INTO lexical_chunks (chunk_id, filepath, metadata) VALUES (?, ?, ?)",
+                (chunk_id, metadata.get("filepath", ""), json.dumps(metadata)),
+            )
+            cursor.execute(
+                "INSERT INTO lexical_fts (rowid, content) VALUES (?, ?)",
+                (cursor.lastrowid, text),
+            )
+
+    def update_metadatas(self, cursor: sqlite3.Cursor, ids: List[str], metadatas: List[Dict]):
+        cursor.executemany(
+            "UPDATE lexical_chunks SET filepath = ?, metadata = ? WHERE chunk_id = ?",
+            [
+                (metadata.get("filepath", ""), json.dumps(metadata), chunk_id)
+                for chunk_id, metadata in zip(ids, metadatas)
+            ],
+        )
+
+    def delete(self, cursor: sqlite3.Cursor, ids: List[str]):
+        for start in range(0, len(ids), SQL_BATCH):
+            batch = ids[start : start + SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            cursor.execute(
+                f"DELETE FROM lexical_fts WHERE rowid IN "
+                f"(SELECT rowid FROM lexical_chunks WHERE chunk_id IN ({placeholders}))",
+                batch,
+            )
+            cursor.execute(
+                f"DELETE FROM lexical_chunks WHERE chunk_id IN ({placeholders})", batch
+            )
+
+    def search(
+        self, query: str, n_results: int, filters: Optional[SearchFilter] = None
+    ) -> List[Dict]:
+        """Best BM25 matches as {"id", "content", "metadata", "score"} dicts
+
+        Chunks containing the query's identifiers (codes, part numbers,
+        versions) come first; otherwise short chunks sharing a few common
+        words with the question outscore them. Scores are FTS5's bm25(),
+        where lower is a better match. With `filters` (resolved), only
+        matching chunks are ranked.
+        """
+        if n_results <= 0 or (filters is not None and filters.matches_nothing):
+            return []
+        if filters is None:
+            sql = """SELECT c.chunk_id, m.content, c.metadata, m.rank
+                     FROM (SELECT rowid, content, rank FROM lexical_fts
+                           WHERE lexical_fts MATCH ? ORDER BY rank LIMIT ?) AS m
+                     JOIN lexical_chunks AS c ON c.rowid = m.rowid
+                     ORDER BY m.rank"""
+            filter_params = []
+        else:
+            # The limit must apply to matching chunks, so filter in the join
+            where, filter_params = filters.sql_where("c")
+            sql = f"""SELECT c.chunk_id, m.content, c.metadata, m.rank
+                      FROM lexical_fts AS m JOIN lexical_chunks AS c ON c.rowid = m.rowid
+                      WHERE lexical_fts MATCH ? AND {where}
+                      ORDER BY m.rank LIMIT ?"""
+        expressions = (match_expression(query, identifiers_only=True), match_expression(query))
+        results: Dict[str, Dict] = {}
+        try:
+            for expression in expressions:
+                if not expression or len(results) >= n_results:
+                    continue
+                for chunk_id, content, metadata, score in self.metadata.query(
+                    sql, (expression, *filter_params, n_results)
+                ):
+                    if chunk_id not in results and len(results) < n_results:
+                        results[chunk_id] = {
+                            "id": chunk_id,
+                            "content": content,
+                            "metadata": json.loads(metadata),
+                            "score": score,
+                        }
+        except sqlite3.OperationalError:
+            # No index yet (nothing ingested since it was added)
+            pass
+        return list(results.values())
+
+    def count(self) -> int:
+        try:
+            return self.metadata.query("SELECT COUNT(*) FROM lexical_chunks")[0][0]
+        except sqlite3.OperationalError:
+            return 0
@@ -0,0 +1,237 @@
+import mmap
+import codecs
+import zipfile
+import importlib
+from dataclasses import dataclass
+from importlib.metadata import entry_points
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, Set, Tuple
+
+from models.dependencies import require
+
+# Optional: better guesses for text that is neither UTF-8 nor marked by a BOM
+try:
+    import charset_normalizer
+except ImportError:
+    charset_normalizer = None
+
+# Bytes read to sniff a file's type
+SNIFF_BYTES = 4096
+# Bytes decoded at a time by the text loader
+TEXT_WINDOW_BYTES = 1024 * 1024
+# Packages can register loaders by exposing them under this entry point group
+ENTRY_POINT_GROUP = "local_lm_assistant.loaders"
+
+PDF_MIME = "application/pdf"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+TEXT_MIME = "text/plain"
+
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+class UnsupportedFileError(ValueError):
+    """Raised for files no registered loader can read"""
+
+
+@dataclass(frozen=True)
+class Loader:
+    """Extracts text from one kind of document
+
+    `load` yields the text in blocks. Blocks of a `paged` loader (PDF
+    pages) are split into chunks separately; otherwise they are one
+    continuous text. `mime_types` lists the sniffed types the loader
+    reads; an empty tuple accepts whatever its suffixes hold.
+    """
+
+    name: str
+    suffixes: Tuple[str, ...]
+    mime_types: Tuple[str, ...]
+    load: Callable[[str], Iterator[str]]
+    paged: bool = False
+
+
+_loaders: Dict[str, Loader] = {}
+_by_suffix: Dict[str, Loader] = {}
+_loaded_plugins: Set[str] = set()
+
+
+def register_loader(loader: Loader):
+    """Add a loader, replacing any registered for the same name or suffixes"""
+    _loaders[loader.name] = loader
+    for suffix in loader.suffixes:
+        _by_suffix[suffix.lower()] = loader
+
+
+def get_loader(name: str) -> Loader:
+    return _loaders[name]
+
+
+def supported_suffixes() -> Set[str]:
+    return set(_by_suffix)
+
+
+def is_supported(path) -> bool:
+    """Whether a loader is registered for the path's suffix; reads nothing"""
+    return Path(path).suffix.lower() in _by_suffix
+
+
+def load_plugins(modules: Iterable[str] = ()):
+    """Import loader plugins from entry points and the given module names
+
+    A plugin module calls register_loader() when imported; an entry point
+    may also point straight at a Loader.
+    """
+    found = entry_points()
+    # select() is Python 3.10+; older versions return a dict of groups
+    group = (
+        found.select(group=ENTRY_POINT_GROUP)
+        if hasattr(found, "select")
+        else found.get(ENTRY_POINT_GROUP, [])
+    )
+    for entry_point in group:
+        if entry_point.name not in _loaded_plugins:
+            _loaded_plugins.add(entry_point.name)
+            plugin = entry_point.load()
+            if isinstance(plugin, Loader):
+                register_loader(plugin)
+    for module in modules:
+        if module not in _loaded_plugins:
+            _loaded_plugins.add(module)
+            importlib.import_module(module)
+
+
+def sniff_mime(filepath: str, head: bytes) -> str:
+    """Guess a MIME type from a file's first bytes"""
+    if head.startswith(b"%PDF-"):
+        return PDF_MIME
+    if head.startswith(b"PK\x03\x04"):
+        # Office documents are zip files; the central directory names the kind
+        try:
+            with zipfile.ZipFile(filepath) as archive:
+                if "word/document.xml" in archive.namelist():
+                    return DOCX_MIME
+        except zipfile.BadZipFile:
+            pass
+        return "application/zip"
+    if head.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+        # Legacy binary Office formats such as Word 97-2003 .doc
+        return "application/x-ole-storage"
+    if any(head.startswith(bom) for bom, _ in _BOMS):
+        return TEXT_MIME
+    if b"\x00" in head:
+        return "application/octet-stream"
+    return TEXT_MIME
+
+
+def find_loader(filepath: str) -> Loader:
+    """Pick the loader for a file from its suffix and sniffed content
+
+    Only the first SNIFF_BYTES are read, so unsupported files are turned
+    away before they are hashed or loaded. Content wins over the suffix
+    when another loader claims it, e.g. a PDF saved as .txt.
+    """
+    suffix = Path(filepath).suffix.lower()
+    loader = _by_suffix.get(suffix)
+    if loader is None:
+        raise UnsupportedFileError(f"no loader for {suffix or 'files without a suffix'}")
+
+    with open(filepath, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+    mime = sniff_mime(filepath, head)
+    if not loader.mime_types or mime in loader.mime_types:
+        return loader
+    for candidate in _loaders.values():
+        if mime != TEXT_MIME and mime in candidate.mime_types:
+            return candidate
+    if mime == "application/x-ole-storage":
+        raise UnsupportedFileError("legacy Word .doc files are not supported; save as .docx")
+    raise UnsupportedFileError(f"content looks like {mime}, not {suffix}")
+
+
+def detect_encoding(head: bytes) -> str:
+    """Encoding of a text file from a BOM, a UTF-8 check or a statistical guess"""
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    try:
+        # Incremental, so a character cut off at the end of the sample is fine
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    if charset_normalizer is not None:
+        matches = list(charset_normalizer.from_bytes(head))
+        if matches:
+            # Western single-byte code pages often decode equally cleanly;
+            # prefer the most common one among the least chaotic
+            least = min(match.chaos for match in matches)
+            for match in matches:
+                if match.chaos == least and "cp1252" in match.could_be_from_charset:
+                    return "cp1252"
+            return matches[0].encoding
+    return "cp1252"
+
+
+def load_text(filepath: str) -> Iterator[str]:
+    """Decode a text file from a memory map, a window at a time
+
+    Line endings are normalized to \\n as in text mode. Undecodable bytes
+    are replaced rather than failing the whole file.
+    """
+    with open(filepath, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+        if not head:
+            return
+        decoder = codecs.getincrementaldecoder(detect_encoding(head))(errors="replace")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            pending = ""
+            for start in range(0, len(view), TEXT_WINDOW_BYTES):
+                final = start + TEXT_WINDOW_BYTES >= len(view)
+                text = pending + decoder.decode(view[start : start + TEXT_WINDOW_BYTES], final)
+                # A \r\n pair may straddle two windows
+                pending = "\r" if text.endswith("\r") and not final else ""
+                if pending:
+                    text = text[:-1]
+                yield text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def load_pdf(filepath: str) -> Iterator[str]:
+    """Yield the text of a PDF page by page"""
+    loaders = require("langchain_community.document_loaders", "langchain-community pypdf")
+    for page in loaders.PyPDFLoader(filepath).lazy_load():
+        yield page.page_content
+
+
+def load_docx(filepath: str) -> Iterator[str]:
+    """Yield a Word document's paragraphs and tables in document order"""
+    docx = require("docx", "python-docx")
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    document = docx.Document(filepath)
+    for element in document.element.body.iterchildren():
+        tag = element.tag.rsplit("}", 1)[-1]
+        if tag == "p":
+            text = Paragraph(element, document).text
+        elif tag == "tbl":
+            # One line per row, cells separated by " | "
+            text = "\n".join(
+                " | ".join(cell.text.strip() for cell in row.cells)
+                for row in Table(element, document).rows
+            )
+        else:
+            continue
+        if text.strip():
+            yield text + "\n\n"
+
+
+register_loader(Loader("text", (".txt", ".md"), (TEXT_MIME,), load_text))
+register_loader(Loader("pdf", (".pdf",), (PDF_MIME,), load_pdf, paged=True))
+# .doc files that are really .docx open fine; legacy binary ones are refused
+register_loader(Loader("docx", (".docx", ".doc"), (DOCX_MIME,), load_docx))
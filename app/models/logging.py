@@ -1,6 +1,8 @@
+import atexit
 import logging
 from datetime import datetime
 from models.config import Config
+from models.tracing import tracer
 
 
 class Logger:
@@ -18,3 +20,20 @@ class Logger:
             format="%(asctime)s - %(levelname)s - %(message)s",
             handlers=[logging.FileHandler(log_file), logging.StreamHandler()],
         )
+        # httpx logs every request at INFO, drowning out answers
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        self.setup_tracing()
+
+    def setup_tracing(self):
+        """Log trace spans as JSON lines and export metrics, if configured"""
+        if self.config.config["trace_log"]:
+            trace_file = (
+                self.config.logs_path / f"trace_{datetime.now().strftime('%Y%m%d')}.jsonl"
+            )
+            handler = logging.FileHandler(trace_file)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            tracer.logger.addHandler(handler)
+            tracer.logger.setLevel(logging.INFO)
+
+        if self.config.config["metrics_file"]:
+            atexit.register(tracer.write_prometheus, self.config.config["metrics_file"])
@@ -0,0 +1,36 @@
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+
+def open_matrix(
+    path: Path, dimension: int, rows: int, read_only: bool = False, max_rows: int = 0
+) -> Optional[np.memmap]:
+    """Map a flat float32 file of `dimension`-wide rows
+
+    When writable, the file is first grown to hold at least `rows` rows.
+    It grows geometrically so appends don't remap on every batch, but not
+    past `max_rows` (if set) beyond what `rows` needs. Callers drop their
+    old map of the file before calling. Returns None for an empty file
+    opened read-only.
+    """
+    row_bytes = dimension * 4
+    size = path.stat().st_size if path.exists() else 0
+    current_rows = size // row_bytes
+    if current_rows < rows and not read_only:
+        new_rows = max(rows, current_rows * 2, 1024)
+        if max_rows:
+            new_rows = min(new_rows, max(rows, max_rows))
+        with open(path, "ab") as f:
+            f.truncate(new_rows * row_bytes)
+        current_rows = new_rows
+    if not current_rows:
+        return None
+
+    return np.memmap(
+        path,
+        dtype=np.float32,
+        mode="r" if read_only else "r+",
+        shape=(current_rows, dimension),
+    )
@@ -0,0 +1,403 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+# Set on the shared connection. WAL lets searches read while an ingest
+# writes; NORMAL sync is safe with WAL and the index can be rebuilt anyway.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16384",
+    "PRAGMA mmap_size=268435456",
+)
+# SQLite limits bound parameters per statement
+SQL_BATCH = 500
+
+
+class Chunk(NamedTuple):
+    """A chunk of document text and its character offsets in the extracted text"""
+
+    text: str
+    start: int
+    end: int
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def file_signature(file_stat: os.stat_result) -> Tuple[int, int, int]:
+    """(size, mtime_ns, inode) used to detect changes without reading a file"""
+    return (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino)
+
+
+def _like_prefix(prefix: str) -> str:
+    """Escape a path for use as a SQL LIKE prefix pattern"""
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
+class MetadataStore:
+    """Documents, chunks and index state in metadata.db
+
+    One connection per process, shared by the ingestion threads and the
+    query threads behind a lock. Writes go through `transaction()`, so an
+    ingest batch commits its chunk and document rows once.
+    """
+
+    def __init__(self, sqlite_path: Path):
+        self.sqlite_path = sqlite_path
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._conn is None:
+                # Autocommit; transaction() issues BEGIN/COMMIT itself
+                conn = sqlite3.connect(
+                    self.sqlite_path, timeout=30, isolation_level=None, check_same_thread=False
+                )
+                for pragma in PRAGMAS:
+                    conn.execute(pragma)
+                conn.row_factory = sqlite3.Row
+                self._conn = conn
+            return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Cursor]:
+        """A write transaction; other threads using the store wait for it"""
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                yield cursor
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+
+    def query(self, sql: str, params: Tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def init_db(self):
+        with self.transaction() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    filename TEXT NOT NULL,
+                    filepath TEXT NOT NULL,
+                    file_hash TEXT NOT NULL,
+                    processed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    chunk_count INTEGER
+                )
+            """)
+
+            # Stat index used to spot changed files without reading them
+            cursor.execute("PRAGMA table_info(documents)")
+            columns = {row[1] for row in cursor.fetchall()}
+            for column in ("file_size", "mtime_ns", "inode"):
+                if column not in columns:
+                    cursor.execute(f"ALTER TABLE documents ADD COLUMN {column} INTEGER")
+
+            # file_hash used to be UNIQUE, but an indexed file edited to match
+            # another one must keep its own row
+            cursor.execute(
+                "SELECT COUNT(*) FROM pragma_index_list('documents') WHERE origin = 'u'"
+            )
+            if cursor.fetchone()[0]:
+                self._drop_unique_hash(cursor)
+
+            # One row per path, updated in place; older databases had a plain index
+            cursor.execute(
+                "SELECT \"unique\" FROM pragma_index_list('documents') "
+                "WHERE name = 'idx_documents_filepath'"
+            )
+            row = cursor.fetchone()
+            if row is None or not row[0]:
+                cursor.execute(
+                    "DELETE FROM documents WHERE id NOT IN "
+                    "(SELECT MAX(id) FROM documents GROUP BY filepath)"
+                )
+                cursor.execute("DROP INDEX IF EXISTS idx_documents_filepath")
+                cursor.execute(
+                    "CREATE UNIQUE INDEX idx_documents_filepath ON documents(filepath)"
+                )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_documents_filename ON documents(filename)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_documents_hash ON documents(file_hash)"
+            )
+
+            # New paths skipped as copies of an indexed file, with the stat they
+            # had, so they are not hashed again while they stay unchanged
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS skipped (
+                    filepath TEXT PRIMARY KEY,
+                    file_hash TEXT NOT NULL,
+                    file_size INTEGER,
+                    mtime_ns INTEGER,
+                    inode INTEGER
+                )
+            """)
+
+            # Where each chunk came from; offsets are characters in the extracted text
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    chunk_id TEXT PRIMARY KEY,
+                    filepath TEXT NOT NULL,
+                    chunk_index INTEGER NOT NULL,
+                    chunk_hash TEXT NOT NULL,
+                    start_offset INTEGER NOT NULL,
+                    end_offset INTEGER NOT NULL
+                )
+            """)
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_chunks_filepath ON chunks(filepath, chunk_index)"
+            )
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunks_hash ON chunks(chunk_hash)")
+
+            # Seeded from the clock, so a reset database never reuses a generation
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS state (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            """)
+            cursor.execute(
+                "INSERT OR IGNORE INTO state (name, value) VALUES ('index_generation', ?)",
+                (time.time_ns() // 1000,),
+            )
+
+    @staticmethod
+    def _drop_unique_hash(cursor: sqlite3.Cursor):
+        """Rebuild the documents table without the UNIQUE constraint on file_hash"""
+        columns = (
+            "id, filename, filepath, file_hash, processed_date, chunk_count, "
+            "file_size, mtime_ns, inode"
+        )
+        cursor.execute("""
+            CREATE TABLE documents_rebuilt (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                filename TEXT NOT NULL,
+                filepath TEXT NOT NULL,
+                file_hash TEXT NOT NULL,
+                processed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                chunk_count INTEGER,
+                file_size INTEGER,
+                mtime_ns INTEGER,
+                inode INTEGER
+            )
+        """)
+        cursor.execute(
+            f"INSERT INTO documents_rebuilt ({columns}) SELECT {columns} FROM documents"
+        )
+        cursor.execute("DROP TABLE documents")
+        cursor.execute("ALTER TABLE documents_rebuilt RENAME TO documents")
+
+    def generation(self) -> int:
+        """Counter bumped by every change to the index, for invalidating caches"""
+        try:
+            rows = self.query("SELECT value FROM state WHERE name = 'index_generation'")
+        except sqlite3.OperationalError:
+            return 0
+        return rows[0][0] if rows else 0
+
+    @staticmethod
+    def bump_generation(cursor: sqlite3.Cursor):
+        cursor.execute(
+            "UPDATE state SET value = value + 1 WHERE name = 'index_generation'"
+        )
+
+    def get_document(self, filepath: str) -> Optional[sqlite3.Row]:
+        """Return the documents row for a path, if any"""
+        rows = self.query(
+            """
+            SELECT id, file_hash, file_size, mtime_ns, inode FROM documents
+            WHERE filepath = ?
+        """,
+            (str(filepath),),
+        )
+        return rows[0] if rows else None
+
+    def is_hash_processed(self, file_hash: str) -> bool:
+        """Check if a document with this content hash is already processed"""
+        return bool(self.query("SELECT 1 FROM documents WHERE file_hash = ?", (file_hash,)))
+
+    def count_documents(self) -> int:
+        return self.query("SELECT COUNT(*) FROM documents")[0][0]
+
+    def record_documents(self, cursor: sqlite3.Cursor, rows: List[Tuple]):
+        """Record (filepath, file_hash, chunk_count, file_stat) rows
+
+        A path already recorded keeps its row, id and processed_date; only
+        its hash, chunk count and stat signature are updated. file_stat should
+        be taken before the file was hashed, so a write racing the ingest
+        still looks changed.
+        """
+        cursor.executemany(
+            """
+            INSERT INTO documents
+                (filename, filepath, file_hash, chunk_count, file_size, mtime_ns, inode)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(filepath) DO UPDATE SET
+                file_hash = excluded.file_hash,
+                chunk_count = excluded.chunk_count,
+                file_size = excluded.file_size,
+                mtime_ns = excluded.mtime_ns,
+                inode = excluded.inode
+        """,
+            [
+                (Path(filepath).name, str(filepath), file_hash, chunk_count)
+                + file_signature(file_stat)
+                for filepath, file_hash, chunk_count, file_stat in rows
+            ],
+        )
+        self.forget_skipped(cursor, [row[0] for row in rows])
+        self.bump_generation(cursor)
+
+    def delete_document(self, cursor: sqlite3.Cursor, filepath: str):
+        """Drop a document's row and chunk rows"""
+        cursor.execute("DELETE FROM documents WHERE filepath = ?", (filepath,))
+        cursor.execute("DELETE FROM chunks WHERE filepath = ?", (filepath,))
+        self.forget_skipped(cursor, [filepath])
+        self.bump_generation(cursor)
+
+    def get_skipped(self, filepath: str) -> Optional[sqlite3.Row]:
+        """Return the skipped-duplicate row for a path, if any"""
+        rows = self.query(
+            "SELECT file_hash, file_size, mtime_ns, inode FROM skipped WHERE filepath = ?",
+            (str(filepath),),
+        )
+        return rows[0] if rows else None
+
+    def record_skipped(self, filepath: str, file_hash: str, file_stat: os.stat_result):
+        """Remember the stat of a new path skipped as a copy of an indexed file"""
+        with self.transaction() as cursor:
+            cursor.execute(
+                """
+                INSERT OR REPLACE INTO skipped (filepath, file_hash, file_size, mtime_ns, inode)
+                VALUES (?, ?, ?, ?, ?)
+            """,
+                (str(filepath), file_hash) + file_signature(file_stat),
+            )
+
+    @staticmethod
+    def forget_skipped(cursor: sqlite3.Cursor, filepaths: List[str]):
+        cursor.executemany(
+            "DELETE FROM skipped WHERE filepath = ?", [(str(path),) for path in filepaths]
+        )
+
+    def update_file_stat(self, filepath: str, file_stat: os.stat_result):
+        """Refresh the stat index for a file whose content did not change"""
+        with self.transaction() as cursor:
+            cursor.execute(
+                "UPDATE documents SET file_size = ?, mtime_ns = ?, inode = ? WHERE filepath = ?",
+                file_signature(file_stat) + (str(filepath),),
+            )
+
+    def record_chunks(
+        self, cursor: sqlite3.Cursor, ids: List[str], chunks: List[Chunk], metadatas: List[Dict]
+    ):
+        """Record where chunks came from, replacing rows with the same ids"""
+        cursor.executemany(
+            """
+            INSERT OR REPLACE INTO chunks
+                (chunk_id, filepath, chunk_index, chunk_hash, start_offset, end_offset)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """,
+            [
+                (
+                    chunk_id,
+                    metadata["filepath"],
+                    metadata["chunk_index"],
+                    chunk_hash(chunk.text),
+                    chunk.start,
+                    chunk.end,
+                )
+                for chunk_id, chunk, metadata in zip(ids, chunks, metadatas)
+            ],
+        )
+
+    def delete_chunks(self, cursor: sqlite3.Cursor, ids: List[str]):
+        for start in range(0, len(ids), SQL_BATCH):
+            batch = ids[start : start + SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            cursor.execute(f"DELETE FROM chunks WHERE chunk_id IN ({placeholders})", batch)
+
+    def document_paths(self, directory: str) -> List[str]:
+        """Paths of indexed documents under a directory"""
+        rows = self.query(
+            "SELECT filepath FROM documents WHERE filepath LIKE ? ESCAPE '\\'",
+            (_like_prefix(str(Path(directory).resolve()) + os.sep),),
+        )
+        return [row[0] for row in rows]
+
+    def skipped_paths(self, directory: str) -> List[str]:
+        """Paths under a directory skipped as copies of indexed files"""
+        rows = self.query(
+            "SELECT filepath FROM skipped WHERE filepath LIKE ? ESCAPE '\\'",
+            (_like_prefix(str(Path(directory).resolve()) + os.sep),),
+        )
+        return [row[0] for row in rows]
+
+    def file_index(self, directory: str) -> Dict[str, Tuple[int, int, int]]:
+        """Map indexed paths under a directory to their recorded stat signature"""
+        rows = self.query(
+            """
+            SELECT filepath, file_size, mtime_ns, inode FROM documents
+            WHERE filepath LIKE ? ESCAPE '\\'
+        """,
+            (_like_prefix(str(Path(directory).resolve()) + os.sep),),
+        )
+        return {row[0]: tuple(row[1:]) for row in rows}
+
+    def matching_paths(self, filenames: Tuple[str, ...], path_prefix: Optional[str]) -> List[str]:
+        """Paths of documents named like any of `filenames` (globs) under `path_prefix`"""
+        conditions, params = [], []
+        if filenames:
+            conditions.append("(" + " OR ".join(["filename GLOB ?"] * len(filenames)) + ")")
+            params.extend(filenames)
+        if path_prefix:
+            conditions.append("filepath LIKE ? ESCAPE '\\'")
+            params.append(_like_prefix(path_prefix))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        try:
+            rows = self.query(f"SELECT filepath FROM documents {where}", tuple(params))
+        except sqlite3.OperationalError:
+            return []
+        return [row[0] for row in rows]
+
+    def list_documents(
+        self, limit: int, offset: int = 0, pattern: Optional[str] = None
+    ) -> Tuple[int, List[sqlite3.Row]]:
+        """One page of documents ordered by path, and the total matching
+
+        `pattern` is a glob matched against file names, e.g. "*.pdf".
+        """
+        where, params = "", ()
+        if pattern:
+            where, params = "WHERE filename GLOB ?", (pattern,)
+        total = self.query(f"SELECT COUNT(*) FROM documents {where}", params)[0][0]
+        rows = self.query(
+            f"""
+            SELECT filename, filepath, processed_date, chunk_count FROM documents
+            {where} ORDER BY filepath LIMIT ? OFFSET ?
+        """,
+            params + (limit, offset),
+        )
+        return total, rows
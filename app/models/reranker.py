@@ -0,0 +1,168 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from models.config import Config
+from models.context_builder import estimate_tokens
+from models.dependencies import require
+from models.tracing import tracer
+
+
+@dataclass
+class RerankStats:
+    """What re-ranking cost and what it kept out of the prompt"""
+
+    questions: int = 0
+    candidates: int = 0
+    kept: int = 0
+    cached: int = 0  # pair scores served from the cache
+    seconds: float = 0.0
+    tokens_saved: int = 0  # estimated document tokens of the candidates dropped
+
+    def report(self) -> str:
+        return (
+            f"re-rank: {self.candidates} -> {self.kept} chunks in "
+            f"{self.seconds * 1000:.0f} ms ({self.cached} scores cached), "
+            f"~{self.tokens_saved} prompt tokens saved"
+        )
+
+
+class Reranker:
+    """Orders retrieved chunks by a cross-encoder's relevance score
+
+    A cross-encoder reads the question and a chunk together, so it ranks
+    far better than embedding distance but is too slow to run over the
+    whole index. It is run over the `rerank_candidates` chunks a cheap
+    search found, and only the best `max_results` go on to the prompt.
+
+    Pairs not scored before are scored in one batched call. Scores are
+    kept in an in-process LRU keyed by a hash of the (question, chunk)
+    pair, so repeated questions and chunks shared between questions are
+    not scored twice.
+    """
+
+    _shared: Dict[tuple, "Reranker"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        model_name: str,
+        batch_size: int = 32,
+        device: Optional[str] = None,
+        cache_size: int = 10000,
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.device = device
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._model = None
+        self._lock = threading.Lock()
+        # pair hash -> score, least recently used first
+        self._scores: OrderedDict = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, config: Config) -> "Reranker":
+        """Return the process-wide reranker for the configured model"""
+        key = (
+            config.config["rerank_model"],
+            config.config["rerank_batch_size"],
+            config.config["embedding_device"],
+            config.config["rerank_cache_size"],
+        )
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(*key)
+            return cls._shared[key]
+
+    @property
+    def model(self):
+        """Load the cross-encoder on first use"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    st = require("sentence_transformers", "sentence-transformers")
+                    self._model = st.CrossEncoder(self.model_name, device=self.device)
+        return self._model
+
+    @staticmethod
+    def pair_key(question: str, text: str) -> bytes:
+        pair = question.encode("utf-8") + b"\0" + text.encode("utf-8")
+        return hashlib.blake2b(pair, digest_size=16).digest()
+
+    def score(self, pairs: List[Tuple[str, str]]) -> Tuple[List[float], int]:
+        """Scores for (question, text) pairs and how many came from the cache"""
+        keys = [self.pair_key(question, text) for question, text in pairs]
+        scores: Dict[bytes, float] = {}
+        with self._cache_lock:
+            for key in keys:
+                if key in self._scores:
+                    self._scores.move_to_end(key)
+                    scores[key] = self._scores[key]
+
+        missing: Dict[bytes, Tuple[str, str]] = {}
+        for key, pair in zip(keys, pairs):
+            if key not in scores:
+                missing.setdefault(key, pair)
+        cached = sum(1 for key in keys if key not in missing)
+        with self._cache_lock:
+            self.hits += cached
+            self.misses += len(keys) - cached
+
+        if missing:
+            predicted = self.model.predict(
+                list(missing.values()),
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+            )
+            found = dict(zip(missing, (float(score) for score in predicted)))
+            scores.update(found)
+            with self._cache_lock:
+                self._scores.update(found)
+                while len(self._scores) > self.cache_size:
+                    self._scores.popitem(last=False)
+        return [scores[key] for key in keys], cached
+
+    def rerank_many(
+        self, questions: List[str], doc_lists: List[List[Dict]], top_n: int
+    ) -> Tuple[List[List[Dict]], RerankStats]:
+        """The best `top_n` chunks for each question, all pairs scored in one call
+
+        Each kept chunk gets its score as "rerank_score".
+        """
+        stats = RerankStats(questions=len(questions))
+        pairs = [
+            (question, doc["content"])
+            for question, docs in zip(questions, doc_lists)
+            for doc in docs
+        ]
+        if not pairs:
+            return [list(docs) for docs in doc_lists], stats
+
+        start = time.perf_counter()
+        with tracer.span("query.rerank", pairs=len(pairs)) as span:
+            scores, stats.cached = self.score(pairs)
+            span.attributes["cached"] = stats.cached
+
+        ranked_lists = []
+        position = 0
+        for docs in doc_lists:
+            doc_scores = scores[position : position + len(docs)]
+            position += len(docs)
+            # Stable, so equal scores keep their retrieval order
+            order = sorted(range(len(docs)), key=lambda i: -doc_scores[i])
+            kept = []
+            for rank, i in enumerate(order):
+                if rank < top_n:
+                    kept.append(dict(docs[i], rerank_score=doc_scores[i]))
+                else:
+                    stats.tokens_saved += estimate_tokens(docs[i]["content"])
+            ranked_lists.append(kept)
+            stats.candidates += len(docs)
+            stats.kept += len(kept)
+        stats.seconds = time.perf_counter() - start
+        return ranked_lists, stats
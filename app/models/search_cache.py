@@ -0,0 +1,116 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Embeddings equal to this precision share a cache entry
+QUANTIZATION_STEP = 1e-4
+# Rough per-result bookkeeping overhead on top of the text it holds
+_RESULT_OVERHEAD = 256
+
+
+class SearchCache:
+    """In-process LRU cache of search results
+
+    Keyed on the quantized query embedding, the number of results, the
+    retrieval mode and the search filter. Each
+    entry remembers the index generation it was computed at; any ingest bumps
+    the generation, so results from before it are never served. Bounded by
+    the approximate memory held, evicting least recently used entries.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        # key -> (generation, size, results), least recently used first
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(
+        embedding: np.ndarray, n_results: int, mode: str, filter_key: str = ""
+    ) -> Tuple[bytes, int, str, str]:
+        quantized = np.round(np.asarray(embedding) / QUANTIZATION_STEP).astype(np.int32)
+        digest = hashlib.blake2b(quantized.tobytes(), digest_size=16).digest()
+        return digest, n_results, mode, filter_key
+
+    @staticmethod
+    def size_of(results: List[Dict]) -> int:
+        return sum(
+            len(result["content"]) + len(str(result["metadata"])) + _RESULT_OVERHEAD
+            for result in results
+        )
+
+    def get(
+        self,
+        embedding: np.ndarray,
+        n_results: int,
+        generation: int,
+        mode: str = "vector",
+        filter_key: str = "",
+    ) -> Optional[List[Dict]]:
+        key = self.key(embedding, n_results, mode, filter_key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] != generation:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # Callers may annotate results; keep the cached ones intact
+        return [dict(result) for result in entry[2]]
+
+    def put(
+        self,
+        embedding: np.ndarray,
+        n_results: int,
+        generation: int,
+        results: List[Dict],
+        mode: str = "vector",
+        filter_key: str = "",
+    ):
+        size = self.size_of(results)
+        if size > self.max_bytes:
+            return
+        key = self.key(embedding, n_results, mode, filter_key)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (generation, size, [dict(result) for result in results])
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Tuple[bytes, int, str, str]):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+        }
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (
+            f"Search cache: {stats['hits']} hits, {stats['misses']} misses, "
+            f"hit rate {stats['hit_rate']:.0%}, {stats['entries']} entries "
+            f"({stats['bytes'] / 1e6:.1f} MB)"
+        )
@@ -0,0 +1,420 @@
+import json
+import asyncio
+import queue
+import threading
+import time
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from models.config import Config, check_collection_name
+from models.assistant import Assistant, AsyncAssistant
+from models.document_processor import DocumentProcessor
+from models.filters import SearchFilter
+from models.lexical_index import RETRIEVAL_MODES
+from models.tracing import tracer
+
+# Marks the end of a token stream handed from the event loop to a handler
+_DONE = object()
+
+
+def check_retrieval_mode(mode: Optional[str]) -> Optional[str]:
+    """Validate a request's retrieval mode up front, before any stream starts"""
+    if mode is not None and mode not in RETRIEVAL_MODES:
+        raise ValueError(f"unknown retrieval_mode {mode!r}")
+    return mode
+
+
+def request_collections(body: Dict) -> Optional[Tuple[str, ...]]:
+    """A request's "collection": a name, comma-separated names or a list"""
+    collections = body.get("collection")
+    if collections is None:
+        return None
+    if isinstance(collections, str):
+        collections = collections.split(",")
+    if not isinstance(collections, list) or not collections:
+        raise ValueError("collection must be a name or a list of names")
+    return tuple(check_collection_name(str(name).strip()) for name in collections)
+
+
+def sum_counters(stats: List[Dict]) -> Dict:
+    """Add up cache counters from several assistants, recomputing the hit rate"""
+    total = {key: sum(entry[key] for entry in stats) for key in stats[0] if key != "hit_rate"}
+    lookups = total["hits"] + total["misses"]
+    total["hit_rate"] = total["hits"] / lookups if lookups else 0.0
+    return total
+
+
+class ServerBusy(Exception):
+    """Raised when the request queue is full or a queued request timed out"""
+
+
+class Admission:
+    """Bound concurrent requests and the number allowed to wait for a slot"""
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.waiting = 0
+        self.active = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        with self.lock:
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise ServerBusy("request queue is full")
+            self.waiting += 1
+        acquired = self.slots.acquire(timeout=self.queue_timeout)
+        with self.lock:
+            self.waiting -= 1
+            if not acquired:
+                self.rejected += 1
+                raise ServerBusy("timed out waiting in the request queue")
+            self.active += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self.lock:
+            self.active -= 1
+        self.slots.release()
+
+
+class APIServer:
+    """Long-lived process keeping the assistant and processor warm over HTTP
+
+    Endpoints:
+      POST /query   {"question": str, "stream": bool, "retrieval_mode": str,
+                     "collection": str | [str], "filter": {...}}
+                    JSON or SSE tokens
+      POST /search  {"query": str, "max_results": int, "retrieval_mode": str,
+                     "collection": str | [str], "filter": {...}}
+      POST /ingest  {"path": str, "mode": "add" | "sync", "collection": str,
+                     "tags": [str]}
+      GET  /stats
+      GET  /metrics Prometheus per-stage timings
+
+    Requests without a collection use the one the server was started with;
+    queries naming several search them all. A "filter" takes "filename",
+    "path_prefix", "file_type", "since", "until" and "tags" (see SearchFilter).
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.admission = Admission(
+            config.config["server_max_concurrency"],
+            config.config["server_max_queue"],
+            config.config["server_queue_timeout"],
+        )
+        self.started = time.time()
+        self.counters: Dict[str, Dict[str, float]] = {}
+        self.counters_lock = threading.Lock()
+
+        # Ingestion is serialized; queries run concurrently on the loop
+        self.ingest_lock = threading.Lock()
+        # Held only to look up or add a processor, so /stats never waits on an ingest
+        self.processors: Dict[str, DocumentProcessor] = {}
+        self.processors_lock = threading.Lock()
+        # One assistant per set of collections queried together
+        self.assistants: Dict[Tuple[str, ...], AsyncAssistant] = {}
+        self.assistant_lock = threading.Lock()
+
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def get_processor(self, collection: Optional[str] = None) -> DocumentProcessor:
+        collection = collection or self.config.collection
+        with self.processors_lock:
+            if collection not in self.processors:
+                self.processors[collection] = DocumentProcessor(
+                    self.config.for_collection(collection, create=True)
+                )
+            return self.processors[collection]
+
+    def get_assistant(self, collections: Optional[Tuple[str, ...]] = None) -> AsyncAssistant:
+        """Build an assistant on first use; raises LookupError before any ingest"""
+        collections = collections or (self.config.collection,)
+        with self.assistant_lock:
+            if collections not in self.assistants:
+                try:
+                    assistant = Assistant(self.config, collections)
+                except SystemExit:
+                    raise LookupError("No documents found. Ingest documents first.")
+                self.assistants[collections] = AsyncAssistant(self.config, assistant)
+            return self.assistants[collections]
+
+    def run_async(self, coroutine):
+        """Run a coroutine on the server loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def stream_answer(
+        self,
+        question: str,
+        mode: Optional[str] = None,
+        collections: Optional[Tuple[str, ...]] = None,
+        filters: Optional[SearchFilter] = None,
+    ) -> Iterator[str]:
+        """Iterate an async token stream from a handler thread"""
+        assistant = self.get_assistant(collections)
+        tokens: queue.Queue = queue.Queue()
+
+        async def pump():
+            try:
+                async for token in assistant.answer_question_stream(question, mode, filters):
+                    tokens.put(token)
+            except Exception as e:
+                tokens.put(f"Error: {e}")
+            finally:
+                tokens.put(_DONE)
+
+        asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        while True:
+            token = tokens.get()
+            if token is _DONE:
+                return
+            yield token
+
+    def record(self, endpoint: str, elapsed: float, ok: bool):
+        with self.counters_lock:
+            counter = self.counters.setdefault(
+                endpoint, {"requests": 0, "errors": 0, "total_seconds": 0.0}
+            )
+            counter["requests"] += 1
+            counter["errors"] += 0 if ok else 1
+            counter["total_seconds"] += elapsed
+
+    def stats(self) -> Dict:
+        with self.counters_lock:
+            endpoints = {
+                name: dict(
+                    counter,
+                    avg_seconds=counter["total_seconds"] / max(counter["requests"], 1),
+                )
+                for name, counter in self.counters.items()
+            }
+        stats = {
+            "uptime_seconds": time.time() - self.started,
+            "active_requests": self.admission.active,
+            "queued_requests": self.admission.waiting,
+            "rejected_requests": self.admission.rejected,
+            "endpoints": endpoints,
+        }
+        with self.processors_lock:
+            processors = dict(self.processors)
+        if processors:
+            stats["collections"] = {
+                name: {"chunks": processor.vector_store.count()}
+                for name, processor in processors.items()
+            }
+            stats["chunks"] = sum(entry["chunks"] for entry in stats["collections"].values())
+            # The embedding cache is shared, so any processor's counters will do
+            cache = next(iter(processors.values())).embedding_cache
+            if cache is not None:
+                stats["embedding_cache"] = {"hits": cache.hits, "misses": cache.misses}
+        with self.assistant_lock:
+            assistants = [entry.assistant for entry in self.assistants.values()]
+        search_caches = [
+            assistant.search_cache.stats()
+            for assistant in assistants
+            if assistant.search_cache is not None
+        ]
+        answer_caches = [
+            assistant.answer_cache.stats()
+            for assistant in assistants
+            if assistant.answer_cache is not None
+        ]
+        if search_caches:
+            stats["search_cache"] = sum_counters(search_caches)
+        if answer_caches:
+            stats["answer_cache"] = sum_counters(answer_caches)
+        return stats
+
+    def ingest(
+        self,
+        path: str,
+        mode: str,
+        collection: Optional[str] = None,
+        tags: Tuple[str, ...] = (),
+    ) -> Dict:
+        processor = self.get_processor(collection)
+        target = Path(path)
+        if not target.exists():
+            raise FileNotFoundError(f"Path not found: {path}")
+
+        with self.ingest_lock, processor.tagging(tags):
+            if mode == "sync":
+                if target.is_dir():
+                    result = asdict(processor.sync_directory(path))
+                else:
+                    result = asdict(processor.sync_document(path))
+            elif target.is_dir():
+                result = {"chunks": processor.process_directory(path)}
+            else:
+                result = {"chunks": processor.process_document(path)}
+            processor.flush()
+        return result
+
+    def serve(self, host: Optional[str] = None, port: Optional[int] = None):
+        """Serve until interrupted"""
+        host = host or self.config.config["server_host"]
+        port = port or self.config.config["server_port"]
+        self.loop_thread.start()
+
+        httpd = ThreadingHTTPServer((host, port), _RequestHandler)
+        httpd.daemon_threads = True
+        httpd.app = self
+        print(f"Serving on http://{host}:{port} (Ctrl+C to stop)")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\nShutting down.")
+        finally:
+            httpd.server_close()
+            for async_assistant in self.assistants.values():
+                self.run_async(async_assistant.aclose())
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def app(self) -> APIServer:
+        return self.server.app
+
+    def send_json(self, status: int, body: Dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_text(self, status: int, text: str, content_type: str):
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def do_GET(self):
+        endpoint = urlparse(self.path).path
+        if endpoint == "/stats":
+            self.send_json(200, self.app.stats())
+        elif endpoint == "/metrics":
+            self.send_text(200, tracer.prometheus(), "text/plain; version=0.0.4")
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        endpoint = urlparse(self.path).path
+        handlers = {
+            "/query": self.handle_query,
+            "/search": self.handle_search,
+            "/ingest": self.handle_ingest,
+        }
+        handler = handlers.get(endpoint)
+        if handler is None:
+            self.send_json(404, {"error": "not found"})
+            return
+
+        start = time.perf_counter()
+        ok = False
+        try:
+            body = self.read_json()
+            with self.app.admission:
+                handler(body)
+            ok = True
+        except ServerBusy as e:
+            self.send_json(503, {"error": str(e)})
+        except (KeyError, ValueError) as e:
+            self.send_json(400, {"error": f"bad request: {e}"})
+        except (LookupError, FileNotFoundError) as e:
+            self.send_json(404, {"error": str(e)})
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+        finally:
+            self.app.record(endpoint, time.perf_counter() - start, ok)
+
+    def handle_query(self, body: Dict):
+        question = body["question"]
+        mode = check_retrieval_mode(body.get("retrieval_mode"))
+        collections = request_collections(body)
+        filters = SearchFilter.from_dict(body.get("filter"))
+        if not body.get("stream"):
+            answer = self.app.run_async(
+                self.app.get_assistant(collections).answer_question(question, mode, filters)
+            )
+            self.send_json(200, {"answer": answer})
+            return
+
+        tokens = self.app.stream_answer(question, mode, collections, filters)
+        # Send headers only once the stream has started, so lookup errors
+        # can still become a normal JSON response
+        first = next(tokens, "")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            if first:
+                self.write_event({"token": first})
+            for token in tokens:
+                self.write_event({"token": token})
+            self.wfile.write(b"event: done\ndata: {}\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def write_event(self, data: Dict):
+        self.wfile.write(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def handle_search(self, body: Dict):
+        results = self.app.run_async(
+            self.app.get_assistant(request_collections(body)).search_documents(
+                body["query"],
+                body.get("max_results"),
+                check_retrieval_mode(body.get("retrieval_mode")),
+                SearchFilter.from_dict(body.get("filter")),
+            )
+        )
+        self.send_json(200, {"results": results})
+
+    def handle_ingest(self, body: Dict):
+        mode = body.get("mode", "add")
+        if mode not in ("add", "sync"):
+            raise ValueError(f"unknown mode {mode!r}")
+        collections = request_collections(body)
+        if collections and len(collections) > 1:
+            raise ValueError("documents are ingested into one collection at a time")
+        tags = body.get("tags") or []
+        if isinstance(tags, str):
+            tags = tags.split(",")
+        if not isinstance(tags, list):
+            raise ValueError("tags must be a name or a list of names")
+        self.send_json(
+            200,
+            self.app.ingest(
+                body["path"],
+                mode,
+                collections[0] if collections else None,
+                tuple(str(tag).strip() for tag in tags if str(tag).strip()),
+            ),
+        )
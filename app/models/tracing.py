@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import logging
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+# Spans are logged here as JSON lines; models.logging.Logger attaches the file
+TRACE_LOGGER = "local_lm_assistant.trace"
+# Histogram bucket bounds (seconds) for the Prometheus export
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_NAME = "local_lm_assistant_stage_seconds"
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+@dataclass
+class Span:
+    """One timed stage; nested spans share the trace id of their root"""
+
+    name: str
+    span_id: int
+    parent_id: Optional[int]
+    trace_id: int
+    started: float
+    attributes: Dict = field(default_factory=dict)
+    duration: float = 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "trace_id": f"{os.getpid()}-{self.trace_id}",
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": round(self.started, 6),
+            "duration_ms": round(self.duration * 1000, 3),
+            **self.attributes,
+        }
+
+
+@dataclass
+class SpanStats:
+    """Aggregate timings of every span with one name"""
+
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    buckets: List[int] = field(default_factory=lambda: [0] * len(BUCKETS))
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+
+class Tracer:
+    """Lightweight timing spans for the ingest and query hot paths
+
+    Every span feeds per-stage aggregates (for --profile and Prometheus
+    metrics); when trace logging is on, each finished span is also logged
+    as one JSON line. The current span follows threads and asyncio tasks
+    through a context variable, so nested stages link to their parent.
+    """
+
+    def __init__(self):
+        self.stats: Dict[str, SpanStats] = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(TRACE_LOGGER)
+        # Off until Logger enables it; spans are still aggregated
+        self.logger.setLevel(logging.WARNING)
+        self.logger.propagate = False
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """Time the enclosed block; attributes may be added to the yielded span"""
+        parent = _current_span.get()
+        span_id = next(_span_ids)
+        span = Span(
+            name,
+            span_id,
+            parent.span_id if parent else None,
+            parent.trace_id if parent else span_id,
+            time.time(),
+            attributes,
+        )
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - start
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # A generator closed from another context (e.g. garbage collected)
+                pass
+            self._finish(span)
+
+    def record(self, name: str, seconds: float, **attributes):
+        """Add a stage timed elsewhere (e.g. by Ollama) under the current span"""
+        parent = _current_span.get()
+        span_id = next(_span_ids)
+        span = Span(
+            name,
+            span_id,
+            parent.span_id if parent else None,
+            parent.trace_id if parent else span_id,
+            time.time() - seconds,
+            attributes,
+            seconds,
+        )
+        self._finish(span)
+
+    def record_ollama(self, result: Dict):
+        """Record the server-side timings in Ollama's final response object"""
+        for key, name in (
+            ("load_duration", "ollama.load"),
+            ("prompt_eval_duration", "ollama.prompt_eval"),
+            ("eval_duration", "ollama.eval"),
+        ):
+            if result.get(key):
+                self.record(
+                    name,
+                    result[key] / 1e9,
+                    prompt_tokens=result.get("prompt_eval_count", 0),
+                    tokens=result.get("eval_count", 0),
+                )
+
+    def _finish(self, span: Span):
+        with self._lock:
+            self.stats.setdefault(span.name, SpanStats()).add(span.duration)
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(json.dumps(span.to_dict(), default=str))
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+
+    def report(self) -> str:
+        """Per-stage breakdown, in the order stages first ran"""
+        with self._lock:
+            stats = list(self.stats.items())
+        if not stats:
+            return "No stages were timed."
+        lines = [f"{'stage':<28} {'calls':>6} {'total ms':>10} {'mean ms':>9} {'max ms':>9}"]
+        for name, stage in stats:
+            lines.append(
+                f"{name:<28} {stage.count:>6} {stage.total * 1000:>10.1f} "
+                f"{stage.total / stage.count * 1000:>9.1f} {stage.max * 1000:>9.1f}"
+            )
+        return "\n".join(lines)
+
+    def prometheus(self) -> str:
+        """Stage timings in the Prometheus text exposition format"""
+        with self._lock:
+            stats = [
+                (name, SpanStats(stage.count, stage.total, stage.max, list(stage.buckets)))
+                for name, stage in self.stats.items()
+            ]
+        lines = [
+            f"# HELP {METRIC_NAME} Time spent in each ingest and query stage",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        for name, stage in stats:
+            label = f'stage="{name}"'
+            for bound, count in zip(BUCKETS, stage.buckets):
+                lines.append(f'{METRIC_NAME}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{METRIC_NAME}_bucket{{{label},le="+Inf"}} {stage.count}')
+            lines.append(f"{METRIC_NAME}_sum{{{label}}} {stage.total:.6f}")
+            lines.append(f"{METRIC_NAME}_count{{{label}}} {stage.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Write the metrics for a textfile collector, replacing the file atomically"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.prometheus())
+        os.replace(tmp_path, path)
+
+
+# Process-wide tracer used by every module
+tracer = Tracer()
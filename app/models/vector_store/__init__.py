@@ -0,0 +1,34 @@
+from models.config import Config
+from .base import COLLECTION_NAME, VectorStore
+
+
+def create_vector_store(config: Config, read_only: bool = False) -> VectorStore:
+    """Open the backend selected by the "vector_store" setting
+
+    Read-only stores are for querying: they never create a collection and
+    FAISS indexes are memory-mapped instead of loaded.
+    """
+    backend = config.config["vector_store"]
+    if backend == "faiss":
+        from .faiss_store import FaissVectorStore
+
+        return FaissVectorStore(
+            config.faiss_path / COLLECTION_NAME,
+            index_type=config.config["faiss_index_type"],
+            nlist=config.config["faiss_nlist"],
+            nprobe=config.config["faiss_nprobe"],
+            hnsw_m=config.config["faiss_hnsw_m"],
+            ef_search=config.config["faiss_ef_search"],
+            read_only=read_only,
+            quantization=config.config["faiss_quantization"],
+            pq_m=config.config["faiss_pq_m"],
+            rerank_factor=config.config["faiss_rerank_factor"],
+        )
+    if backend == "chroma":
+        from .chroma_store import ChromaVectorStore
+
+        return ChromaVectorStore(config.db_path, create=not read_only)
+    raise ValueError(f"Unknown vector store {backend!r}; use 'chroma' or 'faiss'")
+
+
+__all__ = ["COLLECTION_NAME", "VectorStore", "create_vector_store"]
@@ -0,0 +1,55 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from models.filters import SearchFilter
+
+COLLECTION_NAME = "documents"
+
+
+class VectorStore(ABC):
+    """Chunk embeddings with their text and metadata, searchable by similarity
+
+    Query results are lists of {"id", "content", "metadata", "distance"}
+    dicts, nearest first, with cosine distances (0 = same direction) for
+    every backend.
+    """
+
+    @abstractmethod
+    def add(
+        self,
+        ids: List[str],
+        embeddings: np.ndarray,
+        documents: List[str],
+        metadatas: List[Dict],
+    ):
+        """Add chunks; ids must not already be stored"""
+
+    @abstractmethod
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict]):
+        """Replace the metadata of stored chunks"""
+
+    @abstractmethod
+    def delete(self, ids: List[str]):
+        """Remove chunks by id"""
+
+    @abstractmethod
+    def get_metadatas(self, filepath: str) -> Dict[str, Dict]:
+        """Map the ids of a file's stored chunks to their metadata"""
+
+    @abstractmethod
+    def query(
+        self, embeddings: np.ndarray, n_results: int, filters: Optional[SearchFilter] = None
+    ) -> List[List[Dict]]:
+        """Nearest chunks for each row of `embeddings`
+
+        With `filters` (resolved), only matching chunks are searched.
+        """
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored chunks"""
+
+    def flush(self):
+        """Persist pending writes; backends that write through need nothing"""
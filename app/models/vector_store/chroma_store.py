@@ -0,0 +1,94 @@
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from models.dependencies import require
+from models.filters import SearchFilter
+from models.vector_store.base import COLLECTION_NAME, VectorStore
+
+
+class ChromaVectorStore(VectorStore):
+    """Vector store on a ChromaDB persistent collection"""
+
+    def __init__(self, path: Path, name: str = COLLECTION_NAME, create: bool = True):
+        chromadb = require("chromadb")
+        self.client = chromadb.PersistentClient(
+            path=str(path),
+            settings=chromadb.config.Settings(anonymized_telemetry=False),
+        )
+        self.name = name
+        self.create = create
+        self._collection = None
+
+    @property
+    def collection(self):
+        """The collection, created on first use unless opened read-only"""
+        if self._collection is None:
+            try:
+                self._collection = self.client.get_collection(self.name)
+            except Exception:
+                if not self.create:
+                    return None
+                self._collection = self.client.create_collection(
+                    name=self.name,
+                    metadata={
+                        "description": "Document chunks for RAG",
+                        "hnsw:space": "cosine",
+                    },
+                )
+        return self._collection
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: np.ndarray,
+        documents: List[str],
+        metadatas: List[Dict],
+    ):
+        self.collection.add(
+            ids=ids,
+            documents=documents,
+            embeddings=np.asarray(embeddings).tolist(),
+            metadatas=metadatas,
+        )
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict]):
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids: List[str]):
+        if ids:
+            self.collection.delete(ids=ids)
+
+    def get_metadatas(self, filepath: str) -> Dict[str, Dict]:
+        if self.collection is None:
+            return {}
+        stored = self.collection.get(where={"filepath": filepath}, include=["metadatas"])
+        return dict(zip(stored["ids"], stored["metadatas"]))
+
+    def query(
+        self, embeddings: np.ndarray, n_results: int, filters: Optional[SearchFilter] = None
+    ) -> List[List[Dict]]:
+        embeddings = np.asarray(embeddings)
+        if self.collection is None or (filters is not None and filters.matches_nothing):
+            return [[] for _ in embeddings]
+        # Chroma applies `where` before the nearest-neighbour search
+        where = filters.chroma_where() if filters is not None else None
+        results = self.collection.query(
+            query_embeddings=embeddings.tolist(), n_results=n_results, where=where
+        )
+        return [
+            [
+                {
+                    "id": chunk_id,
+                    "content": results["documents"][q][i],
+                    "metadata": results["metadatas"][q][i],
+                    "distance": results["distances"][q][i] if results.get("distances") else 0,
+                }
+                for i, chunk_id in enumerate(results["ids"][q])
+            ]
+            for q in range(len(embeddings))
+        ]
+
+    def count(self) -> int:
+        return 0 if self.collection is None else self.collection.count()
@@ -0,0 +1,657 @@
+import os
+import json
+import math
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from models.dependencies import require
+from models.filters import SearchFilter
+from models.metadata_store import SQL_BATCH
+from models.vector_store.base import VectorStore
+from models.vector_store.vector_file import VectorFile
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+QUANTIZATIONS = ("none", "fp16", "int8", "pq")
+# IVF is trained once there are this many vectors per list; flat until then
+IVF_TRAINING_FACTOR = 39
+# Bits per product-quantizer code; 256 centroids per subvector
+PQ_BITS = 8
+# int8 learns each dimension's range from at least this many vectors
+SQ_TRAINING_MIN = 1000
+# Full-precision vectors scanned at a time by exact filtered searches
+_SCAN_ROWS = 65536
+# Indexes that can't delete in place (HNSW) are rebuilt past this dead share
+MAX_ORPHAN_RATIO = 0.2
+
+
+class FaissVectorStore(VectorStore):
+    """Vector store on a FAISS index, with chunk text and metadata in SQLite
+
+    Vectors are L2-normalized and searched by inner product, i.e. cosine
+    similarity. FAISS ids are the rowids of the SQLite chunks table, which
+    maps them back to chunk ids, text and metadata.
+
+    Writes are kept in memory until flush(), which saves the index
+    atomically and only then commits the chunk rows, so a crash never
+    leaves rows whose vectors were not saved. Read-only stores never write:
+    they open chunks.db read-only, memory-map the saved index and reload it
+    when a writer replaces the file.
+
+    Index types:
+      flat  exact search, cost linear in the number of chunks
+      ivf   inverted lists probed `nprobe` at a time; stays flat until there
+            are enough vectors to train it
+      hnsw  graph search, fastest at millions of chunks; deleted vectors are
+            skipped at query time and compacted away on flush
+
+    Quantization shrinks the vectors the index holds in memory:
+      none  float32, 4 bytes per dimension
+      fp16  half precision, 2 bytes per dimension
+      int8  one byte per dimension, ranges learned once there are enough vectors
+      pq    product quantization, `pq_m` one-byte codes per vector (default
+            one per 8 dimensions), trained once there are enough vectors
+    Quantized stores also keep every vector in full precision in
+    vectors.f32, memory-mapped rather than loaded. Searches fetch
+    `rerank_factor` times as many candidates from the compact index and
+    re-rank them by their exact similarity. Until int8 or pq can be
+    trained, the index is exact, like an untrained IVF.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        index_type: str = "hnsw",
+        nlist: int = 0,
+        nprobe: int = 16,
+        hnsw_m: int = 32,
+        ef_search: int = 64,
+        read_only: bool = False,
+        quantization: str = "none",
+        pq_m: int = 0,
+        rerank_factor: int = 4,
+    ):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown FAISS index type {index_type!r}")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown FAISS quantization {quantization!r}")
+        self.faiss = require("faiss", "faiss-cpu")
+        self.directory = directory
+        if not read_only:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self.index_path = directory / "index.faiss"
+        self.chunks_path = directory / "chunks.db"
+        self.vectors_path = directory / "vectors.f32"
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.read_only = read_only
+        self.quantization = quantization
+        self.pq_m = pq_m
+        self.rerank_factor = max(1, rerank_factor)
+
+        self._index = None
+        self._vectors: Optional[VectorFile] = None
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._dirty = False
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # Query processes never write: the schema is the writer's to create
+        if not read_only:
+            self.init_db()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The store's one connection; its writes stay uncommitted until flush()"""
+        with self._lock:
+            if self._conn is None:
+                if self.read_only:
+                    self._conn = sqlite3.connect(
+                        self.chunks_path.resolve().as_uri() + "?mode=ro",
+                        uri=True,
+                        timeout=30,
+                        check_same_thread=False,
+                    )
+                else:
+                    self._conn = sqlite3.connect(
+                        self.chunks_path, timeout=30, check_same_thread=False
+                    )
+            return self._conn
+
+    def _select(self, sql: str, params: Iterable = ()) -> List[Tuple]:
+        if self.read_only and not self.chunks_path.exists():
+            # Nothing ingested yet, and a read-only store can't create the file
+            return []
+        with self._lock:
+            return self.conn.execute(sql, tuple(params)).fetchall()
+
+    def init_db(self):
+        conn = self.conn
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                faiss_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT UNIQUE NOT NULL,
+                filepath TEXT NOT NULL,
+                document TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunks_filepath ON chunks(filepath)")
+
+        # Row of each chunk's full-precision vector in vectors.f32 (quantized
+        # stores only); rows of deleted chunks are reused
+        cursor.execute("PRAGMA table_info(chunks)")
+        if "vector_row" not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute("ALTER TABLE chunks ADD COLUMN vector_row INTEGER")
+        cursor.execute("CREATE TABLE IF NOT EXISTS free_vector_rows (row INTEGER PRIMARY KEY)")
+        conn.commit()
+
+    @property
+    def keeps_vectors(self) -> bool:
+        """Whether full-precision vectors are kept next to a quantized index"""
+        return self.quantization != "none"
+
+    def vector_file(self, dimension: int) -> VectorFile:
+        if self._vectors is None or self._vectors.dimension != dimension:
+            self._vectors = VectorFile(self.vectors_path, dimension, self.read_only)
+        return self._vectors
+
+    def storage_bytes(self) -> Dict[str, int]:
+        """Bytes on disk of the saved index and the full-precision vectors"""
+        index_bytes = self.index_path.stat().st_size if self.index_path.exists() else 0
+        vector_bytes = self.vectors_path.stat().st_size if self.vectors_path.exists() else 0
+        return {"index": index_bytes, "vectors": vector_bytes}
+
+    def _file_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            file_stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return (file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size)
+
+    @property
+    def index(self):
+        """The loaded index, reloaded after another store saved a newer one"""
+        signature = self._file_signature()
+        if signature != self._signature and not self._dirty:
+            with self._lock:
+                if signature != self._signature and not self._dirty:
+                    self._index = self._read_index() if signature else None
+                    self._signature = signature
+                    if self._index is not None and not self.read_only:
+                        self._reserve_ids(self._index)
+        return self._index
+
+    def _index_ids(self, index) -> np.ndarray:
+        """Every FAISS id the index holds, deleted HNSW vectors included"""
+        if hasattr(index, "id_map"):
+            return self.faiss.vector_to_array(index.id_map)
+        invlists = self.faiss.extract_index_ivf(index).invlists
+        return np.concatenate(
+            [np.zeros(0, dtype=np.int64)]
+            + [
+                self.faiss.rev_swig_ptr(invlists.get_ids(i), invlists.list_size(i)).copy()
+                for i in range(invlists.nlist)
+            ]
+        )
+
+    def _reserve_ids(self, index):
+        """Never hand out an id the saved index already holds
+
+        A crash between saving the index and committing the rows rolls
+        back their ids; those vectors then map to no chunk and are skipped,
+        but new chunks must not be given the same ids.
+        """
+        ids = self._index_ids(index)
+        if not len(ids):
+            return
+        highest = int(ids.max())
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'chunks'")
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) VALUES ('chunks', ?)", (highest,)
+                )
+            elif row[0] < highest:
+                cursor.execute(
+                    "UPDATE sqlite_sequence SET seq = ? WHERE name = 'chunks'", (highest,)
+                )
+
+    def _read_index(self):
+        faiss = self.faiss
+        if self.read_only:
+            # IO_FLAG_MMAP_IFC (newer FAISS) also maps flat and HNSW vectors;
+            # plain IO_FLAG_MMAP only maps IVF inverted lists
+            mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+            try:
+                index = faiss.read_index(
+                    str(self.index_path), mmap_flag | faiss.IO_FLAG_READ_ONLY
+                )
+            except RuntimeError:
+                # Not every index type can be mapped; load those into memory
+                index = faiss.read_index(str(self.index_path))
+        else:
+            index = faiss.read_index(str(self.index_path))
+        self._configure(index)
+        return index
+
+    def _configure(self, index):
+        """Apply search-time parameters"""
+        faiss = self.faiss
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = self.nprobe
+        inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+        if hasattr(inner, "hnsw"):
+            inner.hnsw.efSearch = self.ef_search
+
+    def _normalize(self, embeddings: np.ndarray) -> np.ndarray:
+        vectors = np.array(embeddings, dtype=np.float32, ndmin=2, order="C", copy=True)
+        self.faiss.normalize_L2(vectors)
+        return vectors
+
+    def _pq_m(self, dimension: int) -> int:
+        """Subquantizers for PQ; must divide the dimension"""
+        m = min(self.pq_m or max(1, dimension // 8), dimension)
+        while dimension % m:
+            m -= 1
+        return m
+
+    def _sq_type(self):
+        quantizer = self.faiss.ScalarQuantizer
+        return quantizer.QT_fp16 if self.quantization == "fp16" else quantizer.QT_8bit
+
+    def _training_size(self, count: int) -> int:
+        """Vectors needed to train the configured index; 0 if it needs none"""
+        size = 0
+        if self.index_type == "ivf":
+            size = IVF_TRAINING_FACTOR * (self.nlist or max(1, int(4 * math.sqrt(max(count, 1)))))
+        if self.quantization == "pq":
+            size = max(size, IVF_TRAINING_FACTOR * 2**PQ_BITS)
+        elif self.quantization == "int8":
+            size = max(size, SQ_TRAINING_MIN)
+        return size
+
+    def _is_staging(self, index) -> bool:
+        """True for the exact index used until the configured one can be trained"""
+        if not self._training_size(0) or self.faiss.try_extract_index_ivf(index) is not None:
+            return False
+        inner = self.faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+        return isinstance(inner, self.faiss.IndexFlat)
+
+    def _new_index(self, dimension: int, training: Optional[np.ndarray] = None):
+        """The configured index, trained on `training`
+
+        Without training vectors, indexes that need training start out as
+        an exact flat index instead.
+        """
+        faiss = self.faiss
+        metric = faiss.METRIC_INNER_PRODUCT
+        if training is None and self._training_size(0):
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+            self._configure(index)
+            return index
+
+        if self.index_type == "ivf":
+            nlist = self.nlist or max(1, int(4 * math.sqrt(len(training))))
+            quantizer = faiss.IndexFlatIP(dimension)
+            if self.quantization == "pq":
+                index = faiss.IndexIVFPQ(
+                    quantizer, dimension, nlist, self._pq_m(dimension), PQ_BITS, metric
+                )
+            elif self.quantization != "none":
+                index = faiss.IndexIVFScalarQuantizer(
+                    quantizer, dimension, nlist, self._sq_type(), metric
+                )
+            else:
+                index = faiss.IndexIVFFlat(quantizer, dimension, nlist, metric)
+        elif self.index_type == "hnsw":
+            if self.quantization == "pq":
+                # L2 ranks unit vectors like inner product; see _similarities
+                inner = faiss.IndexHNSWPQ(dimension, self._pq_m(dimension), self.hnsw_m)
+            elif self.quantization != "none":
+                inner = faiss.IndexHNSWSQ(dimension, self._sq_type(), self.hnsw_m, metric)
+            else:
+                inner = faiss.IndexHNSWFlat(dimension, self.hnsw_m, metric)
+            index = faiss.IndexIDMap2(inner)
+        else:
+            if self.quantization == "pq":
+                inner = faiss.IndexPQ(dimension, self._pq_m(dimension), PQ_BITS, metric)
+            elif self.quantization != "none":
+                inner = faiss.IndexScalarQuantizer(dimension, self._sq_type(), metric)
+            else:
+                inner = faiss.IndexFlatIP(dimension)
+            index = faiss.IndexIDMap2(inner)
+        if not index.is_trained:
+            index.train(training)
+        self._configure(index)
+        return index
+
+    def _similarities(self, index, scores: np.ndarray) -> np.ndarray:
+        """Search scores as cosine similarities
+
+        Indexes searched by L2 distance hold unit vectors, for which the
+        squared distance is 2 - 2 * cosine.
+        """
+        if index.metric_type == self.faiss.METRIC_L2:
+            return 1 - scores / 2
+        return scores
+
+    def _live_rows(self) -> Tuple[np.ndarray, List[Optional[int]]]:
+        """FAISS ids of the stored chunks and their rows in vectors.f32"""
+        rows = self._select("SELECT faiss_id, vector_row FROM chunks ORDER BY faiss_id")
+        return np.array([row[0] for row in rows], dtype=np.int64), [row[1] for row in rows]
+
+    def _reconstruct(self, index, faiss_ids: np.ndarray) -> np.ndarray:
+        ivf = self.faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.set_direct_map_type(self.faiss.DirectMap.Hashtable)
+            index = ivf
+        return index.reconstruct_batch(faiss_ids)
+
+    def _stored_vectors(
+        self, index, faiss_ids: np.ndarray, vector_rows: List[Optional[int]]
+    ) -> np.ndarray:
+        """Vectors to rebuild from: full precision when kept, else from the index"""
+        if self.keeps_vectors and None not in vector_rows:
+            return self.vector_file(index.d).read(vector_rows)
+        return self._reconstruct(index, faiss_ids)
+
+    def _allocate_vector_rows(self, cursor: sqlite3.Cursor, count: int) -> List[int]:
+        """Reuse rows freed by deletes, then append"""
+        cursor.execute("SELECT row FROM free_vector_rows ORDER BY row LIMIT ?", (count,))
+        rows = [row for (row,) in cursor.fetchall()]
+        cursor.executemany("DELETE FROM free_vector_rows WHERE row = ?", [(row,) for row in rows])
+        if len(rows) < count:
+            cursor.execute("""
+                SELECT MAX(last) FROM (
+                    SELECT MAX(vector_row) AS last FROM chunks
+                    UNION ALL SELECT MAX(row) FROM free_vector_rows
+                )
+            """)
+            last = cursor.fetchone()[0]
+            first = 0 if last is None else last + 1
+            rows.extend(range(first, first + count - len(rows)))
+        return rows
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: np.ndarray,
+        documents: List[str],
+        metadatas: List[Dict],
+    ):
+        if not ids:
+            return
+        vectors = self._normalize(embeddings)
+        with self._lock:
+            self._delete(ids)
+            # Loaded first, so ids it already holds are reserved
+            index = self.index
+            # Committed by flush(), once the index holding their vectors is saved
+            cursor = self.conn.cursor()
+            vector_rows = (
+                self._allocate_vector_rows(cursor, len(ids))
+                if self.keeps_vectors
+                else [None] * len(ids)
+            )
+            faiss_ids = []
+            for chunk_id, document, metadata, vector_row in zip(
+                ids, documents, metadatas, vector_rows
+            ):
+                cursor.execute(
+                    """INSERT INTO chunks (id, filepath, document, metadata, vector_row)
+                       VALUES (?, ?, ?, ?, ?)""",
+                    (
+                        chunk_id,
+                        metadata.get("filepath", ""),
+                        document,
+                        json.dumps(metadata),
+                        vector_row,
+                    ),
+                )
+                faiss_ids.append(cursor.lastrowid)
+            if self.keeps_vectors:
+                # Written before the rows that point at them are committed
+                self.vector_file(vectors.shape[1]).write(vector_rows, vectors)
+
+            if index is None:
+                # IVF, int8 and PQ start flat and are trained on flush once
+                # there is enough data
+                index = self._new_index(vectors.shape[1])
+            index.add_with_ids(vectors, np.array(faiss_ids, dtype=np.int64))
+            self._index = index
+            self._dirty = True
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict]):
+        with self._lock:
+            self.conn.executemany(
+                "UPDATE chunks SET filepath = ?, metadata = ? WHERE id = ?",
+                [
+                    (metadata.get("filepath", ""), json.dumps(metadata), chunk_id)
+                    for chunk_id, metadata in zip(ids, metadatas)
+                ],
+            )
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            self._delete(ids)
+
+    def _delete(self, ids: List[str]):
+        cursor = self.conn.cursor()
+        faiss_ids = []
+        for start in range(0, len(ids), SQL_BATCH):
+            batch = ids[start : start + SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            cursor.execute(
+                f"SELECT faiss_id, vector_row FROM chunks WHERE id IN ({placeholders})", batch
+            )
+            rows = cursor.fetchall()
+            faiss_ids.extend(row[0] for row in rows)
+            cursor.executemany(
+                "INSERT OR IGNORE INTO free_vector_rows (row) VALUES (?)",
+                [(row[1],) for row in rows if row[1] is not None],
+            )
+            cursor.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch)
+
+        index = self.index
+        if index is None or not faiss_ids:
+            return
+        try:
+            index.remove_ids(np.array(faiss_ids, dtype=np.int64))
+        except RuntimeError:
+            # HNSW can't remove vectors; their ids no longer map to chunks,
+            # so queries skip them until flush() compacts the index
+            pass
+        self._dirty = True
+
+    def flush(self):
+        """Train or compact the index if due, save it, then commit the chunk rows"""
+        with self._lock:
+            if self._dirty and self._index is not None:
+                self._maybe_rebuild()
+                tmp_path = self.index_path.with_suffix(".tmp")
+                self.faiss.write_index(self._index, str(tmp_path))
+                os.replace(tmp_path, self.index_path)
+                self._dirty = False
+                self._signature = self._file_signature()
+            self.conn.commit()
+
+    def _maybe_rebuild(self):
+        index = self._index
+        live_ids, vector_rows = self._live_rows()
+        staged = self._is_staging(index)
+        train = staged and len(live_ids) >= self._training_size(len(live_ids))
+        orphans = index.ntotal - len(live_ids)
+        if not train and orphans <= MAX_ORPHAN_RATIO * index.ntotal:
+            return
+
+        if not len(live_ids):
+            self._index = self._new_index(index.d)
+            return
+        vectors = self._stored_vectors(index, live_ids, vector_rows)
+        # A staging index stays exact until train says otherwise
+        rebuilt = self._new_index(index.d, None if staged and not train else vectors)
+        rebuilt.add_with_ids(vectors, live_ids)
+        self._index = rebuilt
+
+    def _rows(self, faiss_ids: Iterable[int]) -> Dict[int, Tuple[str, str, str, Optional[int]]]:
+        faiss_ids = list(faiss_ids)
+        rows = {}
+        for start in range(0, len(faiss_ids), SQL_BATCH):
+            batch = faiss_ids[start : start + SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            for row in self._select(
+                f"SELECT faiss_id, id, document, metadata, vector_row FROM chunks "
+                f"WHERE faiss_id IN ({placeholders})",
+                batch,
+            ):
+                rows[row[0]] = row[1:]
+        return rows
+
+    def get_metadatas(self, filepath: str) -> Dict[str, Dict]:
+        rows = self._select("SELECT id, metadata FROM chunks WHERE filepath = ?", (filepath,))
+        return {chunk_id: json.loads(metadata) for chunk_id, metadata in rows}
+
+    def _filtered_rows(self, filters: SearchFilter) -> Tuple[np.ndarray, List[Optional[int]]]:
+        """FAISS ids of the chunks matching a filter and their rows in vectors.f32"""
+        where, params = filters.sql_where()
+        rows = self._select(f"SELECT faiss_id, vector_row FROM chunks WHERE {where}", params)
+        return np.array([row[0] for row in rows], dtype=np.int64), [row[1] for row in rows]
+
+    def _scan(
+        self,
+        dimension: int,
+        queries: np.ndarray,
+        faiss_ids: np.ndarray,
+        vector_rows: List[int],
+        k: int,
+    ) -> List[List[Tuple[float, int]]]:
+        """Exact top-k among the given chunks, from their full-precision vectors"""
+        vector_file = self.vector_file(dimension)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_ids = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(faiss_ids), _SCAN_ROWS):
+            vectors = vector_file.read(vector_rows[start : start + _SCAN_ROWS])
+            ids = faiss_ids[start : start + _SCAN_ROWS]
+            scores = np.hstack([best_scores, queries @ vectors.T])
+            ids = np.hstack([best_ids, np.tile(ids, (len(queries), 1))])
+            keep = np.argsort(-scores, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, keep, axis=1)
+            best_ids = np.take_along_axis(ids, keep, axis=1)
+        return [
+            [(float(score), int(i)) for score, i in zip(query_scores, query_ids)]
+            for query_scores, query_ids in zip(best_scores, best_ids)
+        ]
+
+    def _results(
+        self, candidates: List[List[Tuple[float, int]]], rows: Dict, n_results: int
+    ) -> List[List[Dict]]:
+        return [
+            [
+                {
+                    "id": rows[i][0],
+                    "content": rows[i][1],
+                    "metadata": json.loads(rows[i][2]),
+                    "distance": 1 - score,
+                }
+                for score, i in found[:n_results]
+                if i in rows
+            ]
+            for found in candidates
+        ]
+
+    def _search_parameters(self, index, allowed: np.ndarray):
+        """Search parameters restricting the search to `allowed` ids
+
+        The index's own nprobe / efSearch are repeated, since parameters
+        passed to search() replace them.
+        """
+        faiss = self.faiss
+        selector = faiss.IDSelectorBatch(allowed)
+        if faiss.try_extract_index_ivf(index) is not None:
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+        if hasattr(inner, "hnsw"):
+            # efSearch also grows with k as the loop in query() widens it
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self.ef_search)
+        return faiss.SearchParameters(sel=selector)
+
+    def query(
+        self, embeddings: np.ndarray, n_results: int, filters: Optional[SearchFilter] = None
+    ) -> List[List[Dict]]:
+        queries = self._normalize(embeddings)
+        index = self.index
+        if index is None or index.ntotal == 0 or n_results <= 0:
+            return [[] for _ in queries]
+
+        # Filters select ids before the search, so every hit is a match
+        params = None
+        limit = index.ntotal
+        if filters is not None:
+            if filters.matches_nothing:
+                return [[] for _ in queries]
+            allowed, allowed_rows = self._filtered_rows(filters)
+            if not len(allowed):
+                return [[] for _ in queries]
+            if self.index_type == "flat" and self.keeps_vectors and None not in allowed_rows:
+                # Flat search is a scan anyway; scanning only the matches is
+                # exact, and PQ indexes can't select ids
+                candidates = self._scan(index.d, queries, allowed, allowed_rows, n_results)
+                rows = self._rows({i for found in candidates for _, i in found})
+                return self._results(candidates, rows, n_results)
+            params = self._search_parameters(index, allowed)
+            limit = min(limit, len(allowed))
+
+        # Quantized scores only shortlist candidates for exact re-ranking
+        rescore = self.keeps_vectors and not self._is_staging(index)
+        depth = n_results * self.rerank_factor if rescore else n_results
+        k = min(depth, limit)
+        while True:
+            scores, faiss_ids = index.search(queries, k, params=params)
+            rows = self._rows({int(i) for i in faiss_ids.ravel() if i >= 0})
+            candidates = [
+                [
+                    (float(score), int(i))
+                    for score, i in zip(query_scores, query_ids)
+                    if int(i) in rows
+                ][:depth]
+                for query_scores, query_ids in zip(self._similarities(index, scores), faiss_ids)
+            ]
+            # Deleted vectors still in the index are dropped, and graph search
+            # may miss filtered chunks; widen if short
+            if k >= limit or all(len(found) >= depth for found in candidates):
+                break
+            k = min(k * 2, limit)
+
+        if rescore:
+            candidates = [
+                self._rescore(index, query, found, rows)
+                for query, found in zip(queries, candidates)
+            ]
+        return self._results(candidates, rows, n_results)
+
+    def _rescore(
+        self, index, query: np.ndarray, candidates: List[Tuple[float, int]], rows: Dict
+    ) -> List[Tuple[float, int]]:
+        """Re-rank candidates by exact similarity to their full-precision vectors"""
+        vector_rows = [rows[i][3] for _, i in candidates]
+        if None in vector_rows:
+            # Indexed before quantization was turned on; nothing to compare
+            return candidates
+        exact = self.vector_file(index.d).read(vector_rows) @ query
+        return sorted(
+            zip(exact.tolist(), (i for _, i in candidates)), key=lambda pair: -pair[0]
+        )
+
+    def count(self) -> int:
+        rows = self._select("SELECT COUNT(*) FROM chunks")
+        return rows[0][0] if rows else 0
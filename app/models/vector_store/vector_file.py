@@ -0,0 +1,53 @@
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from models.matrix_file import open_matrix
+
+
+class VectorFile:
+    """Full-precision vectors in a flat float32 file, read through a memory map
+
+    Row numbers are handed out by the caller. Only the rows that are read
+    are paged in, so the file can be far larger than the memory it uses.
+    The file grows geometrically; readers remap it when asked for a row
+    past the end of their mapping.
+    """
+
+    def __init__(self, path: Path, dimension: int, read_only: bool = False):
+        self.path = path
+        self.dimension = dimension
+        self.read_only = read_only
+        self._matrix: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+
+    def _open(self, rows: int) -> Optional[np.memmap]:
+        """Map the file, growing it first (when writable) to hold `rows` rows"""
+        if self._matrix is None or self._matrix.shape[0] < rows:
+            self._matrix = None
+            self._matrix = open_matrix(self.path, self.dimension, rows, self.read_only)
+        return self._matrix
+
+    def write(self, rows: List[int], vectors: np.ndarray):
+        if not rows:
+            return
+        with self._lock:
+            matrix = self._open(max(rows) + 1)
+            matrix[rows] = np.asarray(vectors, dtype=np.float32)
+            matrix.flush()
+
+    def read(self, rows: List[int]) -> np.ndarray:
+        """The vectors stored in `rows`, copied out of the map"""
+        if not rows:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        with self._lock:
+            matrix = self._open(max(rows) + 1)
+            if matrix is None or matrix.shape[0] <= max(rows):
+                raise IndexError(f"{self.path} has no row {max(rows)}")
+            return np.array(matrix[rows])
+
+    def size(self) -> int:
+        """Bytes on disk"""
+        return self.path.stat().st_size if self.path.exists() else 0
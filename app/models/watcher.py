@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+
+from models.document_processor import DocumentProcessor, SyncStats, file_signature
+from models.loaders import is_supported
+
+# Optional: inotify (Linux), FSEvents (macOS) and friends via watchdog
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+
+class _EventHandler(FileSystemEventHandler):
+    """Forward filesystem events to the watcher's pending set"""
+
+    def __init__(self, watcher: "DirectoryWatcher"):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            # Directory moves and deletes don't report the files inside
+            if event.event_type in ("moved", "deleted"):
+                self.watcher.request_scan()
+            return
+        for path in (event.src_path, getattr(event, "dest_path", None)):
+            if path:
+                self.watcher.queue(os.fsdecode(path))
+
+
+class DirectoryWatcher:
+    """Keep a directory indexed by feeding only changed files to the processor
+
+    Changes are detected with filesystem events when watchdog is installed,
+    otherwise by polling. Either way a file is only read when its
+    (size, mtime_ns, inode) differs from the stat index in metadata.db, and
+    bursts of events are debounced into one batch.
+    """
+
+    def __init__(
+        self,
+        processor: DocumentProcessor,
+        directory: str,
+        debounce: Optional[float] = None,
+        poll_interval: Optional[float] = None,
+        use_polling: Optional[bool] = None,
+    ):
+        config = processor.config.config
+        self.processor = processor
+        self.directory = Path(directory).resolve()
+        self.debounce = config["watch_debounce"] if debounce is None else debounce
+        self.poll_interval = (
+            config["watch_poll_interval"] if poll_interval is None else poll_interval
+        )
+        self.use_polling = (
+            config["watch_polling"] if use_polling is None else use_polling
+        ) or Observer is None
+
+        # Indexed documents plus files seen without producing a document
+        self.index: Dict[str, Tuple[int, int, int]] = processor.get_file_index(
+            str(self.directory)
+        )
+        self.pending: Set[str] = set()
+        self.scan_requested = False
+        self.last_event = 0.0
+        self.condition = threading.Condition()
+
+    def is_supported(self, path: str) -> bool:
+        return is_supported(path)
+
+    def queue(self, path: str):
+        """Mark a path as possibly changed"""
+        if not self.is_supported(path):
+            return
+        with self.condition:
+            self.pending.add(path)
+            self.last_event = time.monotonic()
+            self.condition.notify()
+
+    def request_scan(self):
+        with self.condition:
+            self.scan_requested = True
+            self.last_event = time.monotonic()
+            self.condition.notify()
+
+    def scan(self):
+        """Queue files whose stat differs from the index, and files that are gone"""
+        seen = set()
+        for file_path in self.processor.iter_supported_files(str(self.directory)):
+            path = str(file_path)
+            seen.add(path)
+            try:
+                signature = file_signature(file_path.stat())
+            except OSError:
+                continue
+            if self.index.get(path) != signature:
+                self.queue(path)
+
+        for path in list(self.index):
+            if path not in seen:
+                self.queue(path)
+
+    def drain(self, timeout: float) -> Set[str]:
+        """Wait up to `timeout` for changes, then until events go quiet"""
+        with self.condition:
+            if not self.pending and not self.scan_requested:
+                self.condition.wait(timeout)
+            while self.pending or self.scan_requested:
+                quiet = time.monotonic() - self.last_event
+                if quiet >= self.debounce:
+                    break
+                self.condition.wait(self.debounce - quiet)
+
+            scan, self.scan_requested = self.scan_requested, False
+            paths, self.pending = self.pending, set()
+
+        if scan:
+            self.scan()
+            with self.condition:
+                paths |= self.pending
+                self.pending = set()
+        return paths
+
+    def process(self, paths: Set[str]) -> SyncStats:
+        """Sync changed files and drop deleted ones"""
+        stats = SyncStats()
+        for path in sorted(paths):
+            try:
+                if os.path.isfile(path):
+                    signature = file_signature(os.stat(path))
+                    # Events such as open/close or a rewrite of identical bytes
+                    if self.index.get(path) == signature:
+                        continue
+                    failed = stats.files_failed
+                    self.processor.sync_document(path, stats)
+                    # A failed file keeps its old signature, so it is retried
+                    if stats.files_failed == failed:
+                        self.index[path] = signature
+                elif path in self.index:
+                    stats.chunks_removed += self.processor.remove_document(path)
+                    stats.files_removed += 1
+                    del self.index[path]
+                    print(f"Removed {path}")
+            except Exception as e:
+                print(f"Error syncing {path}: {e}")
+                stats.files_failed += 1
+        self.processor.flush()
+        return stats
+
+    def run(self):
+        """Catch up on changes made while not watching, then watch until interrupted"""
+        mode = "polling" if self.use_polling else "filesystem events"
+        print(f"Watching {self.directory} ({mode}), press Ctrl+C to stop")
+
+        observer = None
+        if not self.use_polling:
+            observer = Observer()
+            observer.schedule(_EventHandler(self), str(self.directory), recursive=True)
+            observer.start()
+
+        try:
+            self.scan()
+            while True:
+                if self.use_polling and not self.pending:
+                    time.sleep(self.poll_interval)
+                    self.scan()
+                paths = self.drain(timeout=0 if self.use_polling else 1.0)
+                if paths:
+                    stats = self.process(paths)
+                    if stats.files_updated or stats.files_removed or stats.files_failed:
+                        print(stats.report())
+        except KeyboardInterrupt:
+            print("\nStopped watching.")
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
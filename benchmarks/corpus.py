@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Synthetic corpus generator for the benchmarks.
+
+Writes reproducible text and Markdown files of pseudo-words, each with one
+planted fact (an error code and what it means) that only that file contains.
+The facts double as retrieval probes: asking about a code should retrieve
+the file it was planted in.
+
+    python benchmarks/corpus.py OUTPUT_DIR [--files 200] [--words 1500] [--seed 0]
+"""
+
+import json
+import random
+import argparse
+from pathlib import Path
+from typing import Dict, List
+
+SYLLABLES = [
+    "ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "pa",
+    "qui", "dor", "fen", "gal", "hin", "jor", "lux", "mar", "nov", "pel",
+]
+COMPONENTS = [
+    "pump controller", "cooling loop", "backup battery", "network bridge",
+    "pressure sensor", "drive motor", "firmware loader", "power supply",
+]
+CAUSES = [
+    "a loose connector", "an expired certificate", "a blocked filter",
+    "a stale calibration table", "an overheated board", "a corrupted cache",
+]
+
+
+def vocabulary(rng: random.Random, size: int = 3000) -> List[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def paragraph(rng: random.Random, words: List[str], length: int) -> str:
+    sentences = []
+    while length > 0:
+        size = min(length, rng.randint(8, 20))
+        sentence = " ".join(rng.choice(words) for _ in range(size))
+        sentences.append(sentence.capitalize() + ".")
+        length -= size
+    return " ".join(sentences)
+
+
+def generate_corpus(
+    directory: Path, files: int = 200, words_per_file: int = 1500, seed: int = 0
+) -> List[Dict]:
+    """Write the corpus and return its probes as {"question", "filename", "code"}"""
+    rng = random.Random(seed)
+    words = vocabulary(rng)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    probes = []
+    for i in range(files):
+        code = f"ERR-{seed:02d}{i:05d}"
+        component = rng.choice(COMPONENTS)
+        cause = rng.choice(CAUSES)
+        fact = f"Error code {code} on the {component} is caused by {cause}."
+        paragraphs = [
+            paragraph(rng, words, rng.randint(60, 160))
+            for _ in range(max(1, words_per_file // 110))
+        ]
+        # Somewhere in the middle, not always in the first chunk
+        paragraphs.insert(rng.randint(0, len(paragraphs)), fact)
+
+        suffix = ".md" if i % 4 == 0 else ".txt"
+        filename = f"doc{i:05d}{suffix}"
+        text = "\n\n".join(paragraphs)
+        if suffix == ".md":
+            text = f"# Document {i}\n\n{text}"
+        (directory / filename).write_text(text + "\n", encoding="utf-8")
+        probes.append(
+            {
+                "question": f"What causes error code {code} on the {component}?",
+                "filename": filename,
+                "code": code,
+            }
+        )
+    return probes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic document corpus")
+    parser.add_argument("output", help="Directory to write the corpus to")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--words", type=int, default=1500, help="Words per file")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    output = Path(args.output)
+    probes = generate_corpus(output, args.files, args.words, args.seed)
+    with open(output / "probes.jsonl", "w", encoding="utf-8") as f:
+        for probe in probes:
+            f.write(json.dumps(probe) + "\n")
+    print(f"Wrote {len(probes)} files and probes.jsonl to {output}")
+
+
+if __name__ == "__main__":
+    main()
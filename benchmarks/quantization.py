@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Vector quantization benchmark.
+
+Builds a FAISS store for each quantization mode from the same vectors and
+measures, against an exact flat index over them:
+  recall@k  share of the exact top-k each mode returns, with re-ranking
+            against the full-precision vectors and without it
+  latency   p50/p95/p99 per query
+  memory    bytes of the compact index (what a query process holds) and of
+            the full-precision vectors kept on disk and memory-mapped
+
+Vectors come from embedding the synthetic corpus with the configured model
+(`--source corpus`, the default) or from clustered random vectors
+(`--source random`), which needs no model and runs in seconds.
+
+    python benchmarks/quantization.py --index-type hnsw --k 10
+    python benchmarks/quantization.py --source random --vectors 200000 --output q.json
+"""
+
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+sys.path.insert(0, str(APP_DIR))
+
+import numpy as np  # noqa: E402
+
+from corpus import generate_corpus  # noqa: E402
+from rag import latency_summary, parse_setting  # noqa: E402
+
+MODES = ("none", "fp16", "int8", "pq")
+
+
+def corpus_vectors(args, workdir: Path) -> Tuple[np.ndarray, np.ndarray]:
+    """Chunk and question embeddings of the synthetic corpus"""
+    from models.config import Config
+    from models.embeddings import EmbeddingEngine
+    from models.document_processor import iter_chunks
+
+    config = Config(app_dir=workdir / "app")
+    config.config.update(dict(parse_setting(pair) for pair in args.set))
+    probes = generate_corpus(workdir / "corpus", args.files, args.words, args.seed)
+    texts = [
+        chunk.text
+        for path in sorted((workdir / "corpus").iterdir())
+        for chunk in iter_chunks(
+            str(path), config.config["chunk_size"], config.config["chunk_overlap"]
+        )
+    ]
+    engine = EmbeddingEngine.shared(config)
+    print(f"Embedding {len(texts)} chunks and {len(probes)} questions...")
+    questions = [probe["question"] for probe in probes][: args.queries]
+    return engine.encode(texts), engine.encode(questions)
+
+
+def random_vectors(args) -> Tuple[np.ndarray, np.ndarray]:
+    """Clustered Gaussian vectors, with queries near stored ones"""
+    rng = np.random.default_rng(args.seed)
+    centers = rng.normal(size=(max(1, args.vectors // 200), args.dimension))
+    vectors = centers[rng.integers(0, len(centers), args.vectors)]
+    vectors = vectors + 0.5 * rng.normal(size=vectors.shape)
+    picks = rng.integers(0, args.vectors, args.queries)
+    queries = vectors[picks] + 0.2 * rng.normal(size=(args.queries, args.dimension))
+    return vectors.astype(np.float32), queries.astype(np.float32)
+
+
+def build_store(directory: Path, vectors: np.ndarray, index_type: str, mode: str, args):
+    """Add the vectors in ingest-sized batches, then flush (and train)"""
+    from models.vector_store.faiss_store import FaissVectorStore
+
+    store = FaissVectorStore(
+        directory,
+        index_type=index_type,
+        nlist=args.nlist,
+        nprobe=args.nprobe,
+        quantization=mode,
+        pq_m=args.pq_m,
+    )
+    ids = [f"v{i}" for i in range(len(vectors))]
+    for start in range(0, len(vectors), args.batch_size):
+        end = start + args.batch_size
+        store.add(ids[start:end], vectors[start:end], [""] * len(ids[start:end]),
+                  [{"filepath": ""}] * len(ids[start:end]))
+    store.flush()
+    return store
+
+
+def measure(directory: Path, queries: np.ndarray, exact: List[set], index_type: str,
+            mode: str, rerank_factor: int, args) -> Dict:
+    """Recall@k and latency of a read-only store, as a query process would open it"""
+    from models.vector_store.faiss_store import FaissVectorStore
+
+    store = FaissVectorStore(
+        directory,
+        index_type=index_type,
+        nlist=args.nlist,
+        nprobe=args.nprobe,
+        quantization=mode,
+        pq_m=args.pq_m,
+        rerank_factor=rerank_factor,
+        read_only=True,
+    )
+    store.query(queries[:1], args.k)
+    latencies, found = [], 0
+    for query, truth in zip(queries, exact):
+        start = time.perf_counter()
+        results = store.query(query[None, :], args.k)[0]
+        latencies.append(time.perf_counter() - start)
+        found += len(truth & {result["id"] for result in results})
+    return {
+        "recall_at_k": round(found / (len(queries) * args.k), 4),
+        "latency_ms": latency_summary(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FAISS vector quantization")
+    parser.add_argument("--source", choices=("corpus", "random"), default="corpus")
+    parser.add_argument("--files", type=int, default=200, help="Corpus size in files")
+    parser.add_argument("--words", type=int, default=1500, help="Words per file")
+    parser.add_argument("--vectors", type=int, default=100000, help="Random vectors")
+    parser.add_argument("--dimension", type=int, default=384, help="Random vector size")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--k", type=int, default=10, help="Results per query")
+    parser.add_argument("--index-type", choices=("flat", "ivf", "hnsw"), default="hnsw")
+    parser.add_argument("--modes", default=",".join(MODES), help="Quantizations to compare")
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--pq-m", type=int, default=0)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Override a config setting for corpus embedding, e.g. --set chunk_size=500",
+    )
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = sorted(set(modes) - set(MODES))
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(unknown)}")
+
+    workdir = Path(tempfile.mkdtemp(prefix="quant_bench_"))
+    try:
+        results = run(args, modes, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+def run(args, modes: List[str], workdir: Path) -> Dict:
+    if args.source == "corpus":
+        vectors, queries = corpus_vectors(args, workdir)
+    else:
+        vectors, queries = random_vectors(args)
+    print(f"{len(vectors)} vectors of {vectors.shape[1]} dimensions, {len(queries)} queries")
+
+    exact_store = build_store(workdir / "exact", vectors, "flat", "none", args)
+    exact = [{result["id"] for result in found} for found in exact_store.query(queries, args.k)]
+    results = {
+        "source": args.source,
+        "vectors": len(vectors),
+        "dimension": int(vectors.shape[1]),
+        "index_type": args.index_type,
+        "k": args.k,
+        "rerank_factor": args.rerank_factor,
+        "modes": {},
+    }
+
+    print(
+        f"\n{'mode':<6} {'index MB':>9} {'B/vector':>9} {'full MB':>8} "
+        f"{'recall@k':>9} {'no rerank':>10} {'p50 ms':>7} {'p95 ms':>7} {'build s':>8}"
+    )
+    for mode in modes:
+        directory = workdir / mode
+        start = time.perf_counter()
+        store = build_store(directory, vectors, args.index_type, mode, args)
+        build_seconds = time.perf_counter() - start
+        storage = store.storage_bytes()
+
+        entry = {
+            "build_seconds": round(build_seconds, 2),
+            "index_bytes": storage["index"],
+            "index_bytes_per_vector": round(storage["index"] / len(vectors), 1),
+            "full_precision_bytes": storage["vectors"],
+        }
+        entry.update(measure(directory, queries, exact, args.index_type, mode,
+                             args.rerank_factor, args))
+        if mode != "none":
+            entry["recall_at_k_without_rerank"] = measure(
+                directory, queries, exact, args.index_type, mode, 1, args
+            )["recall_at_k"]
+        results["modes"][mode] = entry
+
+        latency = entry["latency_ms"]
+        print(
+            f"{mode:<6} {storage['index'] / 1e6:>9.1f} {entry['index_bytes_per_vector']:>9} "
+            f"{storage['vectors'] / 1e6:>8.1f} {entry['recall_at_k']:>9.3f} "
+            f"{entry.get('recall_at_k_without_rerank', entry['recall_at_k']):>10.3f} "
+            f"{latency['p50']:>7} {latency['p95']:>7} {build_seconds:>8.1f}"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    main()
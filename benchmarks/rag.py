@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Ingestion, retrieval and question-answering benchmark.
+
+Generates a synthetic corpus, ingests it into a scratch database and
+measures:
+  ingest  files/s and chunks/s of DocumentProcessor.process_directory
+  search  p50/p95/p99 latency of Assistant.search_documents, and recall
+          (share of probes whose planted file is among the results)
+  qa      p50/p95/p99 latency of Assistant.answer_question, with the
+          re-rank latency and prompt tokens saved when "rerank" is on
+and the peak memory of the process after each stage. Caches are disabled
+so every query is measured cold. Generation goes to a mock Ollama server
+unless --ollama-url points at a real one, so it runs offline.
+
+Results are written as JSON; pass an earlier result as --baseline to see
+what changed, with --max-regression to fail on slowdowns.
+
+    python benchmarks/rag.py --output results.json
+    python benchmarks/rag.py --set chunk_size=500 --baseline results.json
+"""
+
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import contextlib
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+sys.path.insert(0, str(APP_DIR))
+
+from corpus import generate_corpus  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# (dotted path into the results, higher is better)
+METRICS = [
+    ("ingest.files_per_sec", True),
+    ("ingest.chunks_per_sec", True),
+    ("search.latency_ms.p50", False),
+    ("search.latency_ms.p95", False),
+    ("search.latency_ms.p99", False),
+    ("search.recall", True),
+    ("qa.latency_ms.p50", False),
+    ("qa.latency_ms.p95", False),
+    ("qa.latency_ms.p99", False),
+    ("qa.rerank_latency_ms.p50", False),
+    ("qa.rerank_latency_ms.p95", False),
+    ("qa.mean_prompt_tokens", False),
+    ("qa.peak_rss_mb", False),
+]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Linearly interpolated percentile of unsorted values"""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def latency_summary(seconds: List[float]) -> Dict:
+    if not seconds:
+        return {}
+    return {
+        "p50": round(percentile(seconds, 0.50) * 1000, 2),
+        "p95": round(percentile(seconds, 0.95) * 1000, 2),
+        "p99": round(percentile(seconds, 0.99) * 1000, 2),
+        "mean": round(sum(seconds) / len(seconds) * 1000, 2),
+        "max": round(max(seconds) * 1000, 2),
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident memory of this process so far"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 1)
+
+
+def parse_setting(pair: str):
+    key, _, value = pair.partition("=")
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def start_mock_ollama(model: str, token_delay: float, prompt_delay: float) -> str:
+    from mock_ollama import create_server
+
+    server = create_server("127.0.0.1", 0, model, token_delay, prompt_delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def bench_ingest(config, corpus_dir: Path, workers: Optional[int]) -> Dict:
+    from models.document_processor import DocumentProcessor
+
+    processor = DocumentProcessor(config)
+    files = sum(1 for _ in processor.iter_supported_files(str(corpus_dir)))
+    start = time.perf_counter()
+    # The pipeline's own progress output would bury the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        chunks = processor.process_directory(str(corpus_dir), workers=workers)
+    elapsed = time.perf_counter() - start
+    return {
+        "files": files,
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "files_per_sec": round(files / elapsed, 2),
+        "chunks_per_sec": round(chunks / elapsed, 2),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_search(assistant, probes: List[Dict], mode: Optional[str]) -> Dict:
+    # The first query loads the embedding model
+    assistant.search_documents(probes[0]["question"], mode=mode)
+    latencies = []
+    found = 0
+    for probe in probes:
+        start = time.perf_counter()
+        results = assistant.search_documents(probe["question"], mode=mode)
+        latencies.append(time.perf_counter() - start)
+        found += any(
+            result["metadata"].get("filename") == probe["filename"] for result in results
+        )
+    return {
+        "queries": len(probes),
+        "mode": mode or assistant.config.config["retrieval_mode"],
+        "latency_ms": latency_summary(latencies),
+        "recall": round(found / len(probes), 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_qa(assistant, probes: List[Dict], mode: Optional[str]) -> Dict:
+    from models.assistant import QueryStats
+
+    latencies = []
+    prompt_tokens = []
+    rerank_latencies = []
+    tokens_saved = []
+    failed = 0
+    for probe in probes:
+        stats = QueryStats()
+        start = time.perf_counter()
+        answer = assistant.answer_question(probe["question"], mode, stats=stats)
+        latencies.append(time.perf_counter() - start)
+        failed += answer.startswith("Error")
+        if stats.context is not None:
+            prompt_tokens.append(stats.context.prompt_tokens)
+        if stats.rerank is not None:
+            rerank_latencies.append(stats.rerank.seconds)
+            tokens_saved.append(stats.rerank.tokens_saved)
+    results = {
+        "questions": len(probes),
+        "failed": failed,
+        "latency_ms": latency_summary(latencies),
+        "mean_prompt_tokens": (
+            round(sum(prompt_tokens) / len(prompt_tokens), 1) if prompt_tokens else 0
+        ),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if rerank_latencies:
+        results["rerank_latency_ms"] = latency_summary(rerank_latencies)
+        results["mean_prompt_tokens_saved"] = round(sum(tokens_saved) / len(tokens_saved), 1)
+    return results
+
+
+def lookup(results: Dict, path: str):
+    for key in path.split("."):
+        if not isinstance(results, dict) or key not in results:
+            return None
+        results = results[key]
+    return results
+
+
+def compare(results: Dict, baseline: Dict, max_regression: Optional[float]) -> bool:
+    """Print each metric against the baseline; False if one regressed too far"""
+    ok = True
+    print(f"\n{'metric':<26} {'baseline':>10} {'current':>10} {'change':>8}")
+    for path, higher_is_better in METRICS:
+        before, after = lookup(baseline, path), lookup(results, path)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before if before else 0.0
+        regression = -change if higher_is_better else change
+        flag = ""
+        if max_regression is not None and regression > max_regression:
+            flag = "  REGRESSION"
+            ok = False
+        print(f"{path:<26} {before:>10} {after:>10} {change:>+8.1%}{flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, retrieval and QA")
+    parser.add_argument("--files", type=int, default=200, help="Corpus size in files")
+    parser.add_argument("--words", type=int, default=1500, help="Words per file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=100, help="Search queries to time")
+    parser.add_argument("--questions", type=int, default=20, help="Questions to answer")
+    parser.add_argument("--workers", type=int, help="Loader processes for ingestion")
+    parser.add_argument(
+        "--retrieval", choices=("hybrid", "vector", "keyword"), help="Retrieval mode"
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Override a config setting, e.g. --set chunk_size=500 (repeatable)",
+    )
+    parser.add_argument("--ollama-url", help="Real Ollama to use instead of the mock")
+    parser.add_argument(
+        "--token-delay", type=float, default=0.0, help="Mock seconds per token"
+    )
+    parser.add_argument(
+        "--prompt-delay", type=float, default=0.0, help="Mock prompt evaluation seconds"
+    )
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        help="Fail if a metric is worse than the baseline by more than this "
+        "fraction, e.g. 0.1",
+    )
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="rag_bench_"))
+    try:
+        ok = run(args, parser, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(0 if ok else 1)
+
+
+def run(args, parser: argparse.ArgumentParser, workdir: Path) -> bool:
+    """Run every stage in workdir; False if the baseline comparison failed"""
+    from models.config import Config
+    from models.assistant import Assistant
+
+    config = Config(app_dir=workdir / "app")
+    overrides = dict(parse_setting(pair) for pair in args.set)
+    unknown = sorted(set(overrides) - set(config.default_config))
+    if unknown:
+        parser.error(f"unknown settings: {', '.join(unknown)}")
+    config.config.update(overrides)
+    # Measure the work itself, not the caches
+    config.config.update(search_cache=False, answer_cache=False, embedding_cache=False)
+    config.config["ollama_url"] = args.ollama_url or start_mock_ollama(
+        config.config["model_name"], args.token_delay, args.prompt_delay
+    )
+
+    probes = generate_corpus(workdir / "corpus", args.files, args.words, args.seed)
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+        },
+        "settings": {
+            key: config.config[key]
+            for key in (
+                "embedding_model",
+                "model_name",
+                "chunk_size",
+                "chunk_overlap",
+                "max_results",
+                "retrieval_mode",
+                "rerank",
+                "vector_store",
+                "context_window",
+            )
+        },
+        "overrides": overrides,
+        "corpus": {"files": args.files, "words_per_file": args.words, "seed": args.seed},
+    }
+
+    print(f"Ingesting {args.files} files...")
+    results["ingest"] = bench_ingest(config, workdir / "corpus", args.workers)
+    print(
+        f"  {results['ingest']['files_per_sec']} files/s, "
+        f"{results['ingest']['chunks_per_sec']} chunks/s"
+    )
+
+    assistant = Assistant(config)
+    search_probes = (probes * (args.queries // len(probes) + 1))[: args.queries]
+    print(f"Searching {len(search_probes)} queries...")
+    results["search"] = bench_search(assistant, search_probes, args.retrieval)
+    latency = results["search"]["latency_ms"]
+    print(
+        f"  p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms, "
+        f"recall {results['search']['recall']:.1%}"
+    )
+
+    if args.questions:
+        print(f"Answering {args.questions} questions...")
+        results["qa"] = bench_qa(assistant, probes[: args.questions], args.retrieval)
+        latency = results["qa"]["latency_ms"]
+        print(
+            f"  p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms, "
+            f"peak memory {results['qa']['peak_rss_mb']} MB"
+        )
+        if "rerank_latency_ms" in results["qa"]:
+            latency = results["qa"]["rerank_latency_ms"]
+            print(
+                f"  re-rank p50 {latency['p50']} ms, p95 {latency['p95']} ms, "
+                f"~{results['qa']['mean_prompt_tokens_saved']} prompt tokens saved per question"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    ok = True
+    if args.baseline:
+        with open(args.baseline) as f:
+            ok = compare(results, json.load(f), args.max_regression)
+    return ok
+
+
+if __name__ == "__main__":
+    main()
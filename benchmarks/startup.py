@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+CLI startup benchmark.
+
+Runs the lightweight commands in fresh interpreters with -X importtime,
+reports wall time and cumulative import time, and fails if any of them
+pulls in a heavy ML dependency or exceeds the time budget.
+
+    python benchmarks/startup.py [--runs 5] [--max-ms 300]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+ENTRY_POINT = APP_DIR / "local_lm_assistant.py"
+
+COMMANDS = [["--help"], ["--list-docs"], ["--config", "show"]]
+
+# Top-level packages that must not be imported by the commands above
+HEAVY_MODULES = {
+    "chromadb",
+    "sentence_transformers",
+    "torch",
+    "transformers",
+    "langchain",
+    "langchain_community",
+    "langchain_text_splitters",
+    "numpy",
+}
+
+
+def run_command(args, env):
+    """Run one CLI invocation; return (wall seconds, imports, top-level imports)
+
+    Import figures map module names to cumulative microseconds.
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", str(ENTRY_POINT), *args],
+        cwd=APP_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} exited with {result.returncode}")
+
+    imports = {}
+    top_level = {}
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package", nested
+        # imports are indented by two extra spaces per level
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports[name.strip()] = int(cumulative)
+        if not name[1:].startswith(" "):
+            top_level[name.strip()] = int(cumulative)
+    return elapsed, imports, top_level
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CLI startup time")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per command")
+    parser.add_argument(
+        "--max-ms", type=float, default=300.0, help="Budget for median wall time"
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    # Isolated HOME, so the user's database and config are never touched
+    home = tempfile.mkdtemp(prefix="startup_bench_")
+    env = dict(os.environ, HOME=home)
+
+    results = []
+    failed = False
+    for command in COMMANDS:
+        times = []
+        imports = top_level = {}
+        for _ in range(args.runs):
+            elapsed, imports, top_level = run_command(command, env)
+            times.append(elapsed)
+
+        heavy = sorted(name for name in imports if name.split(".")[0] in HEAVY_MODULES)
+        median_ms = statistics.median(times) * 1000
+        slowest = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:5]
+        ok = not heavy and median_ms <= args.max_ms
+        failed = failed or not ok
+        results.append(
+            {
+                "command": " ".join(command),
+                "median_ms": round(median_ms, 1),
+                "min_ms": round(min(times) * 1000, 1),
+                "import_ms": round(sum(top_level.values()) / 1000, 1),
+                "slowest_imports": {name: round(us / 1000, 1) for name, us in slowest},
+                "heavy_imports": heavy,
+                "ok": ok,
+            }
+        )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            status = "ok" if result["ok"] else "FAIL"
+            print(
+                f"{result['command']:<16} median {result['median_ms']:7.1f} ms  "
+                f"min {result['min_ms']:7.1f} ms  imports {result['import_ms']:7.1f} ms  "
+                f"[{status}]"
+            )
+            for name, ms in result["slowest_imports"].items():
+                print(f"    {name:<28} {ms:7.1f} ms")
+            if result["heavy_imports"]:
+                print(f"    heavy imports: {', '.join(result['heavy_imports'][:10])}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()